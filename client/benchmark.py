@@ -0,0 +1,167 @@
+"""
+Latency benchmark for the two translation paths of the Wednesday client:
+  - the local rule-based parser (command_parser.parse_command),
+  - a Gemini round trip with the same prompt get_gemini_instructions sends.
+
+The local path is timed over a corpus of explicit commands (and reports which
+of them it covers); the Gemini path is timed for a few of the same commands
+when GEMINI_API_KEY is set (in the environment or client/.env). Both parsers'
+outputs are compared so disagreements show up in the report. With --structured
+the Gemini path is also timed in structured output mode (compact prompt, JSON
+schema), and both report their token counts:
+    python benchmark.py --gemini-samples 5 --structured --output parser_bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from command_parser import parse_command
+
+CORPUS = [
+    "servo_3 to 90",
+    "pin 24 120 degrees for 1s",
+    "move servo_0 to 45 for 1.5 seconds",
+    "servo_3 to 90 then servo_4 to 10 for 500ms, then pin 17 at 30",
+    "set pin 23 to 45 deg over 250 ms",
+    "servo_5 to 180 then servo_5 to 0, repeat 3 times",
+    "rotate servo 4 to 60 twice",
+    "servo_1 to 20 and servo_2 to 40",
+    # Not explicit; these must fall back to Gemini
+    "wave the arm",
+    "open the gripper slowly",
+]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(values: list[float]) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) if ordered else float("nan"),
+        "p50": percentile(ordered, 50),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99),
+        "max": ordered[-1] if ordered else float("nan"),
+    }
+
+
+def bench_local(iterations: int) -> dict:
+    """Per-call parse latency over the corpus, in milliseconds."""
+    latencies_ms = []
+    for _ in range(iterations):
+        for text in CORPUS:
+            t0 = time.perf_counter()
+            parse_command(text)
+            latencies_ms.append((time.perf_counter() - t0) * 1000.0)
+    covered = [text for text in CORPUS if parse_command(text) is not None]
+    return {"iterations": iterations, "latency_ms": summarize(latencies_ms),
+            "covered": len(covered), "corpus": len(CORPUS),
+            "fallback": [text for text in CORPUS if text not in covered]}
+
+
+def _normalize(commands: list[dict]) -> list[tuple]:
+    return [(c.get("pin"), float(c.get("angle", -1)), c.get("duration_ms")) for c in commands]
+
+
+async def bench_gemini(samples: int, structured: bool = False) -> dict:
+    """Round-trip time and token counts of Gemini translations for the first explicit commands of the corpus."""
+    import google.generativeai as genai
+    from command_schema import SYSTEM_INSTRUCTION, build_structured_request, generation_config, validate_commands
+    from wednesday_core import GEMINI_MODEL_NAME, build_gemini_prompt
+
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    model = genai.GenerativeModel(GEMINI_MODEL_NAME, system_instruction=SYSTEM_INSTRUCTION if structured else None)
+    explicit = [text for text in CORPUS if parse_command(text) is not None][:samples]
+    latencies_ms = []
+    agreements = []
+    tokens = {"prompt": [], "cached": [], "output": []}
+    parse_failures = 0
+    for text in explicit:
+        t0 = time.perf_counter()
+        if structured:
+            response = await model.generate_content_async(build_structured_request(text), generation_config=generation_config())
+        else:
+            response = await model.generate_content_async(build_gemini_prompt(text))
+        latencies_ms.append((time.perf_counter() - t0) * 1000.0)
+        if response.usage_metadata is not None:
+            tokens["prompt"].append(response.usage_metadata.prompt_token_count)
+            tokens["cached"].append(response.usage_metadata.cached_content_token_count)
+            tokens["output"].append(response.usage_metadata.candidates_token_count)
+        raw = response.text.strip().removeprefix("```json").removesuffix("```").strip()
+        try:
+            gemini_commands = json.loads(raw)
+            if structured:
+                gemini_commands = validate_commands(gemini_commands)
+        except ValueError:
+            gemini_commands = None
+            parse_failures += 1
+        local_commands = parse_command(text)
+        # Gemini often fills in the default duration; compare pins and angles only when it does
+        same = gemini_commands is not None and (
+            _normalize(gemini_commands) == _normalize(local_commands)
+            or [c[:2] for c in _normalize(gemini_commands)] == [c[:2] for c in _normalize(local_commands)])
+        agreements.append({"text": text, "agrees": same, "gemini": gemini_commands, "local": local_commands})
+    return {"model": GEMINI_MODEL_NAME, "structured": structured, "latency_ms": summarize(latencies_ms),
+            "tokens": {name: summarize(values) for name, values in tokens.items()},
+            "parse_failures": parse_failures, "comparisons": agreements}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare local parser and Gemini translation latency.")
+    parser.add_argument("--iterations", type=int, default=2000, help="Passes over the corpus for the local parser")
+    parser.add_argument("--gemini-samples", type=int, default=3, help="Commands sent to Gemini (0 to skip)")
+    parser.add_argument("--structured", action="store_true", help="Also time Gemini in structured output mode")
+    parser.add_argument("--output", default="-", help="Path of the JSON report ('-' for stdout only)")
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "local": bench_local(args.iterations),
+    }
+    if args.gemini_samples > 0 and os.getenv("GEMINI_API_KEY"):
+        report["gemini"] = asyncio.run(bench_gemini(args.gemini_samples))
+        report["gemini_structured"] = asyncio.run(bench_gemini(args.gemini_samples, structured=True)) if args.structured else None
+    else:
+        report["gemini"] = report["gemini_structured"] = None
+        print("Gemini path skipped (no GEMINI_API_KEY or --gemini-samples 0).", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Report written to {args.output}")
+
+    local = report["local"]
+    print(f"Local parser: p50 {local['latency_ms']['p50']:.4f} ms, p99 {local['latency_ms']['p99']:.4f} ms, "
+          f"covers {local['covered']}/{local['corpus']} commands", file=sys.stderr)
+    if report["gemini"]:
+        for key in ("gemini", "gemini_structured"):
+            if report[key]:
+                latency, prompt_tokens = report[key]["latency_ms"], report[key]["tokens"]["prompt"]
+                print(f"{'Gemini (structured)' if report[key]['structured'] else 'Gemini'}: p50 {latency['p50']:.1f} ms, "
+                      f"max {latency['max']:.1f} ms, mean prompt {prompt_tokens['mean']:.0f} tokens, "
+                      f"{report[key]['parse_failures']} parse failure(s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
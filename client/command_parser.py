@@ -0,0 +1,125 @@
+"""
+Local rule-based parser for fully explicit servo commands, tried before Gemini.
+
+It understands a small grammar:
+    [move|set|turn|rotate|put|point] [the] (servo_N | servo N | pin N | gpio N)
+        [to|at] ANGLE [deg|degrees|°] [for|over DURATION (ms|s|seconds|...)]
+        [x N | N times | once | twice | thrice]
+Clauses are chained with "then", "and", "," or ";"; a final clause such as
+"repeat 3 times" or "twice" repeats the whole sequence.
+
+parse_command returns the same list[dict] format Gemini produces, or None when
+any part of the text is not covered by the grammar, so that only commands
+parsed with full confidence bypass Gemini.
+"""
+import re
+
+# Servo table shared with the Gemini prompt
+SERVO_PINS = {
+    "servo_0": 17,
+    "servo_1": 27,
+    "servo_2": 22,
+    "servo_3": 23,
+    "servo_4": 24,
+    "servo_5": 25,
+}
+MAX_ANGLE = 180
+MAX_REPEAT = 20
+MAX_COMMANDS = 100
+
+_NUMBER = r"\d+(?:\.\d+)?"
+_REPEAT = r"x\s*(?P<times_x>\d+)|(?P<times_n>\d+)\s*times|(?P<times_word>once|twice|thrice)"
+
+_CLAUSE_RE = re.compile(rf"""
+    ^(?:please\s+)?
+    (?:(?:move|set|turn|rotate|put|point)\s+)?
+    (?:the\s+)?
+    (?:servo[\s_#-]*(?P<servo>\d+)|(?:pin|gpio)[\s_#-]*(?P<pin>\d+))(?!\d)
+    (?:\s*(?:to|at|=|->)\s*|\s+) # Never empty, so "servo 30" is not read as servo 3 to 0
+    (?P<angle>{_NUMBER})(?![\d.])\s*(?:°|degrees?|deg)?
+    (?:\s*(?:for|over)\s*(?P<duration>{_NUMBER})(?![\d.])\s*(?P<unit>ms|milliseconds?|millis|s|secs?|seconds?))?
+    (?:\s+(?:{_REPEAT}))? # Whitespace first, so "to 902 times" is not read as 90 twice
+    $""", re.VERBOSE)
+
+_SEQUENCE_REPEAT_RE = re.compile(rf"^(?:repeat(?:\s+(?:it|that|this|all))?\s*)?(?:{_REPEAT})$")
+
+_SEPARATOR_RE = re.compile(r"\s*(?:[,;]\s*(?:and\s+)?(?:then\s+)?|\band\s+then\b|\bthen\b|\band\b)\s*")
+
+_WORD_TIMES = {"once": 1, "twice": 2, "thrice": 3}
+
+
+def _repeat_count(match: re.Match) -> int:
+    if match.group("times_x"):
+        return int(match.group("times_x"))
+    if match.group("times_n"):
+        return int(match.group("times_n"))
+    if match.group("times_word"):
+        return _WORD_TIMES[match.group("times_word")]
+    return 1
+
+
+def _number(text: str) -> int | float:
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+def _parse_clause(clause: str) -> list[dict] | None:
+    match = _CLAUSE_RE.match(clause)
+    if match is None:
+        return None
+
+    if match.group("servo") is not None:
+        pin = SERVO_PINS.get(f"servo_{int(match.group('servo'))}")
+    else:
+        pin = int(match.group("pin"))
+        if pin not in SERVO_PINS.values():
+            pin = None
+    if pin is None:
+        return None
+
+    command = {"pin": pin, "angle": _number(match.group("angle"))}
+    if command["angle"] > MAX_ANGLE: # Likely a typo; leave it to Gemini
+        return None
+    if match.group("duration") is not None:
+        duration = float(match.group("duration"))
+        if not match.group("unit").startswith("m"):
+            duration *= 1000.0 # Seconds
+        command["duration_ms"] = int(round(duration))
+
+    repeat = _repeat_count(match)
+    if not (1 <= repeat <= MAX_REPEAT):
+        return None
+    return [dict(command) for _ in range(repeat)]
+
+
+def parse_command(text: str) -> list[dict] | None:
+    """
+    Parses an explicit command like "servo_3 to 90 then pin 24 120 degrees for 1s".
+    Returns the servo commands, or None if the text is not entirely covered by the grammar.
+    """
+    text = text.strip().lower().rstrip(".!")
+    if not text:
+        return None
+    clauses = _SEPARATOR_RE.split(text)
+    if not all(clauses): # Leading/trailing or doubled separator, e.g. "servo_3 to 90 then"
+        return None
+
+    sequence_repeat = 1
+    repeat_match = _SEQUENCE_REPEAT_RE.match(clauses[-1])
+    if repeat_match is not None and len(clauses) > 1:
+        sequence_repeat = _repeat_count(repeat_match)
+        clauses.pop()
+
+    commands = []
+    for clause in clauses:
+        parsed = _parse_clause(clause)
+        if parsed is None:
+            return None
+        commands.extend(parsed)
+
+    if not commands or not (1 <= sequence_repeat <= MAX_REPEAT):
+        return None
+    commands = [dict(command) for _ in range(sequence_repeat) for command in commands]
+    if len(commands) > MAX_COMMANDS:
+        return None
+    return commands
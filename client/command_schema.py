@@ -0,0 +1,142 @@
+"""
+Typed servo command model for Gemini's structured output mode.
+
+In this mode the static part of the prompt (servo table, limits, output rules and
+examples) is sent as the model's system instruction, and each request carries only
+the stored macros and the user's command. Gemini is constrained to a JSON schema:
+a list of objects whose "pin" is one of the servo pins and, when the Pi has macros,
+whose "macro" is one of their names. The schema language cannot express numeric
+bounds, so the angle and duration limits are stated in the field descriptions and
+every command is fully checked by validate_commands before it is sent to the Pi.
+"""
+from command_parser import SERVO_PINS
+
+# Same limits as server.py
+PINS_WITH_ANGLE_CAP = {17, 27, 22}
+MAX_ANGLE_FOR_CAPPED_PINS = 45
+MIN_ANGLE = 0
+MAX_ANGLE = 180
+MAX_DURATION_MS = 60000
+MAX_MACRO_REPEAT = 100
+MAX_SPEED_SCALE = 10.0
+
+# Allowed angle range of every servo pin
+ANGLE_LIMITS = {pin: (MIN_ANGLE, MAX_ANGLE_FOR_CAPPED_PINS if pin in PINS_WITH_ANGLE_CAP else MAX_ANGLE)
+                for pin in SERVO_PINS.values()}
+
+_SERVO_TABLE = "\n".join(f"- {name}: pin {pin}, {ANGLE_LIMITS[pin][0]}-{ANGLE_LIMITS[pin][1]} degrees"
+                         for name, pin in SERVO_PINS.items())
+
+SYSTEM_INSTRUCTION = f"""You convert commands for a 6-servo robot arm into a JSON list of servo moves.
+Servos (name: BCM pin, angle range):
+{_SERVO_TABLE}
+Each move is {{"pin": "<pin>", "angle": <degrees>, "duration_ms": <hold time>}}; duration_ms is optional (default 500, at most {MAX_DURATION_MS}).
+Keep every angle within its servo's range. Moves run in list order.
+If a stored macro listed with the command matches the request, prefer {{"macro": "<name>"}}, optionally with "speed_scale" (>1 is faster, default 1) and "repeat" (default 1). Macros and moves can be mixed.
+Examples:
+"servo_0 to 30 and servo_3 to 90 for 1 second" -> [{{"pin": "17", "angle": 30}}, {{"pin": "23", "angle": 90, "duration_ms": 1000}}]
+"wave servo_3" -> [{{"pin": "23", "angle": 45, "duration_ms": 500}}, {{"pin": "23", "angle": 10, "duration_ms": 700}}, {{"pin": "23", "angle": 45, "duration_ms": 500}}]"""
+
+
+def build_structured_request(user_text_input: str, macros: list[dict] = ()) -> str:
+    """The per-request part of a structured translation: the Pi's stored macros and the command."""
+    lines = [f'Macro "{m["name"]}": {m.get("description") or "no description"} (pins {m.get("pins")}, about {m.get("duration_ms")} ms)'
+             for m in macros]
+    lines.append(f"Command: {user_text_input}")
+    return "\n".join(lines)
+
+
+def response_schema(macro_names: list[str] = ()) -> dict:
+    """JSON schema of Gemini's reply, in the subset accepted as a response_schema."""
+    properties = {
+        "pin": {"type": "string", "format": "enum", "enum": [str(pin) for pin in SERVO_PINS.values()],
+                "description": "BCM pin of the servo"},
+        "angle": {"type": "number", "description": "Target angle in degrees; 0-45 for pins 17, 27 and 22, 0-180 for the others"},
+        "duration_ms": {"type": "integer", "description": f"Hold time in milliseconds, 0-{MAX_DURATION_MS}"},
+    }
+    required = ["pin", "angle"]
+    if macro_names:
+        properties["macro"] = {"type": "string", "format": "enum", "enum": list(macro_names),
+                               "description": "Stored macro to play instead of a servo move"}
+        properties["speed_scale"] = {"type": "number", "description": f"Macro speed factor, above 0 and at most {MAX_SPEED_SCALE}"}
+        properties["repeat"] = {"type": "integer", "description": f"Times to play the macro, 1-{MAX_MACRO_REPEAT}"}
+        required = [] # Either a servo move or a macro
+    return {"type": "array", "items": {"type": "object", "properties": properties, "required": required}}
+
+
+def generation_config(macro_names: list[str] = ()) -> dict:
+    """Gemini generation settings for a structured translation."""
+    return {"response_mime_type": "application/json", "response_schema": response_schema(macro_names), "temperature": 0}
+
+
+def _number(value, field: str) -> int | float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{field} must be a number, got {value!r}.")
+    return int(value) if float(value).is_integer() else value
+
+
+def validate_command(item, macro_names: list[str] | None = None) -> dict:
+    """
+    Checks one translated command against the command model and returns it normalized
+    (integer pin, integral numbers as int, no empty fields). Raises ValueError.
+    macro_names, if given, are the macros stored on the Pi.
+    """
+    if not isinstance(item, dict):
+        raise ValueError(f"Command must be an object, got {item!r}.")
+    item = {key: value for key, value in item.items() if value is not None}
+
+    if "macro" in item:
+        unknown = set(item) - {"macro", "speed_scale", "repeat"}
+        if unknown:
+            raise ValueError(f"Macro command has unexpected fields {sorted(unknown)}.")
+        name = item["macro"]
+        if not isinstance(name, str) or (macro_names is not None and name not in macro_names):
+            raise ValueError(f"Unknown macro {name!r}.")
+        command = {"macro": name}
+        if "speed_scale" in item:
+            speed_scale = _number(item["speed_scale"], "speed_scale")
+            if not (0 < speed_scale <= MAX_SPEED_SCALE):
+                raise ValueError(f"speed_scale {speed_scale} must be above 0 and at most {MAX_SPEED_SCALE}.")
+            command["speed_scale"] = speed_scale
+        if "repeat" in item:
+            repeat = _number(item["repeat"], "repeat")
+            if not isinstance(repeat, int) or not (1 <= repeat <= MAX_MACRO_REPEAT):
+                raise ValueError(f"repeat {repeat} must be an integer from 1 to {MAX_MACRO_REPEAT}.")
+            command["repeat"] = repeat
+        return command
+
+    unknown = set(item) - {"pin", "angle", "duration_ms"}
+    if unknown:
+        raise ValueError(f"Servo command has unexpected fields {sorted(unknown)}.")
+    if "pin" not in item or "angle" not in item:
+        raise ValueError("Servo command needs pin and angle.")
+    try:
+        pin = int(item["pin"])
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid pin {item['pin']!r}.") from None
+    if pin not in ANGLE_LIMITS or isinstance(item["pin"], bool):
+        raise ValueError(f"Pin {item['pin']!r} is not a servo pin ({sorted(ANGLE_LIMITS)}).")
+    angle = _number(item["angle"], "angle")
+    low, high = ANGLE_LIMITS[pin]
+    if not (low <= angle <= high):
+        raise ValueError(f"Angle {angle} for pin {pin} is outside {low}-{high} degrees.")
+    command = {"pin": pin, "angle": angle}
+    if "duration_ms" in item:
+        duration_ms = _number(item["duration_ms"], "duration_ms")
+        if not (0 <= duration_ms <= MAX_DURATION_MS):
+            raise ValueError(f"duration_ms {duration_ms} must be between 0 and {MAX_DURATION_MS}.")
+        command["duration_ms"] = int(round(duration_ms))
+    return command
+
+
+def validate_commands(items, macro_names: list[str] | None = None) -> list[dict]:
+    """Validates a whole translated batch; the error names the offending command. Raises ValueError."""
+    if not isinstance(items, list) or not items:
+        raise ValueError("Translation must be a non-empty JSON list.")
+    commands = []
+    for index, item in enumerate(items):
+        try:
+            commands.append(validate_command(item, macro_names))
+        except ValueError as e:
+            raise ValueError(f"Command {index}: {e}") from None
+    return commands
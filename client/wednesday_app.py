@@ -1,20 +1,65 @@
+import time
+STARTUP_T0 = time.perf_counter() # Process start, near enough, for the startup timings
+
 import tkinter as tk
 from tkinter import ttk, scrolledtext, font, simpledialog, messagebox
 import asyncio
+import concurrent.futures
 import threading
 import json
-import time
-from dotenv import load_dotenv
+import queue
+import logging
+import logging.handlers
+from collections import OrderedDict, deque
 import os
-import anyio # Added import
+import re
 import socket # Added import
 
-# For MCP Client
-from mcp import ClientSession, types as mcp_types
-from mcp.client.streamable_http import streamablehttp_client # Added import
+# The MCP and Gemini SDKs take most of the client's import time, so they are imported
+# on first use: MCP when the first session is opened (see wednesday_core), Gemini on
+# the async loop after the window is shown (see WednesdayApp.init_gemini)
+
+from command_parser import parse_command
+from command_schema import SYSTEM_INSTRUCTION as STRUCTURED_SYSTEM_INSTRUCTION
+from command_schema import validate_command
+from wednesday_core import (GEMINI_MODEL_NAME, TRANSLATION_CACHE_PATH, GeminiUsage, MCPSessionManager, StageTimings,
+                            TranslationCache, command_segments, gemini_prompt, gemini_request, parse_gemini_output,
+                            validate_gemini_command)
+
+MACRO_REFRESH_S = 60 # How long the Pi's macro list is reused before list_macros is called again
+DEFAULT_DURATION_MS = 500 # Same as server.py
+
+# Fleet mode: per-target time allowed beyond a batch's nominal duration (and for a
+# clock sync), the minimum lead between sending a batch and its synchronized start,
+# and how clock offsets to the servers are measured
+FLEET_TIMEOUT_MARGIN_S = 30.0
+FLEET_START_LEAD_S = 0.2
+CLOCK_SYNC_SAMPLES = 5
+CLOCK_OFFSET_MAX_AGE_S = 300.0
 
-# For Gemini
-import google.generativeai as genai
+# Command queue: Gemini translations running ahead of the command on the Pi, and
+# how many finished commands stay listed in the backlog
+TRANSLATE_AHEAD = 2
+QUEUE_MAX_FINISHED = 50
+
+# Speculative translation: pause in typing before the text is sent to Gemini, shortest
+# text worth translating, and completed translations kept for submission
+SPECULATION_DEBOUNCE_MS = 700
+SPECULATION_MIN_CHARS = 6
+SPECULATION_MAX_RESULTS = 4
+
+# Startup warm-up (WEDNESDAY_WARMUP=1): time allowed for each of its steps
+WARMUP_TIMEOUT_S = 10.0
+
+# Log pipeline: the widget keeps at most LOG_MAX_LINES lines and is refreshed every
+# LOG_POLL_MS with up to LOG_BATCH_SIZE queued entries. Setting WEDNESDAY_LOG_FILE
+# also writes every entry (all levels) to a rotating file.
+LOG_LEVELS = {"DEBUG": logging.DEBUG, "INFO": logging.INFO, "WARNING": logging.WARNING, "ERROR": logging.ERROR}
+LOG_MAX_LINES = 2000
+LOG_POLL_MS = 50
+LOG_BATCH_SIZE = 500
+LOG_FILE_MAX_BYTES = 1_000_000
+LOG_FILE_BACKUPS = 3
 
 class AsyncTkinterLoop:
     """
@@ -36,27 +81,515 @@ class AsyncTkinterLoop:
         self._loop.call_soon_threadsafe(self._loop.stop)
         # self._thread.join() # Optional: wait for thread to finish
 
+class UILogPipeline:
+    """
+    Thread-safe sink for log lines, status updates and other widget changes.
+    Any thread may call log(), status() or call(); entries go through a queue and
+    are applied in batches on the Tk thread from a root.after poll. A bounded ring
+    buffer keeps the recent lines of every level so the display filter can be
+    changed afterwards; lines below the filter level are not rendered.
+    """
+    def __init__(self, root, log_area, apply_status, level: str = "INFO", log_file: str | None = None,
+                 max_lines: int = LOG_MAX_LINES, poll_ms: int = LOG_POLL_MS, batch_size: int = LOG_BATCH_SIZE):
+        self.root = root
+        self.log_area = log_area
+        self.apply_status = apply_status # Called on the Tk thread as apply_status(message, is_error, is_success)
+        self.level = LOG_LEVELS[level]
+        self.max_lines = max_lines
+        self.poll_ms = poll_ms
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        self._lines = deque(maxlen=max_lines) # (level number, formatted line)
+        self._closed = False
+
+        # File output: records are handed to a QueueListener thread, so disk I/O never blocks the UI
+        self._file_logger = None
+        self._file_listener = None
+        if log_file:
+            file_queue = queue.SimpleQueue()
+            handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=LOG_FILE_MAX_BYTES,
+                                                           backupCount=LOG_FILE_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+            self._file_listener = logging.handlers.QueueListener(file_queue, handler)
+            self._file_listener.start()
+            self._file_logger = logging.getLogger("wednesday.client")
+            self._file_logger.setLevel(logging.DEBUG)
+            self._file_logger.propagate = False
+            self._file_logger.addHandler(logging.handlers.QueueHandler(file_queue))
+
+        self.root.after(self.poll_ms, self._drain)
+
+    def log(self, message: str, level: str = "INFO") -> None:
+        levelno = LOG_LEVELS.get(level, logging.INFO)
+        timestamp = time.strftime("%H:%M:%S", time.localtime())
+        self._queue.put(("log", levelno, f"[{timestamp} {level}] {message}\n"))
+        if self._file_logger is not None:
+            self._file_logger.log(levelno, message)
+        if levelno >= self.level:
+            print(f"LOG: {message}") # Also print to console for easier debugging
+
+    def status(self, message: str, is_error: bool = False, is_success: bool = False) -> None:
+        self._queue.put(("status", message, is_error, is_success))
+
+    def call(self, fn, *args) -> None:
+        """Runs fn(*args) on the Tk thread, in order with the queued log and status entries."""
+        self._queue.put(("call", fn, args))
+
+    def set_level(self, level: str) -> None:
+        """Changes the display filter and re-renders the buffered lines. Tk thread only."""
+        self.level = LOG_LEVELS[level]
+        self.log_area.config(state=tk.NORMAL)
+        self.log_area.delete("1.0", tk.END)
+        self.log_area.insert(tk.END, "".join(line for levelno, line in self._lines if levelno >= self.level))
+        self._trim()
+        self.log_area.see(tk.END)
+        self.log_area.config(state=tk.DISABLED)
+
+    def _drain(self) -> None:
+        if self._closed:
+            return
+        pending = []
+        for _ in range(self.batch_size):
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            kind = entry[0]
+            if kind == "log":
+                self._lines.append(entry[1:])
+                if entry[1] >= self.level:
+                    pending.append(entry[2])
+                continue
+            if pending: # Keep widget changes in order with the lines logged before them
+                self._append(pending)
+                pending = []
+            try:
+                if kind == "status":
+                    self.apply_status(*entry[1:])
+                else:
+                    entry[1](*entry[2])
+            except Exception as e:
+                print(f"UI update failed: {e}")
+        if pending:
+            self._append(pending)
+        # Come back right away while a backlog remains, otherwise at the normal rate
+        self.root.after(1 if not self._queue.empty() else self.poll_ms, self._drain)
+
+    def _append(self, lines: list[str]) -> None:
+        self.log_area.config(state=tk.NORMAL)
+        self.log_area.insert(tk.END, "".join(lines))
+        self._trim()
+        self.log_area.see(tk.END)
+        self.log_area.config(state=tk.DISABLED)
+
+    def _trim(self) -> None:
+        line_count = int(self.log_area.index("end-1c").split(".")[0])
+        if line_count > self.max_lines:
+            self.log_area.delete("1.0", f"{line_count - self.max_lines + 1}.0")
+
+    def close(self) -> None:
+        self._closed = True
+        if self._file_listener is not None:
+            self._file_listener.stop()
+
+def parse_fleet_targets(text: str, default_port: int) -> list[tuple[str, int]]:
+    """Parses "ip[:port], ip[:port] ..." (comma or whitespace separated); raises ValueError."""
+    targets = []
+    for entry in text.replace(",", " ").split():
+        host, _, port = entry.partition(":")
+        if not host or (port and not port.isdigit()):
+            raise ValueError(f"Invalid fleet target '{entry}'. Use ip or ip:port.")
+        target = (host, int(port) if port else default_port)
+        if target not in targets:
+            targets.append(target)
+    return targets
+
+def _ms(value, default: float) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not (0 <= value < float("inf")):
+        return default
+    return value
+
+def nominal_duration_ms(commands: list[dict], macros: list[dict] = ()) -> float:
+    """
+    Upper bound of how long translated commands run on the Pi in any execution mode:
+    all hold times and start offsets added up, plus each macro's listed duration (see
+    list_macros) times its repeat count over its speed scale. Unlisted macros count as 0.
+    """
+    macro_durations = {m["name"]: _ms(m.get("duration_ms"), 0.0) for m in macros}
+    total = 0.0
+    for item in commands:
+        if "macro" in item:
+            speed_scale = _ms(item.get("speed_scale"), 1.0) or 1.0
+            total += macro_durations.get(item["macro"], 0.0) * _ms(item.get("repeat"), 1) / speed_scale
+        else:
+            total += _ms(item.get("duration_ms"), DEFAULT_DURATION_MS) + _ms(item.get("start_ms"), 0.0)
+    return total
+
+class FleetDispatcher:
+    """
+    Runs command batches on several servers concurrently over the pooled MCP sessions.
+    The clock offset to each server is measured NTP-style (get_server_time, best of
+    CLOCK_SYNC_SAMPLES round trips) and reused for CLOCK_OFFSET_MAX_AGE_S, so one
+    start time can be translated into every server's own clock and sent as start_at:
+    the arms then start together instead of in connection order.
+    """
+    def __init__(self, sessions: MCPSessionManager, log, timeout_margin_s: float = FLEET_TIMEOUT_MARGIN_S,
+                 start_lead_s: float = FLEET_START_LEAD_S):
+        self.sessions = sessions
+        self._log = log
+        self.timeout_margin_s = timeout_margin_s
+        self.start_lead_s = start_lead_s
+        self.clock_offsets: dict[tuple[str, int], tuple[float, float, float]] = {} # target -> (offset s, rtt s, measured at)
+
+    @staticmethod
+    def label(target: tuple[str, int]) -> str:
+        return f"{target[0]}:{target[1]}"
+
+    async def _call(self, target: tuple[str, int], name: str, arguments: dict):
+        result = await self.sessions.call_tool(target[0], target[1], name=name, arguments=arguments)
+        if getattr(result, "isError", False):
+            raise RuntimeError(result.content[0].text if result.content else f"{name} failed")
+        return json.loads(result.content[0].text)
+
+    async def sync_clock(self, target: tuple[str, int]) -> tuple[float, float]:
+        """Measures (server clock - local clock, round trip) in seconds, keeping the sample with the shortest round trip."""
+        best = None
+        for _ in range(CLOCK_SYNC_SAMPLES):
+            t0 = time.time()
+            server_time = (await self._call(target, "get_server_time", {}))["time"]
+            t1 = time.time()
+            if best is None or t1 - t0 < best[1]:
+                best = (server_time - (t0 + t1) / 2, t1 - t0)
+        self.clock_offsets[target] = (best[0], best[1], time.monotonic())
+        self._log(f"Fleet: clock offset to {self.label(target)} is {best[0] * 1000:+.1f} ms (round trip {best[1] * 1000:.1f} ms).")
+        return best
+
+    async def run(self, targets: list[tuple[str, int]], commands, mode: str = "sequential",
+                  macros: list[dict] = ()) -> dict[str, dict]:
+        """
+        Sends commands (one list for all targets, or a {target: list} dict) to every
+        target at once and waits for all of them. Each target has until its batch's
+        nominal duration (see nominal_duration_ms; macros are the Pi's stored macros)
+        plus timeout_margin_s after the synchronized start. Returns {"ip:port": {"status": "ok" | "error" | "timeout", ...}} per target.
+        """
+        batches = commands if isinstance(commands, dict) else {target: commands for target in targets}
+        report: dict[str, dict] = {}
+
+        now = time.monotonic()
+        stale = [t for t in batches if t not in self.clock_offsets or now - self.clock_offsets[t][2] > CLOCK_OFFSET_MAX_AGE_S]
+        synced = await asyncio.gather(*(asyncio.wait_for(self.sync_clock(t), self.timeout_margin_s) for t in stale), return_exceptions=True)
+        for target, outcome in zip(stale, synced):
+            if isinstance(outcome, BaseException):
+                report[self.label(target)] = {"status": "error", "message": f"Clock sync failed: {type(outcome).__name__} {outcome}"}
+        ready = [t for t in batches if self.label(t) not in report]
+        if not ready:
+            return report
+
+        # Far enough ahead for the slowest target's request to arrive before the start
+        max_rtt = max(self.clock_offsets[t][1] for t in ready)
+        start_local = time.time() + self.start_lead_s + 2 * max_rtt
+        timeouts = [start_local - time.time() + nominal_duration_ms(batches[t], macros) / 1000.0 + self.timeout_margin_s
+                    for t in ready]
+        outcomes = await asyncio.gather(*(asyncio.wait_for(self._run_target(t, batches[t], mode, start_local), timeout)
+                                          for t, timeout in zip(ready, timeouts)), return_exceptions=True)
+        for target, timeout, outcome in zip(ready, timeouts, outcomes):
+            if isinstance(outcome, asyncio.TimeoutError):
+                report[self.label(target)] = {"status": "timeout", "message": f"No result within {timeout:.0f}s."}
+            elif isinstance(outcome, BaseException):
+                report[self.label(target)] = {"status": "error", "message": f"{type(outcome).__name__}: {outcome}"}
+            else:
+                report[self.label(target)] = outcome
+            if report[self.label(target)]["status"] != "ok":
+                self.clock_offsets.pop(target, None) # Re-measure after a failure (reconnect, reboot)
+        return {self.label(t): report[self.label(t)] for t in batches}
+
+    async def _run_target(self, target: tuple[str, int], commands: list[dict], mode: str, start_local: float) -> dict:
+        offset, rtt, _ = self.clock_offsets[target]
+        t0 = time.perf_counter()
+        responses = []
+        start_lag_ms = None
+        for i, (tool_name, arguments) in enumerate(command_segments(commands)):
+            arguments = dict(arguments)
+            if tool_name == "execute_servo_commands":
+                arguments["mode"] = mode
+            if i == 0: # Later segments follow the first one on this target
+                arguments["start_at"] = start_local + offset
+            response = await self._call(target, tool_name, arguments)
+            responses.append(response)
+            if i == 0:
+                first = response[0] if isinstance(response, list) and response else response
+                start_lag_ms = first.get("start_lag_ms") if isinstance(first, dict) else None
+        statuses = [r for response in responses for r in (response if isinstance(response, list) else [response])]
+        failed = [r for r in statuses if r.get("status") != "ok"]
+        return {"status": "error" if failed else "ok", "responses": responses,
+                "message": f"{len(failed)} failed" if failed else f"{len(statuses)} ok",
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 1),
+                "clock_offset_ms": round(offset * 1000.0, 2), "rtt_ms": round(rtt * 1000.0, 2),
+                "start_lag_ms": start_lag_ms}
+
+class IncrementalJSONArrayParser:
+    """
+    Incremental parser for a streamed JSON array of objects. feed() takes text chunks
+    as they arrive and returns the objects completed by that chunk, so each command
+    can be dispatched before the rest of the array has been generated. Text before
+    the opening '[' (such as a Markdown fence) and after the closing ']' is ignored.
+    """
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0 # Scan position in _buffer
+        self._object_start = None # Start of the object being scanned, if any
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.started = False
+        self.finished = False
+
+    def feed(self, text: str) -> list[dict]:
+        buf = self._buffer + text
+        objects = []
+        i = self._pos
+        while i < len(buf) and not self.finished:
+            ch = buf[i]
+            if not self.started:
+                self.started = ch == "["
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                if self._depth == 0:
+                    raise ValueError("Gemini response list contains a non-object item.")
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    objects.append(json.loads(buf[self._object_start:i + 1]))
+                    self._object_start = None
+            elif self._depth == 0:
+                if ch == "]":
+                    self.finished = True
+                elif not (ch.isspace() or ch == ","):
+                    raise ValueError(f"Unexpected character {ch!r} in Gemini JSON list response.")
+            i += 1
+
+        # Keep only the unfinished object (if any) so the buffer stays small
+        cut = self._object_start if self._object_start is not None else i
+        self._buffer = buf[cut:]
+        self._pos = i - cut
+        if self._object_start is not None:
+            self._object_start = 0
+        return objects
+
+    def finish(self) -> None:
+        """Raises ValueError unless a complete JSON list has been seen."""
+        if not self.started:
+            raise ValueError("Gemini response is not a JSON list.")
+        if not self.finished:
+            raise ValueError("Gemini response ended before the JSON list was closed.")
+
+class QueuedCommand:
+    """A submitted command with the options captured at submit time and its progress through the queue."""
+    def __init__(self, item_id: int, text: str, options: dict, stream: bool = False):
+        self.item_id = item_id
+        self.text = text
+        self.options = options # ip, port, fleet_targets, local_parser, bypass_cache
+        self.stream = stream # Translated by streaming Gemini straight to the Pi when it runs
+        self.state = "queued" # queued, translating, ready, executing, done, failed, cancelled
+        self.path = None # How it was translated: local, cache, gemini or stream
+        self.commands: list[dict] | None = None
+        self.message = ""
+        self.timings = StageTimings()
+        self.submitted_at = time.monotonic()
+        self.translation: asyncio.Task | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+class CommandQueue:
+    """
+    Backlog of submitted commands. Up to translate_ahead commands are translated
+    concurrently while the Pi executes the current one, and commands are executed
+    strictly in submission order, so a backlog runs at the pace of the arm instead of
+    translation plus motion. Lives on the async loop: call every method there.
+    translate(item) returns the commands or None; execute(item) returns whether it
+    succeeded; on_change(item) is called on every state change.
+    """
+    def __init__(self, translate, execute, on_change, translate_ahead: int = TRANSLATE_AHEAD):
+        self._translate = translate
+        self._execute = execute
+        self._on_change = on_change
+        self._semaphore = asyncio.Semaphore(translate_ahead)
+        self.pending: deque[QueuedCommand] = deque() # Not yet executed, in submission order
+        self._runner: asyncio.Task | None = None
+        self._next_id = 1
+
+    def submit(self, text: str, options: dict, stream: bool = False) -> QueuedCommand:
+        item = QueuedCommand(self._next_id, text, options, stream)
+        self._next_id += 1
+        self.pending.append(item)
+        self._on_change(item)
+        if not stream:
+            item.translation = asyncio.create_task(self._translate_item(item))
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+        return item
+
+    def cancel(self, item_id: int) -> str:
+        """Cancels a command that has not started executing; returns a message for the status bar."""
+        item = next((item for item in self.pending if item.item_id == item_id), None)
+        if item is None or item.finished:
+            return f"Command #{item_id} has already finished."
+        if item.state == "executing":
+            return f"Command #{item_id} is already executing and can no longer be cancelled."
+        if item.translation is not None:
+            item.translation.cancel()
+        self._set(item, "cancelled", "Cancelled before execution.")
+        return f"Command #{item_id} cancelled."
+
+    def _set(self, item: QueuedCommand, state: str, message: str | None = None) -> None:
+        item.state = state
+        if message is not None:
+            item.message = message
+        self._on_change(item)
+
+    async def _translate_item(self, item: QueuedCommand) -> None:
+        async with self._semaphore:
+            if item.state == "cancelled":
+                return
+            self._set(item, "translating")
+            try:
+                item.commands = await self._translate(item)
+            except Exception as e:
+                self._set(item, "failed", f"Translation error: {e}")
+                return
+        if item.state != "cancelled":
+            if item.commands is None:
+                self._set(item, "failed", item.message or "Translation failed.")
+            else:
+                self._set(item, "ready", f"{len(item.commands)} command(s) via {item.path}")
+
+    async def _run(self) -> None:
+        while self.pending:
+            item = self.pending[0]
+            if item.translation is not None:
+                await asyncio.wait({item.translation}) # Does not raise if the translation was cancelled
+            if not item.finished:
+                self._set(item, "executing")
+                try:
+                    ok = await self._execute(item)
+                except Exception as e:
+                    ok = False
+                    item.message = f"Unexpected error: {e}"
+                self._set(item, "done" if ok else "failed")
+            self.pending.popleft()
+
+class Speculator:
+    """
+    Translates the command being typed before it is submitted. Only the latest text is
+    translated: a request still running when the text changes again is cancelled.
+    Completed translations are kept by exact text together with the prompt they were
+    made with, and are used only if both match at submit time. Every request that is
+    not used (superseded, failed or never submitted) is counted as wasted, so the
+    saved latency can be weighed against the Gemini quota. Lives on the async loop.
+    translate(text) returns the commands or None; on_change() is called when the stats change.
+    """
+    def __init__(self, translate, on_change, max_results: int = SPECULATION_MAX_RESULTS):
+        self._translate = translate
+        self._on_change = on_change
+        self._max_results = max_results
+        self._task: asyncio.Task | None = None
+        self._task_key: tuple[str, str] | None = None
+        self._results: OrderedDict[str, tuple[str, list[dict]]] = OrderedDict() # text -> (prompt, commands)
+        self.stats = {"requests": 0, "hits": 0, "superseded": 0, "failed": 0, "unused": 0}
+
+    @property
+    def wasted(self) -> int:
+        return self.stats["superseded"] + self.stats["failed"] + self.stats["unused"]
+
+    def summary(self) -> str:
+        return f"{self.stats['hits']} hits, {self.wasted} wasted of {self.stats['requests']} Gemini calls"
+
+    def speculate(self, text: str, prompt: str) -> None:
+        """Starts translating text, cancelling the translation of earlier text."""
+        if self._results.get(text, (None,))[0] == prompt or self._task_key == (text, prompt):
+            return
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            self.stats["superseded"] += 1
+        self.stats["requests"] += 1
+        self._task_key = (text, prompt)
+        self._task = asyncio.create_task(self._run(text, prompt))
+        self._on_change()
+
+    async def _run(self, text: str, prompt: str) -> None:
+        try:
+            commands = await self._translate(text)
+        except asyncio.CancelledError:
+            return
+        except Exception:
+            commands = None
+        finally:
+            if self._task_key == (text, prompt):
+                self._task_key = None
+        if commands is None:
+            self.stats["failed"] += 1
+        else:
+            if self._results.pop(text, None) is not None:
+                self.stats["unused"] += 1
+            self._results[text] = (prompt, commands)
+            while len(self._results) > self._max_results:
+                self._results.popitem(last=False)
+                self.stats["unused"] += 1
+        self._on_change()
+
+    async def take(self, text: str, prompt: str) -> list[dict] | None:
+        """Returns the speculative translation of text, waiting for it if it is still running."""
+        if self._task_key == (text, prompt):
+            await asyncio.wait({self._task}) # Does not cancel the translation if the caller is cancelled
+        entry = self._results.pop(text, None)
+        if entry is None:
+            return None
+        if entry[0] != prompt: # The prompt changed since, e.g. new macros on the Pi
+            self.stats["unused"] += 1
+            self._on_change()
+            return None
+        self.stats["hits"] += 1
+        self._on_change()
+        return entry[1]
+
 class WednesdayApp:
-    def __init__(self, root, async_loop_manager):
+    def __init__(self, root, async_loop_manager, startup_timings: StageTimings | None = None):
         self.root = root
         self.async_loop_manager = async_loop_manager
+        self.startup_timings = startup_timings or StageTimings()
+        ui_start = time.perf_counter()
         self.root.title("Wednesday - MCP Client")
-        self.root.geometry("750x650") # Increased size
+        self.root.geometry("750x800") # Increased size
+
+        self.gemini_model = None
+        self.gemini_structured_model = None # Same model with the static prompt as system instruction (see command_schema)
+        self.structured_output = False
+        self.gemini_usage = GeminiUsage()
+        self.translation_cache = TranslationCache(TRANSLATION_CACHE_PATH)
 
-        # Load Gemini API Key
+        # Load Gemini API Key; the models are created on the async loop once the window is shown (see init_gemini)
+        from dotenv import load_dotenv
         load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
+        self._gemini_ready = concurrent.futures.Future() # Done once init_gemini has run (successfully or not)
         if not self.gemini_api_key:
-            messagebox.showwarning("API Key Missing", "GEMINI_API_KEY not found in .env file. Gemini features will not work.")
-        else:
-            try:
-                genai.configure(api_key=self.gemini_api_key)
-                self.gemini_model = genai.GenerativeModel('gemini-2.5-flash-preview-04-17') # or 'gemini-pro'
-                print("Gemini Model Initialized.")
-            except Exception as e:
-                messagebox.showerror("Gemini Init Error", f"Failed to initialize Gemini: {e}")
-                self.gemini_model = None
-
+            self._gemini_ready.set_result(None)
+            self.root.after_idle(messagebox.showwarning, "API Key Missing", "GEMINI_API_KEY not found in .env file. Gemini features will not work.")
+        # Optional warm-up of the Pi connection and Gemini right after startup (see warm_up)
+        self.warm_up_enabled = os.getenv("WEDNESDAY_WARMUP", "0").strip().lower() in ("1", "true", "yes", "on")
 
         self.bg_color = "#1E1E1E"
         self.fg_color = "#00A0D2" # Light blue
@@ -96,6 +629,13 @@ class WednesdayApp:
         self.rpi_port_entry = ttk.Entry(config_frame, textvariable=self.rpi_port_var, width=8, font=("Segoe UI", 10))
         self.rpi_port_entry.grid(row=0, column=3, padx=5, pady=5, sticky="w")
 
+        # Fleet mode: the same commands go to this Pi and the arms listed here, with a synchronized start
+        ttk.Label(config_frame, text="More arms:", style="TLabel").grid(row=1, column=0, padx=(0,5), pady=5, sticky="w")
+        self.fleet_targets_var = tk.StringVar(value="") # "ip[:port], ..."; the port defaults to the one above
+        ttk.Entry(config_frame, textvariable=self.fleet_targets_var, font=("Segoe UI", 10)).grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+        self.fleet_mode_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(config_frame, text="Fleet mode", variable=self.fleet_mode_var).grid(row=1, column=2, columnspan=2, padx=(10,5), pady=5, sticky="w")
+
 
         # Main Input Area
         main_input_label = ttk.Label(root, text="Enter your command for Wednesday:", style="Accent.TLabel")
@@ -108,11 +648,56 @@ class WednesdayApp:
                                                    insertbackground=self.fg_color,
                                                    relief=tk.FLAT, borderwidth=2, bd=2, highlightthickness=1, highlightbackground=self.fg_color)
         self.text_area.pack(pady=5, padx=20, fill="both", expand=True)
+        self.text_area.bind("<KeyRelease>", self.on_text_changed)
+        self._speculation_after_id = None
 
         # Submit Button
         self.submit_button = ttk.Button(root, text="Send Command to Pi", command=self.on_submit_action_async, style="TButton")
         self.submit_button.pack(pady=(5,10))
 
+        # Translation options: cache controls and streaming dispatch
+        options_frame = ttk.Frame(root, style="TFrame")
+        options_frame.pack(fill="x", padx=20, pady=(0,5))
+        self.bypass_cache_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Bypass translation cache", variable=self.bypass_cache_var).pack(side="left")
+        self.stream_dispatch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Stream Gemini output to Pi", variable=self.stream_dispatch_var).pack(side="left", padx=(10,0))
+        self.local_parser_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(options_frame, text="Parse explicit commands locally", variable=self.local_parser_var).pack(side="left", padx=(10,0))
+        ttk.Button(options_frame, text="Forget Cached Translation", command=self.on_forget_cached_translation, style="TButton").pack(side="right")
+
+        # Gemini options: schema-constrained output, and speculative translation while the command is typed
+        gemini_frame = ttk.Frame(root, style="TFrame")
+        gemini_frame.pack(fill="x", padx=20, pady=(0,5))
+        self.structured_output_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(gemini_frame, text="Structured Gemini output", variable=self.structured_output_var,
+                        command=self.on_structured_output_toggled).pack(side="left")
+        self.speculate_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(gemini_frame, text="Pre-translate while typing (uses Gemini quota)", variable=self.speculate_var).pack(side="left", padx=(10,0))
+        self.speculation_stats_label = ttk.Label(gemini_frame, text="", style="TLabel")
+        self.speculation_stats_label.pack(side="right")
+
+        # Command queue: submitted commands with their state; later ones are translated while the Pi runs earlier ones
+        queue_frame = ttk.Frame(root, style="TFrame")
+        queue_frame.pack(fill="x", padx=20, pady=(0,5))
+        queue_header = ttk.Frame(queue_frame, style="TFrame")
+        queue_header.pack(fill="x")
+        ttk.Label(queue_header, text="Command Queue:", style="Accent.TLabel").pack(side="left")
+        ttk.Button(queue_header, text="Clear Finished", command=self.on_clear_finished, style="TButton").pack(side="right")
+        ttk.Button(queue_header, text="Cancel Selected", command=self.on_cancel_selected, style="TButton").pack(side="right", padx=(0,5))
+        self.queue_view = ttk.Treeview(queue_frame, columns=("command", "state", "details"), height=5, selectmode="extended")
+        self.queue_view.heading("#0", text="#")
+        self.queue_view.heading("command", text="Command")
+        self.queue_view.heading("state", text="State")
+        self.queue_view.heading("details", text="Details")
+        self.queue_view.column("#0", width=40, stretch=False)
+        self.queue_view.column("command", width=300)
+        self.queue_view.column("state", width=90, stretch=False)
+        self.queue_view.column("details", width=260)
+        for state, colour in (("failed", self.status_error_fg), ("done", self.status_success_fg), ("cancelled", "#888888")):
+            self.queue_view.tag_configure(state, foreground=colour)
+        self.queue_view.pack(fill="x", pady=(2,0))
+
         # Status and Log Area Frame
         status_log_frame = ttk.Frame(root, style="TFrame")
         status_log_frame.pack(fill="both", expand=True, padx=20, pady=(0,10))
@@ -121,28 +706,122 @@ class WednesdayApp:
         self.status_label = ttk.Label(status_log_frame, text="Ready. Enter command and Raspberry Pi IP.", style="TLabel", wraplength=700)
         self.status_label.pack(pady=(0,5), anchor="w")
 
-        # Log Text Area (read-only)
-        log_label = ttk.Label(status_log_frame, text="Log / Server Response:", style="Accent.TLabel")
-        log_label.pack(pady=(5,2), anchor="w")
+        # Per-stage timing breakdown of the last command
+        self.timings_label = ttk.Label(status_log_frame, text="Last command timings: -", style="TLabel", wraplength=700)
+        self.timings_label.pack(pady=(0,5), anchor="w")
+
+        # Log Text Area (read-only), with a level filter for what is rendered
+        log_header = ttk.Frame(status_log_frame, style="TFrame")
+        log_header.pack(fill="x", pady=(5,2))
+        log_label = ttk.Label(log_header, text="Log / Server Response:", style="Accent.TLabel")
+        log_label.pack(side="left")
+        self.log_level_var = tk.StringVar(value=os.getenv("WEDNESDAY_LOG_LEVEL", "INFO").upper())
+        if self.log_level_var.get() not in LOG_LEVELS:
+            self.log_level_var.set("INFO")
+        log_level_box = ttk.Combobox(log_header, textvariable=self.log_level_var, values=list(LOG_LEVELS),
+                                     state="readonly", width=9)
+        log_level_box.pack(side="right")
+        log_level_box.bind("<<ComboboxSelected>>", lambda _event: self.log_pipeline.set_level(self.log_level_var.get()))
+        ttk.Label(log_header, text="Show:", style="TLabel").pack(side="right", padx=(0,5))
         self.log_area = scrolledtext.ScrolledText(root, wrap=tk.WORD, height=10,
                                                  font=("Courier New", 10), # Monospaced for logs
                                                  bg="#252526", fg="#D4D4D4", # Slightly different log bg
                                                  relief=tk.FLAT, borderwidth=1, state=tk.DISABLED)
         self.log_area.pack(pady=5, padx=20, fill="both", expand=True)
 
+        # All log and status output goes through this queue so coroutines on the async loop never touch Tk directly
+        self.log_pipeline = UILogPipeline(root, self.log_area, self._apply_status,
+                                          level=self.log_level_var.get(),
+                                          log_file=os.getenv("WEDNESDAY_LOG_FILE"))
+
+        # Long-lived MCP sessions, reused across submits (see MCPSessionManager)
+        self.mcp_sessions = MCPSessionManager(log=self.log_message)
+
+        self.fleet = FleetDispatcher(self.mcp_sessions, log=self.log_message)
+
+        # Submitted commands; translation runs ahead of execution on the Pi (see CommandQueue)
+        self.command_queue = CommandQueue(self.translate_command, self.execute_command, self._on_queue_change)
+        self.speculator = Speculator(lambda text: self.get_gemini_instructions(text, quiet=True), self._on_speculation_change)
+
+        # Macros stored on the Pi, listed in the Gemini prompt (see refresh_macros)
+        self.macros: list[dict] = []
+        self._macros_source = None # (ip, port, monotonic time) of the last list_macros call
 
         print("App Initialized with Async Loop and MCP/Gemini components.")
         self.log_message("Application initialized. Configure RPi IP and enter command.")
+        self.startup_timings.add("ui", (time.perf_counter() - ui_start) * 1000.0)
+        self.root.after_idle(self._on_window_shown)
+
+    def _on_window_shown(self):
+        # First idle moment of the Tk loop: the window has been drawn, and the slow startup work can begin
+        self.startup_timings.add("window_shown_at", self.startup_timings.total_ms())
+        rpi_ip = self.rpi_ip_var.get().strip()
+        rpi_port_str = self.rpi_port_var.get().strip()
+        warm_up_target = (rpi_ip, int(rpi_port_str)) if self.warm_up_enabled and rpi_ip and rpi_port_str.isdigit() else None
+        self.async_loop_manager.run_coroutine(self._finish_startup(warm_up_target))
+
+    async def _finish_startup(self, warm_up_target: tuple[str, int] | None) -> None:
+        if not self._gemini_ready.done():
+            await self.init_gemini()
+        self.log_message(f"Startup timings (ms): {json.dumps(self.startup_timings.as_dict())}")
+        if warm_up_target is not None:
+            await self.warm_up(*warm_up_target)
+
+    async def init_gemini(self) -> None:
+        """Imports the Gemini SDK and creates the models in a worker thread, keeping both loops responsive."""
+        def create_models():
+            import google.generativeai as genai
+            genai.configure(api_key=self.gemini_api_key)
+            return (genai.GenerativeModel(GEMINI_MODEL_NAME),
+                    genai.GenerativeModel(GEMINI_MODEL_NAME, system_instruction=STRUCTURED_SYSTEM_INSTRUCTION))
+        try:
+            with self.startup_timings.span("gemini_init"):
+                self.gemini_model, self.gemini_structured_model = await asyncio.to_thread(create_models)
+            self.log_message("Gemini model initialized.")
+        except Exception as e:
+            self.log_message(f"Failed to initialize Gemini: {e}", level="ERROR")
+            self.log_pipeline.call(messagebox.showerror, "Gemini Init Error", f"Failed to initialize Gemini: {e}")
+        finally:
+            self._gemini_ready.set_result(None)
+
+    async def wait_for_gemini(self) -> None:
+        """Waits until Gemini initialization has finished; gemini_model is still None if it failed."""
+        if not self._gemini_ready.done():
+            await asyncio.wrap_future(self._gemini_ready)
+
+    async def warm_up(self, rpi_ip: str, port: int) -> None:
+        """
+        Pays the cold-start costs before the first command: resolves the Pi's address,
+        opens the pooled MCP session (listing the macros on it) and makes a token-count
+        call to Gemini, which sets up its connection without generating anything.
+        """
+        timings = StageTimings()
+        self.log_message(f"Warming up connections to {rpi_ip}:{port} and Gemini...")
+        try:
+            with timings.span("resolve"):
+                await asyncio.wait_for(asyncio.get_running_loop().getaddrinfo(rpi_ip, port, type=socket.SOCK_STREAM), WARMUP_TIMEOUT_S)
+            with timings.span("mcp"):
+                await asyncio.wait_for(self.refresh_macros(rpi_ip, port), WARMUP_TIMEOUT_S)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.log_message(f"Warm-up: could not reach {rpi_ip}:{port}: {e!r}", level="WARNING")
+        await self.wait_for_gemini()
+        if self.gemini_model:
+            try:
+                with timings.span("gemini"):
+                    await asyncio.wait_for(self.gemini_model.count_tokens_async("ping"), WARMUP_TIMEOUT_S)
+            except Exception as e:
+                self.log_message(f"Warm-up: Gemini call failed: {e!r}", level="WARNING")
+        self.log_message(f"Warm-up timings (ms): {json.dumps(timings.as_dict())}")
 
     def log_message(self, message, level="INFO"):
-        self.log_area.config(state=tk.NORMAL)
-        timestamp = time.strftime("%H:%M:%S", time.localtime())
-        self.log_area.insert(tk.END, f"[{timestamp} {level}] {message}\n")
-        self.log_area.see(tk.END)
-        self.log_area.config(state=tk.DISABLED)
-        print(f"LOG: {message}") # Also print to console for easier debugging
+        """Safe to call from any thread; the line is rendered on the next log pipeline drain."""
+        self.log_pipeline.log(message, level)
 
     def update_status(self, message, is_error=False, is_success=False):
+        """Safe to call from any thread; see UILogPipeline."""
+        self.log_pipeline.status(message, is_error, is_success)
+
+    def _apply_status(self, message, is_error=False, is_success=False):
         self.status_label.config(text=message)
         if is_error:
             self.status_label.config(foreground=self.status_error_fg)
@@ -150,35 +829,24 @@ class WednesdayApp:
             self.status_label.config(foreground=self.status_success_fg)
         else:
             self.status_label.config(foreground=self.label_fg) # Default status color
-        self.root.update_idletasks()
-
-    def on_submit_action_async(self):
-        """Wraps the async submit action to be called from Tkinter button."""
-        # Disable button to prevent multiple submissions
-        self.submit_button.config(state=tk.DISABLED, text="Processing...")
-        self.update_status("Processing command...")
-        self.log_message("Submit button clicked.")
-
-        # Schedule the async task
-        future = self.async_loop_manager.run_coroutine(self.submit_text_action_async())
-        
-        # Define a callback to re-enable the button and handle results/exceptions
-        def on_done_callback(fut):
-            try:
-                # If the coroutine returned something, it would be in fut.result()
-                fut.result() 
-            except Exception as e:
-                self.update_status(f"An error occurred: {e}", is_error=True)
-                self.log_message(f"Error in async submission: {e}", level="ERROR")
-            finally:
-                self.submit_button.config(state=tk.NORMAL, text="Send Command to Pi")
-                if not self.status_label.cget("text").startswith("Error:") and not self.status_label.cget("text").startswith("Success:"):
-                     self.update_status("Ready for next command.")
 
+    def _translation_cache_key(self, user_command: str) -> str:
+        # The template is rendered with a fixed placeholder so only prompt edits change the hash
+        return TranslationCache.make_key(user_command, self._get_gemini_prompt("{user_command}"), GEMINI_MODEL_NAME)
 
-        future.add_done_callback(on_done_callback)
+    def on_forget_cached_translation(self):
+        user_command = self.text_area.get("1.0", tk.END).strip()
+        if not user_command:
+            self.update_status("Enter the command whose cached translation should be forgotten.", is_error=True)
+            return
+        if self.translation_cache.invalidate(self._translation_cache_key(user_command)):
+            self.update_status("Cached translation removed.")
+            self.log_message(f"Translation cache: removed entry for '{user_command}'.")
+        else:
+            self.update_status("No cached translation for this command.")
 
-    async def submit_text_action_async(self):
+    def on_submit_action_async(self):
+        """Validates the command and server settings and appends the command to the queue."""
         user_command = self.text_area.get("1.0", tk.END).strip()
         rpi_ip = self.rpi_ip_var.get().strip()
         rpi_port_str = self.rpi_port_var.get().strip()
@@ -198,168 +866,474 @@ class WednesdayApp:
             self.log_message("Validation Error: User command missing.", level="ERROR")
             return
 
-        self.log_message(f"User command: '{user_command}' for RPi at {rpi_ip}:{rpi_port}")
+        fleet_targets = None
+        if self.fleet_mode_var.get():
+            try:
+                fleet_targets = parse_fleet_targets(f"{rpi_ip}:{rpi_port} {self.fleet_targets_var.get()}", rpi_port)
+            except ValueError as e:
+                self.update_status(str(e), is_error=True)
+                self.log_message(f"Validation Error: {e}", level="ERROR")
+                return
 
-        if not self.gemini_model:
-            self.update_status("Gemini model not initialized. Check API Key.", is_error=True)
-            self.log_message("Gemini Error: Model not initialized.", level="ERROR")
+        # The options are captured now, so later edits in the UI do not affect queued commands
+        options = {"ip": rpi_ip, "port": rpi_port, "fleet_targets": fleet_targets,
+                   "local_parser": self.local_parser_var.get(), "bypass_cache": self.bypass_cache_var.get()}
+        stream = self.stream_dispatch_var.get()
+        if stream and fleet_targets:
+            self.log_message("Streaming dispatch is not used in fleet mode; waiting for the full translation.", level="WARNING")
+            stream = False
+        self.text_area.delete("1.0", tk.END)
+
+        async def enqueue():
+            # Streaming only pays off when nothing is ahead; queued commands are translated ahead instead
+            item = self.command_queue.submit(user_command, options, stream=stream and not self.command_queue.pending)
+            ahead = len(self.command_queue.pending) - 1
+            self.update_status(f"Command #{item.item_id} queued" + (f" ({ahead} ahead)." if ahead else "."))
+        self.async_loop_manager.run_coroutine(enqueue())
+
+    def on_cancel_selected(self):
+        item_ids = [int(iid) for iid in self.queue_view.selection()]
+        if not item_ids:
+            self.update_status("Select queued commands to cancel.", is_error=True)
             return
+        async def cancel():
+            for item_id in item_ids:
+                message = self.command_queue.cancel(item_id)
+                self.update_status(message)
+                self.log_message(message)
+        self.async_loop_manager.run_coroutine(cancel())
 
-        # Step 1: Get instructions from Gemini
-        self.update_status("Getting instructions from Gemini...")
-        self.log_message("Contacting Gemini...")
-        gemini_instructions_json = await self.get_gemini_instructions(user_command)
+    def on_clear_finished(self):
+        for iid in self.queue_view.get_children():
+            if self.queue_view.item(iid, "values")[1] in ("done", "failed", "cancelled"):
+                self.queue_view.delete(iid)
 
-        if gemini_instructions_json is None:
-            # Error already logged and status updated by get_gemini_instructions
+    def _on_queue_change(self, item: QueuedCommand) -> None:
+        # Called on the async loop; the row and widgets are updated on the Tk thread
+        values = (item.text.replace("\n", " ")[:80], item.state, item.message)
+        self.log_pipeline.call(self._render_queue_item, str(item.item_id), values, item.state)
+        if item.state in ("done", "failed"):
+            self.show_timings(item.timings)
+        if item.finished:
+            self.log_message(f"Command #{item.item_id} {item.state}: {item.message}", level="ERROR" if item.state == "failed" else "INFO")
+
+    def _render_queue_item(self, iid: str, values: tuple, state: str) -> None:
+        if self.queue_view.exists(iid):
+            self.queue_view.item(iid, values=values, tags=(state,))
+        else:
+            self.queue_view.insert("", tk.END, iid=iid, text=iid, values=values, tags=(state,))
+        finished = [child for child in self.queue_view.get_children()
+                    if self.queue_view.item(child, "values")[1] in ("done", "failed", "cancelled")]
+        for child in finished[:max(0, len(finished) - QUEUE_MAX_FINISHED)]:
+            self.queue_view.delete(child)
+
+    def on_structured_output_toggled(self):
+        # Read on the async loop when a prompt is built; a plain attribute avoids touching Tk from there
+        self.structured_output = self.structured_output_var.get()
+        self.log_message(f"Structured Gemini output {'enabled' if self.structured_output else 'disabled'}.")
+
+    def on_text_changed(self, event=None):
+        """Restarts the debounce timer of speculative translation on every keystroke."""
+        if self._speculation_after_id is not None:
+            self.root.after_cancel(self._speculation_after_id)
+            self._speculation_after_id = None
+        if self.speculate_var.get():
+            self._speculation_after_id = self.root.after(SPECULATION_DEBOUNCE_MS, self._speculate_current_text)
+
+    def _speculate_current_text(self):
+        self._speculation_after_id = None
+        text = self.text_area.get("1.0", tk.END).strip()
+        rpi_ip = self.rpi_ip_var.get().strip()
+        rpi_port_str = self.rpi_port_var.get().strip()
+        if not self.gemini_model or len(text) < SPECULATION_MIN_CHARS or not rpi_ip or not rpi_port_str.isdigit():
             return
+        if self.local_parser_var.get() and parse_command(text) is not None:
+            return # Translated locally at submit time anyway
+        bypass_cache = self.bypass_cache_var.get()
 
-        self.log_message(f"Gemini raw response: {json.dumps(gemini_instructions_json, indent=2)}")
+        async def speculate():
+            # The macro list is part of the prompt, so it is refreshed before the prompt is built
+            await self.refresh_macros(rpi_ip, int(rpi_port_str), StageTimings())
+            if not bypass_cache and self.translation_cache.contains(self._translation_cache_key(text)):
+                return
+            self.speculator.speculate(text, self._get_gemini_prompt(text))
+        self.async_loop_manager.run_coroutine(speculate())
 
-        # Step 2: Send instructions to Raspberry Pi via MCP
-        self.update_status(f"Sending {len(gemini_instructions_json)} command(s) to Raspberry Pi...")
-        self.log_message(f"Sending commands to RPi: {rpi_ip}:{rpi_port}")
-        
-        pi_response = await self.send_commands_to_pi_mcp(rpi_ip, rpi_port, gemini_instructions_json)
+    def _on_speculation_change(self) -> None:
+        summary = self.speculator.summary()
+        self.log_pipeline.call(lambda: self.speculation_stats_label.config(text=f"Speculation: {summary}"))
+
+    def show_timings(self, timings: StageTimings) -> None:
+        self.log_pipeline.call(lambda: self.timings_label.config(text=f"Last command timings: {timings.summary()}"))
+        self.log_message(f"Stage timings (ms): {json.dumps(timings.as_dict())}")
+
+    async def translate_command(self, item: QueuedCommand, use_gemini: bool = True) -> list[dict] | None:
+        """
+        Translates a queued command: the local parser for fully explicit commands, then
+        the translation cache, then Gemini (skipped when use_gemini is False). Sets
+        item.path; returns None if there is no translation (item.message says why).
+        """
+        options, timings = item.options, item.timings
+        rpi_ip, rpi_port = options["ip"], options["port"]
+        self.log_message(f"User command #{item.item_id}: '{item.text}' for RPi at {rpi_ip}:{rpi_port}")
+
+        # Step 0: Fully explicit commands ("servo_3 to 90 then pin 24 to 10") are parsed locally
+        if options["local_parser"]:
+            with timings.span("local_parse"):
+                commands = parse_command(item.text)
+            if commands is not None:
+                item.path = "local"
+                self.log_message(f"Path: local parser ({len(commands)} command(s)), Gemini skipped.")
+                return commands
 
-        if pi_response:
-            self.update_status(f"Response from Pi: {pi_response.splitlines()[0]}", is_success=True) # Show first line in status
-            self.log_message(f"Full response from Pi:\n{pi_response}", level="INFO" if "Error" not in pi_response else "ERROR")
+        # Step 1: Otherwise get instructions from the translation cache, or from Gemini on a miss
+        # The macro list is part of the prompt, and so of the cache key
+        await self.refresh_macros(rpi_ip, rpi_port, timings)
+        cache_key = self._translation_cache_key(item.text)
+        if options["bypass_cache"]:
+            self.log_message("Translation cache bypassed for this command.")
         else:
+            with timings.span("cache_lookup"):
+                commands = self.translation_cache.get(cache_key)
+            if commands is not None:
+                item.path = "cache"
+                self.log_message(f"Path: translation cache hit ({self.translation_cache.stats()}). Skipping Gemini.")
+                return commands
+            self.log_message(f"Translation cache miss ({self.translation_cache.stats()}).")
+
+        # A translation made while the command was being typed, if the text and prompt still match
+        commands = await self.speculator.take(item.text, self._get_gemini_prompt(item.text))
+        if commands is not None:
+            item.path = "speculative"
+            self.translation_cache.put(cache_key, commands)
+            self.log_message(f"Path: speculative translation ({self.speculator.summary()}). Skipping Gemini.")
+            return commands
+        if not use_gemini:
+            return None
+
+        await self.wait_for_gemini()
+        if not self.gemini_model:
+            self.update_status("Gemini model not initialized. Check API Key.", is_error=True)
+            self.log_message("Gemini Error: Model not initialized.", level="ERROR")
+            item.message = "Gemini model not initialized."
+            return None
+        self.log_message(f"Path: Gemini. Contacting Gemini for command #{item.item_id}...")
+        item.path = "gemini"
+        commands = await self.get_gemini_instructions(item.text, timings)
+        if commands is None:
+            # Error already logged and status updated by get_gemini_instructions
+            item.message = "Gemini translation failed; see the log."
+            return None
+        self.translation_cache.put(cache_key, commands)
+        self.log_message(f"Gemini raw response: {json.dumps(commands, indent=2)}", level="DEBUG")
+        return commands
+
+    async def execute_command(self, item: QueuedCommand) -> bool:
+        """Sends a translated command to the Pi (or the fleet); returns whether every command succeeded."""
+        options, timings = item.options, item.timings
+        rpi_ip, rpi_port = options["ip"], options["port"]
+        pi_response = None
+        if item.stream:
+            # Nothing was translated ahead: commands are sent to the Pi while Gemini is still generating
+            item.commands = await self.translate_command(item, use_gemini=False)
+            if item.commands is None:
+                await self.wait_for_gemini()
+                if not self.gemini_model:
+                    self.update_status("Gemini model not initialized. Check API Key.", is_error=True)
+                    item.message = "Gemini model not initialized."
+                    return False
+                item.path = "stream"
+                self.update_status("Streaming instructions from Gemini to Raspberry Pi...")
+                self.log_message("Path: Gemini. Contacting Gemini (streaming, incremental dispatch)...")
+                item.commands, pi_response = await self.stream_gemini_to_pi(item.text, rpi_ip, rpi_port, timings)
+                if item.commands is None:
+                    # Error already logged and status updated by stream_gemini_to_pi
+                    item.message = "Streaming translation failed; see the log."
+                    return False
+                self.translation_cache.put(self._translation_cache_key(item.text), item.commands)
+
+        # Step 2: Send instructions to Raspberry Pi via MCP (already done when streamed)
+        if options["fleet_targets"]:
+            fleet_targets = options["fleet_targets"]
+            self.update_status(f"Sending {len(item.commands)} command(s) to {len(fleet_targets)} arm(s)...")
+            with timings.span("fleet"):
+                pi_response = await self.send_commands_to_fleet(fleet_targets, item.commands)
+        elif pi_response is None:
+            self.update_status(f"Sending {len(item.commands)} command(s) of #{item.item_id} to Raspberry Pi...")
+            self.log_message(f"Sending commands to RPi: {rpi_ip}:{rpi_port}")
+            pi_response = await self.send_commands_to_pi_mcp(rpi_ip, rpi_port, item.commands, timings)
+
+        if not pi_response:
             # Error handled by send_commands_to_pi_mcp
-            pass
-            
+            item.message = "No response from the Pi; see the log."
+            return False
+        failed = "Error" in pi_response or re.search(r'"status":\s*"(error|cancelled|rejected)"', pi_response) is not None
+        item.message = f"{item.path}: {len(item.commands)} command(s), {time.monotonic() - item.submitted_at:.1f} s after submission" + (", errors on the Pi" if failed else "")
+        self.update_status(f"Response from Pi: {pi_response.splitlines()[0]}", is_error=failed, is_success=not failed) # Show first line in status
+        self.log_message(f"Full response from Pi:\n{pi_response}", level="ERROR" if failed else "INFO")
+        return not failed
+
+    async def refresh_macros(self, rpi_ip: str, port: int, timings: StageTimings | None = None) -> None:
+        """
+        Fetches the Pi's macro list for the Gemini prompt, at most every MACRO_REFRESH_S
+        per server. Failures are only logged; the prompt then lists no macros.
+        """
+        if self._macros_source is not None:
+            ip, cached_port, fetched_at = self._macros_source
+            if (ip, cached_port) == (rpi_ip, port) and time.monotonic() - fetched_at < MACRO_REFRESH_S:
+                return
+        try:
+            result = await self.mcp_sessions.call_tool(rpi_ip, port, name="list_macros", arguments={}, timings=timings)
+            macros = []
+            for item in result.content: # One text item holding the list, or one item per macro
+                value = json.loads(item.text) if hasattr(item, "text") else None
+                macros.extend(value if isinstance(value, list) else [value] if isinstance(value, dict) else [])
+            self.macros = macros
+        except Exception as e:
+            self.macros = []
+            self.log_message(f"Could not list macros on {rpi_ip}:{port}: {e}", level="WARNING")
+        self._macros_source = (rpi_ip, port, time.monotonic())
+
     def _get_gemini_prompt(self, user_text_input: str) -> str:
-        return f"""
-You are a precise robot arm controller. Your task is to convert the user's textual command into a sequence of servo motor movements.
-You are controlling a robot arm with 6 servo motors. These servos are identified by names and are connected to the following Raspberry Pi GPIO pins:
-- servo_0: pin 17
-- servo_1: pin 27
-- servo_2: pin 22
-- servo_3: pin 23
-- servo_4: pin 24
-- servo_5: pin 25
-    
-Servos 0-2 can move between 0 and 45 degrees. Servos 3-5 can move between 0 and 180 degrees.
-
-Output your response as a JSON list of objects. Each object in the list represents a single servo command and must have the following fields:
-- "pin": An integer representing the BCM GPIO pin number for the servo.
-- "angle": An integer representing the target angle for the servo (0-180).
-- "duration_ms": An optional integer for how long the movement/hold should take in milliseconds (e.g., 500). If not critical, you can omit it or use a default like 500.
-
-For example, if the user says "Move servo_0 to 90 degrees and servo_2 to 30 degrees, each for 1 second", you should output:
-[
-    {{"pin": 17, "angle": 45, "duration_ms": 500}},
-    {{"pin": 22, "angle": 30, "duration_ms": 1000}}
-]
-
-If the user says "Wave the arm connected to servo_0", a possible output could be:
-[
-    {{"pin": 23, "angle": 45, "duration_ms": 500}},
-    {{"pin": 23, "angle": 10, "duration_ms": 700}},
-    {{"pin": 23, "angle": 45, "duration_ms": 500}}
-]
-
-Ensure the output is ONLY the JSON list, with no other text, markdown formatting, or explanations.
-User command: "{user_text_input}"
-JSON output:
-"""
-
-    async def get_gemini_instructions(self, user_input: str) -> list[dict] | None:
+        return gemini_prompt(user_text_input, self.macros, self.structured_output)
+
+    def _gemini_request(self, user_input: str) -> tuple:
+        """(mode, model, contents, generation config) of a translation in the current prompt mode."""
+        mode, contents, config = gemini_request(user_input, self.macros, self.structured_output)
+        return mode, self.gemini_structured_model if mode == "structured" else self.gemini_model, contents, config
+
+    def _parse_gemini_output(self, mode: str, raw_text: str) -> list[dict]:
+        return parse_gemini_output(mode, raw_text, self.macros)
+
+    def _record_gemini_call(self, mode: str, response=None, parse_failed: bool = False) -> None:
+        """Logs the token counts of a Gemini call and the running totals of its prompt mode."""
+        stats = self.gemini_usage.record(mode, response, parse_failed)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.log_message(f"Gemini tokens ({mode}): prompt {usage.prompt_token_count} (cached {usage.cached_content_token_count}), "
+                             f"output {usage.candidates_token_count}.")
+        calls = stats["calls"]
+        self.log_message(f"Gemini totals ({mode}): {calls} call(s), {stats['parse_failures']} parse failure(s), "
+                         f"avg prompt {stats['prompt_tokens'] / calls:.0f} tokens (cached {stats['cached_tokens'] / calls:.0f}), "
+                         f"avg output {stats['output_tokens'] / calls:.0f} tokens.", level="DEBUG")
+
+    async def get_gemini_instructions(self, user_input: str, timings: StageTimings | None = None,
+                                      quiet: bool = False) -> list[dict] | None:
+        # quiet: leave the status bar alone (speculative translations); errors are still logged
+        update_status = (lambda *args, **kwargs: None) if quiet else self.update_status
+        await self.wait_for_gemini()
         if not self.gemini_model:
-            self.update_status("Gemini model not available.", is_error=True)
+            update_status("Gemini model not available.", is_error=True)
             self.log_message("Gemini call skipped: model not initialized.", level="ERROR")
             return None
         
-        prompt = self._get_gemini_prompt(user_input)
-        self.log_message(f"Sending prompt to Gemini:\n{prompt}")
+        mode, model, prompt, config = self._gemini_request(user_input)
+        self.log_message(f"Sending prompt to Gemini ({mode}):\n{prompt}", level="DEBUG")
 
+        timings = timings or StageTimings()
+        raw_response_text = ""
+        response = None
         try:
-            response = await self.gemini_model.generate_content_async(prompt)
+            with timings.span("gemini"):
+                response = await model.generate_content_async(prompt, generation_config=config)
             raw_response_text = response.text.strip()
-            self.log_message(f"Gemini raw text response:\n{raw_response_text}")
-
-            # Clean the response: remove potential markdown ```json ... ```
-            if raw_response_text.startswith("```json"):
-                raw_response_text = raw_response_text[7:] # Remove ```json
-            if raw_response_text.endswith("```"):
-                raw_response_text = raw_response_text[:-3] # Remove ```
-            raw_response_text = raw_response_text.strip()
-
-            parsed_json = json.loads(raw_response_text)
-            if not isinstance(parsed_json, list):
-                raise ValueError("Gemini response is not a JSON list.")
-            for item in parsed_json:
-                if not isinstance(item, dict) or "pin" not in item or "angle" not in item:
-                    raise ValueError("Invalid item in Gemini JSON list response.")
-            
-            self.update_status("Successfully received and parsed instructions from Gemini.", is_success=True)
+            self.log_message(f"Gemini raw text response:\n{raw_response_text}", level="DEBUG")
+
+            with timings.span("parse"):
+                parsed_json = self._parse_gemini_output(mode, raw_response_text)
+            self._record_gemini_call(mode, response)
+
+            update_status("Successfully received and parsed instructions from Gemini.", is_success=True)
             return parsed_json
         except json.JSONDecodeError as e:
-            self.update_status(f"Gemini Error: Failed to parse JSON response: {e}. Raw: {raw_response_text}", is_error=True)
+            self._record_gemini_call(mode, response, parse_failed=True)
+            update_status(f"Gemini Error: Failed to parse JSON response: {e}. Raw: {raw_response_text}", is_error=True)
             self.log_message(f"JSONDecodeError from Gemini response: {e}. Raw response: '{raw_response_text}'", level="ERROR")
             return None
         except ValueError as e: # For custom validation errors
-            self.update_status(f"Gemini Error: Invalid data format from Gemini: {e}. Raw: {raw_response_text}", is_error=True)
+            self._record_gemini_call(mode, response, parse_failed=True)
+            update_status(f"Gemini Error: Invalid data format from Gemini: {e}. Raw: {raw_response_text}", is_error=True)
             self.log_message(f"ValueError (Invalid format) from Gemini response: {e}. Raw response: '{raw_response_text}'", level="ERROR")
             return None
         except Exception as e:
-            self.update_status(f"Gemini API Error: {e}", is_error=True)
+            update_status(f"Gemini API Error: {e}", is_error=True)
             self.log_message(f"Error calling Gemini API: {e}", level="ERROR")
             return None
 
-    async def send_commands_to_pi_mcp(self, rpi_ip: str, port: int, commands: list[dict]) -> str | None:
+    async def stream_gemini_to_pi(self, user_input: str, rpi_ip: str, port: int,
+                                  timings: StageTimings | None = None) -> tuple[list[dict] | None, str | None]:
+        """
+        Streams Gemini's response and dispatches each command object to the Pi as soon
+        as it has been parsed and validated, through the server's command stream tools,
+        so the arm starts moving after the first object instead of the full response.
+        Returns (translated commands, Pi response text); commands is None on failure.
+        """
+        await self.wait_for_gemini()
+        if not self.gemini_model:
+            self.update_status("Gemini model not available.", is_error=True)
+            self.log_message("Gemini call skipped: model not initialized.", level="ERROR")
+            return None, None
+
+        timings = timings or StageTimings()
+        opened = await self.call_pi_tool(rpi_ip, port, "open_command_stream", {}, timings)
+        if opened is None:
+            return None, None
+        stream_id = json.loads(opened)["stream_id"]
+
+        mode, model, prompt, config = self._gemini_request(user_input)
+        macro_names = [m["name"] for m in self.macros]
+        self.log_message(f"Sending prompt to Gemini (streaming, {mode}):\n{prompt}", level="DEBUG")
+        t_start = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue()
+        commands = []
+
+        async def dispatch():
+            # Sends whatever has been parsed since the last append as one chunk
+            first = True
+            done = False
+            while not done:
+                batch = []
+                item = await queue.get()
+                while True:
+                    if item is None:
+                        done = True
+                        break
+                    batch.append(item)
+                    if queue.empty():
+                        break
+                    item = queue.get_nowait()
+                if batch:
+                    if first:
+                        timings.add("gemini_first_command", 1000 * (time.monotonic() - t_start))
+                        self.log_message(f"First command dispatched {1000 * (time.monotonic() - t_start):.0f} ms after the Gemini request.")
+                        first = False
+                    appended = await self.call_pi_tool(rpi_ip, port, "append_command_stream", {"stream_id": stream_id, "commands": batch}, timings)
+                    if appended is None or '"error"' in appended:
+                        raise ConnectionError(f"Failed to append commands to stream {stream_id}: {appended}")
+
+        dispatcher = asyncio.create_task(dispatch())
+        parser = IncrementalJSONArrayParser()
+        raw_response_text = ""
+        response = None
+        try:
+            response = await model.generate_content_async(prompt, generation_config=config, stream=True)
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError: # Chunk without text parts (e.g. only a finish reason)
+                    continue
+                raw_response_text += text
+                for item in parser.feed(text):
+                    if mode == "structured":
+                        item = validate_command(item, macro_names)
+                    else:
+                        validate_gemini_command(item)
+                    commands.append(item)
+                    queue.put_nowait(item)
+                if dispatcher.done():
+                    break # Dispatch failed; the exception is raised below
+            if not dispatcher.done():
+                parser.finish()
+            queue.put_nowait(None)
+            await dispatcher
+        except Exception as e:
+            dispatcher.cancel()
+            if isinstance(e, ValueError): # Parse or validation error, including json.JSONDecodeError
+                self._record_gemini_call(mode, response, parse_failed=True)
+                self.update_status(f"Gemini Error: Invalid data format from Gemini: {e}. Raw: {raw_response_text}", is_error=True)
+                self.log_message(f"ValueError (Invalid format) from streamed Gemini response: {e}. Raw response: '{raw_response_text}'", level="ERROR")
+            else:
+                self.update_status(f"Streaming Error: {e}", is_error=True)
+                self.log_message(f"Error while streaming Gemini output to the Pi: {e}", level="ERROR")
+            if commands:
+                self.log_message(f"{len(commands)} command(s) were dispatched before the failure; cancelling the rest.", level="WARNING")
+            await self.call_pi_tool(rpi_ip, port, "close_command_stream", {"stream_id": stream_id, "cancel": True}, timings)
+            return None, None
+
+        timings.add("gemini", 1000 * (time.monotonic() - t_start))
+        self._record_gemini_call(mode, response)
+        self.log_message(f"Gemini stream complete after {1000 * (time.monotonic() - t_start):.0f} ms ({len(commands)} command(s)).")
+        self.log_message(f"Gemini raw text response:\n{raw_response_text}", level="DEBUG")
+        pi_response = await self.call_pi_tool(rpi_ip, port, "close_command_stream", {"stream_id": stream_id}, timings)
+        return commands, pi_response
+
+    async def send_commands_to_pi_mcp(self, rpi_ip: str, port: int, commands: list[dict],
+                                      timings: StageTimings | None = None) -> str | None:
+        # Consecutive servo commands are sent as one batch; macro invocations go to run_macro
+        responses = []
+        for tool_name, arguments in command_segments(commands):
+            response = await self.call_pi_tool(rpi_ip, port, tool_name, arguments, timings)
+            if response is None:
+                return None
+            responses.append(response)
+        return "\n".join(responses)
+
+    async def send_commands_to_fleet(self, targets: list[tuple[str, int]], commands: list[dict]) -> str:
+        """
+        Runs the commands on every target concurrently with a synchronized start (see
+        FleetDispatcher) and returns a per-target summary, headed by an overall line.
+        """
+        report = await self.fleet.run(targets, commands, macros=self.macros)
+        self.log_message(f"Fleet results: {json.dumps(report)}", level="DEBUG")
+        ok = [label for label, result in report.items() if result["status"] == "ok"]
+        lags = [result["start_lag_ms"] for result in report.values() if result.get("start_lag_ms") is not None]
+        spread = f", start spread {max(lags) - min(lags):.1f} ms" if len(lags) > 1 else ""
+        lines = [f"Fleet: {len(ok)}/{len(report)} arm(s) ok{spread}" + ("" if len(ok) == len(report) else " (Errors on some arms)")]
+        for label, result in report.items():
+            details = f", {result['elapsed_ms']} ms, start lag {result['start_lag_ms']} ms" if "elapsed_ms" in result else ""
+            lines.append(f"  {label}: {result['status']} - {result.get('message', '')}{details}")
+        if len(ok) < len(report):
+            self.update_status(lines[0], is_error=True)
+        return "\n".join(lines)
+
+    async def call_pi_tool(self, rpi_ip: str, port: int, tool_name: str, tool_arguments: dict,
+                           timings: StageTimings | None = None) -> str | None:
+        """
+        Calls a tool on the Pi's MCP server over the pooled session and returns the
+        result as text. Errors are logged and shown in the status bar; returns None then.
+        MCP session setup and tool call times are added to timings if given.
+        """
         mcp_server_url_for_context = f"http://{rpi_ip}:{port}/mcp" # For logging and context
         self.log_message(f"Attempting to establish MCP connection to {rpi_ip}:{port}")
 
+        mcp_http_url = f"http://{rpi_ip}:{port}/mcp"
+        import anyio # Already loaded with the MCP SDK; needed for its exception types
         try:
-            mcp_http_url = f"http://{rpi_ip}:{port}/mcp"
-            self.log_message(f"Opening MCP HTTP connection to {mcp_http_url}...")
-            
-            async with streamablehttp_client(mcp_http_url) as (read_stream, write_stream, _response_future):
-                self.log_message(f"MCP HTTP transport established to {mcp_http_url}.")
-
-                # Ensure commands is a dictionary for the tool call as per MCP spec for arguments
-                tool_arguments = {"commands": commands}
-
-                async with ClientSession(read_stream, write_stream) as session:
-                    self.log_message("MCP Client: Initializing session...")
-                    init_response = await session.initialize()
-                    self.log_message(f"MCP Client: Session initialized. Server capabilities: {init_response.capabilities if init_response else 'N/A'}")
-
-                    self.log_message(f"MCP Client: Calling tool 'execute_servo_commands' with args: {tool_arguments}")
-                    tool_result = await session.call_tool(
-                        name="execute_servo_commands",
-                        arguments=tool_arguments
-                    )
-                    self.log_message(f"MCP Client: Tool call successful. Raw result content type: {type(tool_result.content)}")
-                    self.log_message(f"MCP Client: Tool call result content (full): {str(tool_result.content)}") # Log the full content for inspection
-
-                    content = tool_result.content
-                    if isinstance(content, list) and len(content) > 0:
-                        first_item = content[0]
-                        # Check if the first item is an MCP content type (like TextContent)
-                        # and has a 'text' attribute which holds the actual string data.
-                        if hasattr(first_item, 'text') and isinstance(first_item.text, str):
-                            self.log_message(f"Extracted text from MCP content object: {first_item.text}")
-                            return first_item.text
-                        else:
-                            # If the list contains something else, or .text is not a string
-                            self.log_message(f"Tool result is a list, but first item is not a recognized MCP text content object or .text is not a string: {str(first_item)}", level="WARNING")
-                            # Fallback to stringifying the whole list, though this might not be the desired JSON.
-                            return str(content)
-                    elif isinstance(content, str):
-                        # If the content is already a string, return it directly.
-                        return content
-                    elif isinstance(content, dict):
-                        # If server directly returns a dict (e.g. FastMCP might auto-serialize some Pydantic models to dicts)
-                        # and the calling code expects a JSON string of that dict.
-                        self.log_message(f"Tool result is a dict, returning its JSON string representation: {str(content)}", level="INFO")
-                        return json.dumps(content) # Convert dict to JSON string
-                    else:
-                        # Fallback for any other unexpected types.
-                        self.log_message(f"Unexpected tool result content structure. Type: {type(content)}, Value: {str(content)}", level="WARNING")
-                        return str(content)
+            self.log_message(f"MCP Client: Calling tool '{tool_name}' with args: {tool_arguments}", level="DEBUG")
+            tool_result = await self.mcp_sessions.call_tool(
+                rpi_ip, port,
+                name=tool_name,
+                arguments=tool_arguments,
+                timings=timings
+            )
+            self.log_message(f"MCP Client: Tool call successful. Raw result content type: {type(tool_result.content)}", level="DEBUG")
+            self.log_message(f"MCP Client: Tool call result content (full): {str(tool_result.content)}", level="DEBUG") # Log the full content for inspection
+
+            content = tool_result.content
+            if isinstance(content, list) and len(content) > 0:
+                first_item = content[0]
+                # Check if the first item is an MCP content type (like TextContent)
+                # and has a 'text' attribute which holds the actual string data.
+                if hasattr(first_item, 'text') and isinstance(first_item.text, str):
+                    self.log_message(f"Extracted text from MCP content object: {first_item.text}", level="DEBUG")
+                    return first_item.text
+                else:
+                    # If the list contains something else, or .text is not a string
+                    self.log_message(f"Tool result is a list, but first item is not a recognized MCP text content object or .text is not a string: {str(first_item)}", level="WARNING")
+                    # Fallback to stringifying the whole list, though this might not be the desired JSON.
+                    return str(content)
+            elif isinstance(content, str):
+                # If the content is already a string, return it directly.
+                return content
+            elif isinstance(content, dict):
+                # If server directly returns a dict (e.g. FastMCP might auto-serialize some Pydantic models to dicts)
+                # and the calling code expects a JSON string of that dict.
+                self.log_message(f"Tool result is a dict, returning its JSON string representation: {str(content)}", level="INFO")
+                return json.dumps(content) # Convert dict to JSON string
+            else:
+                # Fallback for any other unexpected types.
+                self.log_message(f"Unexpected tool result content structure. Type: {type(content)}, Value: {str(content)}", level="WARNING")
+                return str(content)
 
         except socket.gaierror: # Specific error for DNS/address lookup issues
             self.update_status(f"MCP Error: Could not resolve hostname {rpi_ip}. Check IP address.", is_error=True)
@@ -405,19 +1379,28 @@ JSON output:
             import traceback
             self.log_message(traceback.format_exc(), level="DEBUG")
             return None
-        # The 'finally' block for closing client_stream is removed as 
-        # streamablehttp_client and ClientSession are async context managers and handle their own cleanup.
-        # No explicit close needed for streams obtained from streamablehttp_client within its context.
+        # Sessions are owned by MCPSessionManager; a failed call drops the pooled session so
+        # the next submit reconnects. All sessions are closed in on_closing.
 
 if __name__ == "__main__":
+    # Startup timings: imports, Tk and UI setup, first window, then Gemini init and warm-up on the async loop
+    startup_timings = StageTimings(start=STARTUP_T0)
+    startup_timings.add("imports", (time.perf_counter() - STARTUP_T0) * 1000.0)
+
     # Create and manage the asyncio event loop
     async_loop_mgr = AsyncTkinterLoop()
     
-    root = tk.Tk()
-    app = WednesdayApp(root, async_loop_mgr)
+    with startup_timings.span("tk_root"):
+        root = tk.Tk()
+    app = WednesdayApp(root, async_loop_mgr, startup_timings)
     
     def on_closing():
         print("Closing application...")
+        try:
+            async_loop_mgr.run_coroutine(app.mcp_sessions.close_all()).result(timeout=5)
+        except Exception as e:
+            print(f"Error closing MCP sessions: {e}")
+        app.log_pipeline.close()
         async_loop_mgr.stop() # Stop the asyncio loop
         root.destroy()
 
@@ -0,0 +1,322 @@
+"""
+Headless batch client for the Wednesday arm: the same translation (local parser,
+translation cache, Gemini) and MCP sending as the GUI, without a window.
+
+Input is read from a file or stdin, one item per line; blank lines and lines
+starting with "#" are skipped. An item is either
+  - a natural-language command:            servo_3 to 90 then pin 24 to 10
+  - a pre-translated JSON batch:           [{"pin": 17, "angle": 30}]
+  - a JSON object with an optional id:     {"id": "wave-1", "text": "wave twice"}
+                                           {"id": "home", "commands": [...], "mode": "timeline"}
+Up to --concurrency items are translated at once while earlier items run on the Pi;
+items always run in input order. One JSON line is written per item (status, path,
+per-stage timings in ms, server results), then a summary line with throughput.
+The exit code is 0 when every item succeeded, 1 otherwise:
+    python wednesday_cli.py --ip 192.168.1.10 --input commands.txt --output results.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from command_parser import parse_command
+from command_schema import SYSTEM_INSTRUCTION
+from wednesday_core import (GEMINI_MODEL_NAME, TRANSLATION_CACHE_PATH, GeminiUsage, MCPSessionManager, StageTimings,
+                            TranslationCache, command_segments, gemini_prompt, gemini_request, parse_gemini_output,
+                            validate_gemini_command)
+
+log = logging.getLogger("wednesday_cli")
+
+EXECUTION_MODES = ("sequential", "timeline", "compiled")
+
+
+class BatchItem:
+    """One input line and, once processed, its translation and outcome."""
+    def __init__(self, index: int, line_no: int, item_id=None, text: str | None = None,
+                 commands: list[dict] | None = None, mode: str | None = None):
+        self.index = index
+        self.line_no = line_no
+        self.item_id = item_id
+        self.text = text
+        self.commands = commands
+        self.mode = mode
+        self.path = "json" if commands is not None else None # local, cache, gemini or json
+        self.status = None
+        self.error = None
+        self.results: list = []
+        self.timings = StageTimings()
+        self.translated_at: float | None = None # perf_counter time the translation finished
+
+    def to_dict(self) -> dict:
+        record = {"type": "result", "index": self.index, "line": self.line_no, "id": self.item_id,
+                  "input": self.text, "path": self.path, "status": self.status,
+                  "commands": len(self.commands) if self.commands is not None else 0}
+        if self.error:
+            record["error"] = self.error
+        if self.results:
+            record["results"] = self.results
+        record["timings_ms"] = self.timings.as_dict()
+        return record
+
+
+def load_items(stream) -> list[BatchItem]:
+    """Reads the input lines; raises ValueError naming the first malformed line."""
+    items = []
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        index = len(items)
+        if not line.startswith(("[", "{")):
+            items.append(BatchItem(index, line_no, text=line))
+            continue
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_no}: invalid JSON: {e}")
+        if isinstance(value, list):
+            value = {"commands": value}
+        if not isinstance(value, dict) or ("text" in value) == ("commands" in value):
+            raise ValueError(f"Line {line_no}: a JSON item needs either \"text\" or \"commands\".")
+        mode = value.get("mode")
+        if mode is not None and mode not in EXECUTION_MODES:
+            raise ValueError(f"Line {line_no}: invalid mode '{mode}'. Use one of {', '.join(EXECUTION_MODES)}.")
+        if "commands" in value:
+            commands = value["commands"]
+            try:
+                if not isinstance(commands, list) or not commands:
+                    raise ValueError("\"commands\" must be a non-empty list.")
+                for command in commands:
+                    validate_gemini_command(command)
+            except ValueError as e:
+                raise ValueError(f"Line {line_no}: {e}")
+            items.append(BatchItem(index, line_no, value.get("id"), commands=commands, mode=mode))
+        else:
+            items.append(BatchItem(index, line_no, value.get("id"), text=str(value["text"]), mode=mode))
+    return items
+
+
+class BatchRunner:
+    """
+    Translates items concurrently (at most `concurrency` at a time) and executes them
+    on the Pi strictly in input order over one pooled MCP session, so translation of
+    later items overlaps execution of earlier ones.
+    """
+    def __init__(self, ip: str | None, port: int, concurrency: int = 4, mode: str = "sequential",
+                 use_local_parser: bool = True, use_cache: bool = True, dry_run: bool = False,
+                 stop_on_error: bool = False, structured: bool = False):
+        self.ip = ip
+        self.port = port
+        self.mode = mode
+        self.use_local_parser = use_local_parser
+        self.dry_run = dry_run
+        self.stop_on_error = stop_on_error
+        self.structured = structured # Schema-constrained Gemini output (see command_schema)
+        self.cache = TranslationCache(TRANSLATION_CACHE_PATH) if use_cache else None
+        self.sessions = MCPSessionManager(log=lambda message, level="INFO": log.log(logging.getLevelName(level), message))
+        self.macros: list[dict] = []
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._gemini_model = None
+        self.gemini_usage = GeminiUsage()
+
+    async def _load_macros(self) -> None:
+        """The Pi's macros are listed once per run, for the Gemini prompt (and its cache key)."""
+        try:
+            result = await self.sessions.call_tool(self.ip, self.port, name="list_macros", arguments={})
+            for item in result.content:
+                value = json.loads(item.text) if hasattr(item, "text") else None
+                self.macros.extend(value if isinstance(value, list) else [value] if isinstance(value, dict) else [])
+        except Exception as e:
+            log.warning(f"Could not list macros on {self.ip}:{self.port}: {e}")
+
+    def _gemini(self):
+        if self._gemini_model is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise RuntimeError("GEMINI_API_KEY is not set (environment or client/.env).")
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            self._gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME,
+                                                       system_instruction=SYSTEM_INSTRUCTION if self.structured else None)
+        return self._gemini_model
+
+    async def _ask_gemini(self, text: str, timings: StageTimings) -> list[dict]:
+        """Translates text with Gemini, counting tokens and parse failures. Raises on failure."""
+        model = self._gemini()
+        mode, contents, config = gemini_request(text, self.macros, self.structured)
+        with timings.span("gemini"):
+            response = await model.generate_content_async(contents, generation_config=config)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            log.info(f"Gemini tokens: prompt {usage.prompt_token_count} "
+                     f"(cached {usage.cached_content_token_count}), output {usage.candidates_token_count}")
+        try:
+            with timings.span("parse"):
+                commands = parse_gemini_output(mode, response.text, self.macros)
+        except ValueError:
+            self.gemini_usage.record(mode, response, parse_failed=True)
+            raise
+        self.gemini_usage.record(mode, response)
+        return commands
+
+    async def translate(self, item: BatchItem) -> None:
+        """Fills in item.commands and item.path, or item.error."""
+        try:
+            await self._translate(item)
+        finally:
+            item.translated_at = time.perf_counter()
+
+    async def _translate(self, item: BatchItem) -> None:
+        if item.commands is not None:
+            return
+        timings = item.timings
+        if self.use_local_parser:
+            with timings.span("local_parse"):
+                item.commands = parse_command(item.text)
+            if item.commands is not None:
+                item.path = "local"
+                return
+        cache_key = TranslationCache.make_key(item.text, gemini_prompt("{user_command}", self.macros, self.structured), GEMINI_MODEL_NAME)
+        if self.cache is not None:
+            with timings.span("cache_lookup"):
+                item.commands = self.cache.get(cache_key)
+            if item.commands is not None:
+                item.path = "cache"
+                return
+        item.path = "gemini"
+        async with self._semaphore:
+            try:
+                item.commands = await self._ask_gemini(item.text, timings)
+            except Exception as e:
+                item.error = f"Translation failed: {type(e).__name__}: {e}"
+                return
+        if self.cache is not None:
+            self.cache.put(cache_key, item.commands)
+
+    async def execute(self, item: BatchItem) -> None:
+        """Sends a translated item to the Pi and sets its status from the server's results."""
+        failed = 0
+        try:
+            for tool_name, arguments in command_segments(item.commands):
+                if tool_name == "execute_servo_commands":
+                    arguments["mode"] = item.mode or self.mode
+                result = await self.sessions.call_tool(self.ip, self.port, name=tool_name, arguments=arguments,
+                                                       timings=item.timings)
+                text = result.content[0].text if result.content else ""
+                if getattr(result, "isError", False):
+                    raise RuntimeError(text or f"{tool_name} failed")
+                response = json.loads(text)
+                statuses = response if isinstance(response, list) else [response]
+                item.results.extend(statuses)
+                failed += sum(1 for status in statuses if status.get("status") != "ok")
+        except Exception as e:
+            item.status = "error"
+            item.error = f"{type(e).__name__}: {e}"
+            return
+        item.status = "error" if failed else "ok"
+        if failed:
+            item.error = f"{failed} command(s) failed on the Pi."
+
+    async def run(self, items: list[BatchItem], emit) -> dict:
+        """Processes all items, calling emit(record) per item in input order; returns the summary."""
+        t0 = time.perf_counter()
+        if self.ip and any(item.commands is None for item in items):
+            await self._load_macros()
+        translations = [asyncio.create_task(self.translate(item)) for item in items]
+        counts = {"ok": 0, "error": 0, "skipped": 0}
+        paths: dict[str, int] = {}
+        commands = 0
+        try:
+            for item, translation in zip(items, translations):
+                if self.stop_on_error and counts["error"]:
+                    translation.cancel()
+                    item.status = "skipped"
+                else:
+                    await translation
+                    if item.error is None and self.dry_run:
+                        item.status = "ok"
+                    elif item.error is None:
+                        # Time the translated item waited for the items before it
+                        item.timings.add("queue_wait", (time.perf_counter() - item.translated_at) * 1000.0)
+                        with item.timings.span("execute"):
+                            await self.execute(item)
+                    if item.error is not None:
+                        item.status = "error"
+                    paths[item.path] = paths.get(item.path, 0) + 1
+                    commands += len(item.commands or []) if item.status == "ok" else 0
+                counts[item.status] += 1
+                emit(item.to_dict())
+        finally:
+            for translation in translations:
+                translation.cancel()
+            await self.sessions.close_all()
+        elapsed = time.perf_counter() - t0
+        return {"type": "summary", "items": len(items), **counts, "paths": paths, "commands": commands,
+                "elapsed_s": round(elapsed, 3), "items_per_s": round(len(items) / elapsed, 2) if elapsed else None,
+                "commands_per_s": round(commands / elapsed, 2) if elapsed else None, "dry_run": self.dry_run,
+                "gemini": {"structured": self.structured, **self.gemini_usage.stats("structured" if self.structured else "prompt")}}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run Wednesday commands from a file or stdin without the GUI.")
+    parser.add_argument("--ip", help="Raspberry Pi IP address (not needed with --dry-run)")
+    parser.add_argument("--port", type=int, default=8011, help="MCP server port (default 8011)")
+    parser.add_argument("--input", default="-", help="Input file, one command or JSON batch per line ('-' for stdin)")
+    parser.add_argument("--output", default="-", help="JSON-lines result file ('-' for stdout)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Gemini translations in flight at once (default 4)")
+    parser.add_argument("--mode", choices=EXECUTION_MODES, default="sequential", help="Execution mode for items without their own")
+    parser.add_argument("--no-local-parser", action="store_true", help="Send explicit commands to Gemini too")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the translation cache")
+    parser.add_argument("--dry-run", action="store_true", help="Translate only; do not contact the Pi")
+    parser.add_argument("--stop-on-error", action="store_true", help="Skip the remaining items after the first failure")
+    parser.add_argument("--structured", action="store_true", help="Use schema-constrained Gemini output with the compact prompt")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Log progress and MCP details to stderr")
+    args = parser.parse_args()
+    if not args.dry_run and not args.ip:
+        parser.error("--ip is required unless --dry-run is given")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+
+    try:
+        if args.input == "-":
+            items = load_items(sys.stdin)
+        else:
+            with open(args.input, encoding="utf-8") as f:
+                items = load_items(f)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read input: {e}", file=sys.stderr)
+        return 2
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    def emit(record: dict) -> None:
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+    runner = BatchRunner(args.ip, args.port, concurrency=args.concurrency, mode=args.mode,
+                         use_local_parser=not args.no_local_parser, use_cache=not args.no_cache,
+                         dry_run=args.dry_run, stop_on_error=args.stop_on_error, structured=args.structured)
+    try:
+        summary = asyncio.run(runner.run(items, emit))
+        emit(summary)
+    except KeyboardInterrupt:
+        print("Interrupted.", file=sys.stderr)
+        return 130
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"{summary['ok']}/{summary['items']} item(s) ok, {summary['error']} failed, {summary['skipped']} skipped "
+          f"in {summary['elapsed_s']}s ({summary['items_per_s']} items/s)", file=sys.stderr)
+    return 0 if summary["error"] == 0 and summary["skipped"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,453 @@
+"""
+Translation and MCP plumbing shared by the GUI (wednesday_app.py) and the headless
+client (wednesday_cli.py): stage timings, the Gemini prompts, requests, reply parsing
+and token accounting, the translation cache and the pooled MCP sessions. It has no Tk dependency, so the CLI
+runs where tkinter is not installed.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+# The MCP SDK is imported when the first session is opened (see _PooledMCPSession._run)
+if TYPE_CHECKING:
+    from mcp import ClientSession
+
+from command_parser import SERVO_PINS
+from command_schema import SYSTEM_INSTRUCTION as STRUCTURED_SYSTEM_INSTRUCTION
+from command_schema import build_structured_request, generation_config, validate_commands
+
+GEMINI_MODEL_NAME = 'gemini-2.5-flash-preview-04-17' # or 'gemini-pro'
+TRANSLATION_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translation_cache.json')
+
+class StageTimings:
+    """
+    Named timing spans for one submitted command (Gemini call, MCP session setup,
+    tool call, ...). Spans with the same name add up, e.g. several tool calls.
+    """
+    def __init__(self, start: float | None = None):
+        self.spans: dict[str, float] = {} # name -> milliseconds, in first-seen order
+        self._start = time.perf_counter() if start is None else start # perf_counter time the total counts from
+
+    @contextmanager
+    def span(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - t0) * 1000.0)
+
+    def add(self, name: str, ms: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000.0
+
+    def as_dict(self) -> dict:
+        return {**{name: round(ms, 1) for name, ms in self.spans.items()}, "total": round(self.total_ms(), 1)}
+
+    def summary(self) -> str:
+        return " | ".join(f"{name} {ms:.0f} ms" for name, ms in self.as_dict().items())
+
+def _gemini_macro_section(macros: list[dict]) -> str:
+    if not macros:
+        return ""
+    lines = "\n".join(
+        f'- "{m["name"]}": {m.get("description") or "no description"} (pins {m.get("pins")}, about {m.get("duration_ms")} ms)'
+        for m in macros
+    )
+    return f"""
+The robot also has these stored motion macros:
+{lines}
+If the user's request matches a macro, prefer an object {{"macro": "<name>"}} over the individual servo commands. It may also have
+- "speed_scale": optional number, greater than 1 plays the macro faster and less than 1 slower (default 1).
+- "repeat": optional integer, how many times to play it in a row (default 1).
+For example, "wave twice" could be: [{{"macro": "wave", "repeat": 2}}]
+Macro objects and servo commands can be mixed in the same list.
+"""
+
+def build_gemini_prompt(user_text_input: str, macros: list[dict] = ()) -> str:
+    """The Gemini translation prompt; macros are the Pi's stored macros (see list_macros)."""
+    servo_table = "\n".join(f"- {name}: pin {pin}" for name, pin in SERVO_PINS.items())
+    return f"""
+You are a precise robot arm controller. Your task is to convert the user's textual command into a sequence of servo motor movements.
+You are controlling a robot arm with 6 servo motors. These servos are identified by names and are connected to the following Raspberry Pi GPIO pins:
+{servo_table}
+    
+Servos 0-2 can move between 0 and 45 degrees. Servos 3-5 can move between 0 and 180 degrees.
+
+Output your response as a JSON list of objects. Each object in the list represents a single servo command and must have the following fields:
+- "pin": An integer representing the BCM GPIO pin number for the servo.
+- "angle": An integer representing the target angle for the servo (0-180).
+- "duration_ms": An optional integer for how long the movement/hold should take in milliseconds (e.g., 500). If not critical, you can omit it or use a default like 500.
+
+For example, if the user says "Move servo_0 to 90 degrees and servo_2 to 30 degrees, each for 1 second", you should output:
+[
+    {{"pin": 17, "angle": 45, "duration_ms": 500}},
+    {{"pin": 22, "angle": 30, "duration_ms": 1000}}
+]
+
+If the user says "Wave the arm connected to servo_0", a possible output could be:
+[
+    {{"pin": 23, "angle": 45, "duration_ms": 500}},
+    {{"pin": 23, "angle": 10, "duration_ms": 700}},
+    {{"pin": 23, "angle": 45, "duration_ms": 500}}
+]
+{_gemini_macro_section(macros)}
+Ensure the output is ONLY the JSON list, with no other text, markdown formatting, or explanations.
+User command: "{user_text_input}"
+JSON output:
+"""
+
+def _unwrap_exception_group(exc: BaseException) -> BaseException:
+    """Returns the single underlying exception of a (nested) one-element exception group."""
+    while isinstance(exc, BaseExceptionGroup) and len(exc.exceptions) == 1:
+        exc = exc.exceptions[0]
+    return exc
+
+class _PooledMCPSession:
+    """
+    A single long-lived MCP session. One runner task owns the transport and
+    ClientSession context managers for their whole life (anyio requires them to be
+    entered and exited in the same task), answers keep-alive pings and exits when
+    the session is closed or a ping fails.
+    """
+    def __init__(self, url: str, keepalive_interval: float, log):
+        self.url = url
+        self.session: "ClientSession | None" = None
+        self.init_result = None
+        self._keepalive_interval = keepalive_interval
+        self._log = log
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: BaseException | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and not self._closing.is_set()
+
+    async def open(self, timeout: float) -> None:
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise
+        if self.session is None:
+            raise _unwrap_exception_group(self._error) if self._error else ConnectionError(f"MCP session to {self.url} closed during setup.")
+
+    async def _run(self) -> None:
+        from mcp import ClientSession
+        from mcp.client.streamable_http import streamablehttp_client
+        try:
+            async with streamablehttp_client(self.url) as (read_stream, write_stream, _response_future):
+                async with ClientSession(read_stream, write_stream) as session:
+                    self.init_result = await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    while not self._closing.is_set():
+                        try:
+                            await asyncio.wait_for(self._closing.wait(), self._keepalive_interval)
+                        except asyncio.TimeoutError:
+                            try:
+                                await asyncio.wait_for(session.send_ping(), self._keepalive_interval)
+                            except Exception as e:
+                                self._log(f"MCP keep-alive ping to {self.url} failed: {e}. Dropping session.", level="WARNING")
+                                break
+        except Exception as e:
+            self._error = e
+        finally:
+            self.session = None
+            self._closing.set()
+            self._ready.set()
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, 5.0)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._task.cancel()
+            except Exception:
+                pass
+
+class MCPSessionManager:
+    """
+    Pool of long-lived MCP sessions keyed by (ip, port). Lives on the
+    AsyncTkinterLoop event loop; all methods must be awaited there. Sessions are
+    opened lazily on first use, reused across submits, kept alive with periodic
+    pings and reopened with exponential backoff after a failure.
+    """
+    def __init__(self, log, keepalive_interval=15.0, connect_timeout=10.0, initial_backoff=0.5, max_backoff=30.0):
+        self._log = log
+        self._keepalive_interval = keepalive_interval
+        self._connect_timeout = connect_timeout
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+        self._sessions: dict[tuple[str, int], _PooledMCPSession] = {}
+        self._locks: dict[tuple[str, int], asyncio.Lock] = {}
+        self._failures: dict[tuple[str, int], tuple[int, float]] = {} # key -> (consecutive failures, time of last failure)
+
+    async def get_session(self, ip: str, port: int) -> "ClientSession":
+        key = (ip, port)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            pooled = self._sessions.get(key)
+            if pooled is not None and pooled.alive:
+                self._log(f"MCP Client: Reusing session to {pooled.url}.")
+                return pooled.session
+            if pooled is not None:
+                self._log(f"MCP Client: Session to {pooled.url} is gone, reconnecting...")
+                await self._drop(key)
+
+            failures, last_failure = self._failures.get(key, (0, 0.0))
+            if failures:
+                backoff = min(self._max_backoff, self._initial_backoff * 2 ** (failures - 1))
+                remaining = last_failure + backoff - time.monotonic()
+                if remaining > 0:
+                    raise ConnectionError(f"Reconnect to {ip}:{port} backing off for another {remaining:.1f}s after {failures} failed attempt(s).")
+
+            pooled = _PooledMCPSession(f"http://{ip}:{port}/mcp", self._keepalive_interval, self._log)
+            self._log(f"Opening MCP HTTP connection to {pooled.url}...")
+            try:
+                await pooled.open(self._connect_timeout)
+            except BaseException:
+                self._failures[key] = (failures + 1, time.monotonic())
+                raise
+            self._failures.pop(key, None)
+            self._sessions[key] = pooled
+            self._log(f"MCP Client: Session initialized. Server capabilities: {pooled.init_result.capabilities if pooled.init_result else 'N/A'}")
+            return pooled.session
+
+    async def call_tool(self, ip: str, port: int, name: str, arguments: dict, timings: StageTimings | None = None):
+        """
+        Calls a tool on the pooled session for (ip, port). The session is dropped if the call fails.
+        Session setup (zero when reused) and the call itself are recorded in timings if given.
+        """
+        t0 = time.perf_counter()
+        session = await self.get_session(ip, port)
+        t1 = time.perf_counter()
+        if timings is not None:
+            timings.add("mcp_session", (t1 - t0) * 1000.0)
+        try:
+            return await session.call_tool(name=name, arguments=arguments)
+        except BaseException as e:
+            await self.invalidate(ip, port)
+            if isinstance(e, BaseExceptionGroup):
+                raise _unwrap_exception_group(e) from e
+            raise
+        finally:
+            if timings is not None:
+                timings.add(f"tool:{name}", (time.perf_counter() - t1) * 1000.0)
+
+    async def invalidate(self, ip: str, port: int) -> None:
+        """Closes and forgets the session for (ip, port); the next call reconnects."""
+        await self._drop((ip, port))
+
+    async def _drop(self, key: tuple[str, int]) -> None:
+        pooled = self._sessions.pop(key, None)
+        if pooled is not None:
+            await pooled.close()
+
+    async def close_all(self) -> None:
+        for key in list(self._sessions):
+            await self._drop(key)
+
+def command_segments(commands: list[dict]) -> list[tuple[str, dict]]:
+    """
+    Splits translated commands into (tool name, arguments) calls: each run of servo
+    commands becomes one execute_servo_commands batch, each macro invocation a run_macro call.
+    """
+    segments: list[tuple[str, dict]] = []
+    for item in commands:
+        if "macro" in item:
+            segments.append(("run_macro", {"name": item["macro"], "speed_scale": item.get("speed_scale", 1.0),
+                                           "repeat": item.get("repeat", 1)}))
+        elif segments and segments[-1][0] == "execute_servo_commands":
+            segments[-1][1]["commands"].append(item)
+        else:
+            segments.append(("execute_servo_commands", {"commands": [item]}))
+    return segments
+
+class TranslationCache:
+    """
+    Cache of natural-language command -> servo command list translations.
+    Entries are keyed on the normalized user command, a hash of the Gemini prompt
+    template and the model name, so editing the prompt or switching models never
+    serves stale translations. A bounded in-memory LRU sits in front of a JSON file
+    that survives restarts; both evict by age (ttl_seconds) and by size.
+    """
+    def __init__(self, path, max_memory_entries=256, max_disk_entries=2000, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, dict] = OrderedDict()
+        self._disk: dict[str, dict] = {}
+        self._lock = threading.Lock() # Lookups run on the asyncio thread, invalidation on the Tk thread
+        self._load()
+
+    @staticmethod
+    def normalize(user_command: str) -> str:
+        return " ".join(user_command.lower().split())
+
+    @classmethod
+    def make_key(cls, user_command: str, prompt_template: str, model_name: str) -> str:
+        template_hash = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()[:16]
+        return f"{model_name}|{template_hash}|{cls.normalize(user_command)}"
+
+    def get(self, key: str) -> list[dict] | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                entry = self._disk.get(key)
+            if entry is not None and now - entry["created"] > self.ttl_seconds:
+                self._memory.pop(key, None)
+                self._disk.pop(key, None)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["last_used"] = now
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            self._trim_memory()
+            return entry["commands"]
+
+    def contains(self, key: str) -> bool:
+        """Whether key has a fresh entry; unlike get, this leaves the hit/miss counters and LRU order alone."""
+        with self._lock:
+            entry = self._memory.get(key) or self._disk.get(key)
+            return entry is not None and time.time() - entry["created"] <= self.ttl_seconds
+
+    def put(self, key: str, commands: list[dict]) -> None:
+        now = time.time()
+        with self._lock:
+            entry = {"commands": commands, "created": now, "last_used": now}
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            self._trim_memory()
+            self._disk[key] = entry
+            self._save()
+
+    def invalidate(self, key: str) -> bool:
+        """Removes a single entry. Returns True if it was cached."""
+        with self._lock:
+            found = self._memory.pop(key, None) is not None
+            found = self._disk.pop(key, None) is not None or found
+            if found:
+                self._save()
+            return found
+
+    def stats(self) -> str:
+        return f"hits={self.hits}, misses={self.misses}, memory={len(self._memory)}, disk={len(self._disk)}"
+
+    def _trim_memory(self) -> None:
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable translation cache {self.path}: {e}")
+            return
+        now = time.time()
+        self._disk = {key: entry for key, entry in data.items()
+                      if isinstance(entry, dict) and now - entry.get("created", 0) <= self.ttl_seconds}
+
+    def _save(self) -> None:
+        # Size-based eviction: keep the most recently used entries
+        if len(self._disk) > self.max_disk_entries:
+            keep = sorted(self._disk.items(), key=lambda item: item[1]["last_used"], reverse=True)[:self.max_disk_entries]
+            self._disk = dict(keep)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._disk, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Failed to write translation cache {self.path}: {e}")
+
+def validate_gemini_command(item) -> None:
+    """
+    Raises ValueError if a translated command is neither a dict with at least pin and
+    angle nor a macro invocation ({"macro": name, "speed_scale": ..., "repeat": ...}).
+    """
+    if isinstance(item, dict) and isinstance(item.get("macro"), str):
+        return
+    if not isinstance(item, dict) or "pin" not in item or "angle" not in item:
+        raise ValueError("Invalid item in Gemini JSON list response.")
+
+def parse_gemini_response(raw_text: str) -> list[dict]:
+    """
+    Parses Gemini's reply, with or without a ```json fence, into a list of validated
+    commands. Raises json.JSONDecodeError or ValueError.
+    """
+    text = raw_text.strip()
+    if text.startswith("```json"):
+        text = text[7:] # Remove ```json
+    if text.endswith("```"):
+        text = text[:-3] # Remove ```
+    parsed_json = json.loads(text.strip())
+    if not isinstance(parsed_json, list):
+        raise ValueError("Gemini response is not a JSON list.")
+    for item in parsed_json:
+        validate_gemini_command(item)
+    return parsed_json
+
+def gemini_prompt(user_text_input: str, macros: list[dict] = (), structured: bool = False) -> str:
+    """
+    The full prompt for a translation. In structured mode the system instruction is sent
+    separately, but it is part of what identifies a translation (cache key, speculation),
+    so it is included here.
+    """
+    if structured:
+        return f"{STRUCTURED_SYSTEM_INSTRUCTION}\n{build_structured_request(user_text_input, macros)}"
+    return build_gemini_prompt(user_text_input, macros)
+
+def gemini_request(user_text_input: str, macros: list[dict] = (), structured: bool = False) -> tuple[str, str, dict | None]:
+    """(prompt mode, contents, generation config) of a translation; the mode is "structured" or "prompt"."""
+    if structured:
+        return "structured", build_structured_request(user_text_input, macros), generation_config([m["name"] for m in macros])
+    return "prompt", build_gemini_prompt(user_text_input, macros), None
+
+def parse_gemini_output(mode: str, raw_text: str, macros: list[dict] = ()) -> list[dict]:
+    """Parses a complete reply; structured replies are validated against the command model. Raises ValueError."""
+    if mode == "structured":
+        return validate_commands(json.loads(raw_text), [m["name"] for m in macros])
+    return parse_gemini_response(raw_text)
+
+class GeminiUsage:
+    """Calls, token counts and parse failures of Gemini translations, per prompt mode."""
+    def __init__(self):
+        self.modes: dict[str, dict] = {}
+
+    def record(self, mode: str, response=None, parse_failed: bool = False) -> dict:
+        """Counts one call (and its tokens, if the response has usage metadata); returns the mode's totals."""
+        stats = self.stats(mode)
+        stats["calls"] += 1
+        stats["parse_failures"] += parse_failed
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            stats["prompt_tokens"] += usage.prompt_token_count
+            stats["cached_tokens"] += usage.cached_content_token_count
+            stats["output_tokens"] += usage.candidates_token_count
+        return stats
+
+    def stats(self, mode: str) -> dict:
+        return self.modes.setdefault(mode, {"calls": 0, "parse_failures": 0, "prompt_tokens": 0,
+                                            "cached_tokens": 0, "output_tokens": 0})
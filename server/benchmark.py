@@ -0,0 +1,192 @@
+"""
+Latency benchmark for the Servo MCP Server.
+
+Starts the server in-process on localhost with the simulated backend, drives it
+over MCP (streamable HTTP) and measures:
+  - tool-call throughput (calls per second),
+  - end-to-end tool-call latency percentiles,
+  - scheduling jitter (actual vs. requested duration_ms, taken from the pulse-width
+    changes recorded by the simulated driver) for the asyncio and compiled paths,
+  - wall-clock time of a six-servo pose in each execution mode.
+
+The numbers are written to a JSON report so releases can be compared:
+    python benchmark.py --output bench_report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+from metrics import percentile
+
+JITTER_DURATIONS_MS = [10, 50, 100, 250]
+JITTER_PIN = 23
+POSE_PINS = [17, 27, 22, 23, 24, 25]
+
+
+def summarize(values: list[float]) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) if ordered else None,
+        "min": ordered[0] if ordered else None,
+        "p50": percentile(ordered, 50),
+        "p90": percentile(ordered, 90),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99),
+        "max": ordered[-1] if ordered else None,
+    }
+
+
+def start_server(host: str, port: int, timeout: float = 15.0):
+    """Imports the server with the simulated backend and runs it on a background thread."""
+    os.environ["SERVO_BACKEND"] = "sim"
+    import server
+
+    def run():
+        asyncio.run(server.mcp.run_async(transport="streamable-http", host=host, port=port, log_level="warning"))
+
+    threading.Thread(target=run, daemon=True).start()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return server
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start listening on {host}:{port} within {timeout}s")
+
+
+def free_port(host: str) -> int:
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+async def call(session: ClientSession, commands: list[dict], mode: str = "sequential") -> list[dict]:
+    result = await session.call_tool("execute_servo_commands", {"commands": commands, "mode": mode})
+    return json.loads(result.content[0].text)
+
+
+async def bench_throughput(session: ClientSession, calls: int, concurrency: int) -> tuple[dict, dict]:
+    """Zero-duration single-command calls; returns (throughput, latency) sections."""
+    latencies_ms = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(calls):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            t0 = time.perf_counter()
+            results = await call(session, [{"pin": POSE_PINS[i % len(POSE_PINS)], "angle": 10, "duration_ms": 0}])
+            latencies_ms.append((time.perf_counter() - t0) * 1000.0)
+            errors += sum(1 for r in results if r.get("status") != "ok")
+
+    t_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t_start
+    throughput = {"calls": calls, "concurrency": concurrency, "elapsed_s": elapsed,
+                  "calls_per_s": calls / elapsed, "command_errors": errors}
+    return throughput, summarize(latencies_ms)
+
+
+async def bench_jitter(session: ClientSession, backend, repeats: int, mode: str = "sequential") -> dict:
+    """Measures actual hold time (pulse on -> pulse off) against the requested duration_ms."""
+    per_duration = {}
+    all_jitter = []
+    for duration_ms in JITTER_DURATIONS_MS:
+        jitter = []
+        for _ in range(repeats):
+            backend.take_events()
+            await call(session, [{"pin": JITTER_PIN, "angle": 90, "duration_ms": duration_ms}], mode=mode)
+            events = [e for e in backend.take_events() if e[1] == JITTER_PIN]
+            on = next((t for t, _, width in events if width > 0), None)
+            off = next((t for t, _, width in events if width == 0), None)
+            if on is not None and off is not None:
+                jitter.append((off - on) * 1000.0 - duration_ms)
+        per_duration[str(duration_ms)] = summarize(jitter)
+        all_jitter.extend(jitter)
+    return {"per_requested_duration_ms": per_duration, "overall": summarize(all_jitter)}
+
+
+async def bench_pose(session: ClientSession, hold_ms: int) -> dict:
+    """Wall-clock time of one command per pose pin, in each execution mode."""
+    commands = [{"pin": pin, "angle": 30, "duration_ms": hold_ms} for pin in POSE_PINS]
+    report = {"hold_ms": hold_ms, "pins": len(POSE_PINS)}
+    for mode in ("sequential", "timeline", "compiled"):
+        t0 = time.perf_counter()
+        await call(session, commands, mode=mode)
+        report[f"{mode}_ms"] = (time.perf_counter() - t0) * 1000.0
+    return report
+
+
+async def run_benchmarks(args, backend) -> dict:
+    url = f"http://{args.host}:{args.port}/mcp"
+    async with streamablehttp_client(url) as (read_stream, write_stream, _response_future):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            await call(session, [{"pin": JITTER_PIN, "angle": 0, "duration_ms": 0}]) # Warm-up
+            throughput, latency = await bench_throughput(session, args.calls, args.concurrency)
+            jitter = await bench_jitter(session, backend, args.repeats)
+            compiled_jitter = await bench_jitter(session, backend, args.repeats, mode="compiled")
+            pose = await bench_pose(session, args.pose_hold_ms)
+    return {"throughput": throughput, "latency_ms": latency, "jitter_ms": jitter,
+            "compiled_jitter_ms": compiled_jitter, "pose": pose}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Servo MCP Server with the simulated backend.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="Port to serve on (default: a free port)")
+    parser.add_argument("--calls", type=int, default=200, help="Tool calls for the throughput/latency run")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent in-flight calls for the throughput run")
+    parser.add_argument("--repeats", type=int, default=10, help="Repeats per requested duration for the jitter run")
+    parser.add_argument("--pose-hold-ms", type=int, default=100, help="Hold time per servo in the pose run")
+    parser.add_argument("--sim-latency-ms", type=float, default=0.0, help="Simulated per-call driver latency")
+    parser.add_argument("--output", default="bench_report.json", help="Path of the JSON report ('-' for stdout only)")
+    args = parser.parse_args()
+    if args.port == 0:
+        args.port = free_port(args.host)
+
+    os.environ["SIM_LATENCY_MS"] = str(args.sim_latency_ms)
+    server = start_server(args.host, args.port)
+    results = asyncio.run(run_benchmarks(args, server.backend))
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "backend": {"name": server.backend.name, "latency_ms": args.sim_latency_ms},
+        "config": {"calls": args.calls, "concurrency": args.concurrency, "repeats": args.repeats,
+                   "jitter_durations_ms": JITTER_DURATIONS_MS},
+        **results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Report written to {args.output}")
+
+    latency = report["latency_ms"]
+    print(f"Throughput: {report['throughput']['calls_per_s']:.1f} calls/s")
+    print(f"Latency: p50 {latency['p50']:.2f} ms, p95 {latency['p95']:.2f} ms, p99 {latency['p99']:.2f} ms")
+    print(f"Jitter: p50 {report['jitter_ms']['overall']['p50']:.2f} ms, p99 {report['jitter_ms']['overall']['p99']:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in milliseconds (Prometheus "le" labels)
+DEFAULT_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+RECENT_SAMPLES = 2048 # Samples kept per histogram for the percentile summaries
+
+
+def percentile(sorted_values: list[float], pct: float) -> float | None:
+    """Linear-interpolated percentile of an already sorted list; None if it is empty."""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def _label_key(labels: dict) -> tuple:
+    # Label values are stored as strings so series with e.g. pin=None still sort
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """
+    Cumulative bucket counts for the Prometheus export, plus a bounded window of recent
+    samples for p50/p95/p99. Values may be negative (e.g. hold-time errors); those
+    fall into the lowest bucket.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+        self._recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+        self._recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def summary(self) -> dict:
+        recent = sorted(self._recent)
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": percentile(recent, 50),
+            "p95": percentile(recent, 95),
+            "p99": percentile(recent, 99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """Named histograms and counters with optional labels, safe to update from any thread."""
+    def __init__(self, prefix: str = "servo"):
+        self.prefix = prefix
+        self.started_at = time.time()
+        self._histograms: dict[tuple[str, tuple], Histogram] = {}
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observes the duration of the with-block in milliseconds."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - t0) * 1000.0, **labels)
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view: histogram summaries and counters, each as a list of labelled series."""
+        with self._lock:
+            histograms = {}
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                histograms.setdefault(name, []).append({"labels": dict(labels), **histogram.summary()})
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return {"uptime_s": round(time.time() - self.started_at, 3), "histograms": histograms, "counters": counters}
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        def fmt_labels(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in (*labels, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = f"{self.prefix}_{name}"
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} counter")
+                    seen.add(metric)
+                lines.append(f"{metric}{fmt_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                metric = f"{self.prefix}_{name}"
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} histogram")
+                    seen.add(metric)
+                for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                    lines.append(f"{metric}_bucket{fmt_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{metric}_bucket{fmt_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{metric}_sum{fmt_labels(labels)} {histogram.sum}")
+                lines.append(f"{metric}_count{fmt_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,131 @@
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+# File layout: a 32-byte header followed by fixed-width little-endian records.
+# Header: magic, format version, record size, wall-clock start (Unix s), record
+# count and a bit mask of the pins used. The count and mask are written when the
+# recording is closed; a file that was never closed has them at 0 and they are
+# recovered from its size and records when it is opened.
+MAGIC = b"WREC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHdQI4x")
+# One pulse-width change: time since the recording started, pin, and pulse width (0 = pulses stopped)
+RECORD_DTYPE = np.dtype([("t_us", "<u8"), ("pin", "u1"), ("flags", "u1"), ("pulse_width", "<u2")])
+FILE_EXTENSION = ".wrec"
+BUFFER_RECORDS = 4096 # Records buffered in memory before they are appended to the file
+CHUNK_RECORDS = 4096 # Records read at a time from a memory-mapped recording
+
+
+class RecordingError(Exception):
+    """Raised for unreadable or invalid recording files."""
+
+
+def _pin_mask(pins) -> int:
+    mask = 0
+    for pin in pins:
+        mask |= 1 << int(pin)
+    return mask
+
+
+def _mask_pins(mask: int) -> list[int]:
+    return [pin for pin in range(32) if mask & (1 << pin)]
+
+
+class Recorder:
+    """
+    Appends pulse-width changes to a recording file. Records go into a preallocated
+    array and are written out whenever it fills, so memory use stays constant for
+    recordings of any length. Safe to call from any thread.
+    """
+    def __init__(self, path: str, buffer_records: int = BUFFER_RECORDS):
+        self.path = path
+        self.name = os.path.basename(path)[:-len(FILE_EXTENSION)]
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self._buffer = np.zeros(buffer_records, dtype=RECORD_DTYPE)
+        self._buffered = 0
+        self.count = 0
+        self._mask = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "xb") # Never overwrite an existing recording
+        self._file.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD_DTYPE.itemsize, self.started_at, 0, 0))
+
+    def record(self, pin: int, pulse_width: int, at: float | None = None) -> None:
+        """Adds a change made at monotonic time at (default: now)."""
+        t_us = max(0, int(((time.monotonic() if at is None else at) - self._start) * 1e6))
+        with self._lock:
+            if self._file is None:
+                return
+            self._buffer[self._buffered] = (t_us, pin, 0, pulse_width)
+            self._buffered += 1
+            self.count += 1
+            self._mask |= 1 << pin
+            if self._buffered == len(self._buffer):
+                self._flush()
+
+    def _flush(self) -> None:
+        # Changes recorded out of order (e.g. waveform frames stamped after playback)
+        # are sorted within the buffer; replay also tolerates small inversions
+        block = np.sort(self._buffer[:self._buffered], order="t_us", kind="stable")
+        self._file.write(block.tobytes())
+        self._buffered = 0
+
+    def close(self) -> dict:
+        """Flushes the remaining records, completes the header and returns the recording info."""
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                self._file.seek(0)
+                self._file.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD_DTYPE.itemsize, self.started_at, self.count, self._mask))
+                self._file.close()
+                self._file = None
+        return read_info(self.path)
+
+
+def _read_header(path: str) -> tuple[float, int, int, int]:
+    """Returns (started_at, record count, pin mask, file size); recovers the count and mask of unclosed files."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise RecordingError(f"{os.path.basename(path)} is too short for a recording header.")
+    magic, version, record_size, started_at, count, mask = HEADER.unpack(raw)
+    if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise RecordingError(f"{os.path.basename(path)} is not a version {FORMAT_VERSION} recording.")
+    available = (size - HEADER.size) // RECORD_DTYPE.itemsize
+    if count == 0 and available > 0:
+        count = available
+        records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+        for i in range(0, count, CHUNK_RECORDS):
+            mask |= _pin_mask(np.unique(records["pin"][i:i + CHUNK_RECORDS]))
+    elif count > available:
+        raise RecordingError(f"{os.path.basename(path)} is truncated ({available} of {count} records).")
+    return started_at, count, mask, size
+
+
+def read_info(path: str) -> dict:
+    """Name, size, record count, pins, duration and start time of a recording file."""
+    started_at, count, mask, size = _read_header(path)
+    duration_ms = 0.0
+    if count:
+        last = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,))[count - 1]
+        duration_ms = round(int(last["t_us"]) / 1000.0, 3)
+    return {"name": os.path.basename(path)[:-len(FILE_EXTENSION)], "size_bytes": size, "records": count,
+            "pins": _mask_pins(mask), "duration_ms": duration_ms, "started_at": started_at}
+
+
+def iter_chunks(path: str, chunk_records: int = CHUNK_RECORDS):
+    """
+    Yields the records of a recording as arrays of at most chunk_records, read through
+    a memory map so only the chunk being replayed is resident.
+    """
+    _, count, _, _ = _read_header(path)
+    if count == 0:
+        return
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+    for i in range(0, count, chunk_records):
+        yield np.array(records[i:i + chunk_records])
@@ -1,19 +1,37 @@
+import argparse
 import asyncio
-import pigpio
+import base64
+import itertools
+import json
+import math
+import os
+import re
+import time
+import uuid
+import numpy as np
 from fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
 
-# Initialize pigpio
-try:
-    pi = pigpio.pi()
-except Exception as e:
-    print(f"Failed to connect to pigpio daemon: {e}")
-    print("Please ensure pigpiod is running (e.g., sudo systemctl start pigpiod)")
-    # In a real application, you might want to exit or handle this more gracefully
-    # For now, we'll let it proceed, but tool calls will likely fail.
-    pi = None
+from metrics import MetricsRegistry
+from recording import FILE_EXTENSION, Recorder, RecordingError, iter_chunks, read_info
+from servo_backends import SERVO_FRAME_US, ActuationWorker, ServoBackend, ServoBackendError, create_backend
+
+# Initialize the servo backend (pigpio by default, SERVO_BACKEND=sim for the simulated driver).
+# If pigpiod is not reachable we still start, but tool calls will report errors.
+backend: ServoBackend = create_backend()
 
 
 mcp = FastMCP("ServoController")
+metrics = MetricsRegistry()
+
+def _observe_batch(writes: list[tuple[int, int]], elapsed_ms: float) -> None:
+    metrics.observe("actuation_batch_size", len(writes))
+    metrics.observe("actuation_batch_ms", elapsed_ms)
+
+# Servo writes run on the actuation thread, batched per event-loop iteration, and a
+# lost pigpiod connection is re-established there with backoff
+actuator = ActuationWorker(backend, on_batch=_observe_batch)
 
 ALLOWED_PINS = {17, 27, 22, 23, 24, 25}
 PINS_WITH_ANGLE_CAP = {17, 27, 22}
@@ -22,89 +40,1419 @@ MIN_PULSE_WIDTH = 500
 MAX_PULSE_WIDTH = 2500
 MIN_ANGLE = 0.0
 MAX_ANGLE = 180.0
+DEFAULT_DURATION_MS = 500
+EXECUTION_MODES = {"sequential", "timeline", "compiled"}
+TRAJECTORY_PROFILES = {"trapezoidal", "cubic"}
+DEFAULT_MAX_VELOCITY_DPS = 180.0 # deg/s
+DEFAULT_MAX_ACCELERATION_DPS2 = 720.0 # deg/s^2
+MAX_CONTROL_RATE_HZ = 200.0
+MAX_TRAJECTORY_MS = 600000 # Longest trajectory, after stretching to the velocity and acceleration limits
+JOB_POLICIES = {"fifo", "preempt", "reject"}
+MAX_FINISHED_JOBS = 100 # Finished jobs kept for get_job_status/list_jobs
+STREAM_IDLE_TIMEOUT_S = 30.0 # Streams with no new commands for this long are closed
+MACROS_FILE = os.environ.get("MACROS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "macros.json"))
+MACRO_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+MAX_MACRO_REPEAT = 100
+MAX_SPEED_SCALE = 10.0
+MAX_START_AT_DELAY_S = 60.0 # How far in the future a scheduled start_at may be
+RECORDINGS_DIR = os.environ.get("RECORDINGS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings"))
+MAX_DOWNLOAD_CHUNK = 1 << 20 # Bytes returned per download_recording call
 
 def angle_to_pulsewidth(angle: float) -> int:
     """Converts an angle in degrees to a servo pulse width in microseconds."""
     return int(MIN_PULSE_WIDTH + (angle / MAX_ANGLE) * (MAX_PULSE_WIDTH - MIN_PULSE_WIDTH))
 
+def pulsewidth_to_angle(pulse_width: int) -> float:
+    """Inverse of angle_to_pulsewidth (up to its truncation)."""
+    return (pulse_width - MIN_PULSE_WIDTH) / (MAX_PULSE_WIDTH - MIN_PULSE_WIDTH) * MAX_ANGLE
+
+# Last commanded position of each pin written so far: angle, pulse width, whether the
+# pulse is still being applied ("active") and when it last changed. Every servo write
+# goes through _write_pulse so the table always matches the outputs.
+servo_state: dict[int, dict] = {}
+# Pins that keep their pulse after a command (see set_servo_hold); a command's own
+# "hold" field overrides this
+hold_pins: set[int] = set()
+# Active recording (see start_recording); every write that reaches the backend is appended to
+# it (writes the actuation worker replaced with a later one for the same pin never do)
+_recording: Recorder | None = None
+# actuator reconnects already reflected in servo_state (a restarted daemon has stopped all pulses)
+_seen_reconnects = 0
+
+def _record_state(pin: int, pulse_width: int, angle: float | None = None, active: bool = True) -> None:
+    state = servo_state.setdefault(pin, {"angle": None, "pulse_width": None, "active": False, "updated_at": None})
+    if pulse_width:
+        state.update(pulse_width=pulse_width, active=active,
+                     angle=angle if angle is not None else round(pulsewidth_to_angle(pulse_width), 2))
+    else:
+        state["active"] = False
+    state["updated_at"] = time.time()
+
+async def _write_pulse(pin: int, pulse_width: int, angle: float | None = None, force: bool = False) -> bool:
+    """
+    Sets a pin's pulse width (0 stops the pulses) and records it in servo_state.
+    Writes that would not change the output, i.e. the same pulse width is already
+    active or the pulses are already stopped, are skipped unless force is set.
+    Writes issued in the same event-loop iteration (e.g. gathered) reach the
+    backend as one batch; a write replaced there by a later one for the same pin is
+    neither recorded nor counted. Returns whether the write reached the backend;
+    raises ServoBackendError.
+    """
+    global _seen_reconnects
+    if actuator.stats["reconnects"] != _seen_reconnects:
+        _seen_reconnects = actuator.stats["reconnects"]
+        for state in servo_state.values():
+            state["active"] = False
+    state = servo_state.get(pin)
+    if state is not None and not force:
+        current = state["pulse_width"] if state["active"] else 0
+        if pulse_width == current:
+            metrics.inc("pulse_writes_skipped_total", pin=pin)
+            return False
+    with metrics.timer("backend_call_ms", pin=pin):
+        applied_at = await actuator.write([(pin, pulse_width)])
+    if applied_at is None:
+        metrics.inc("pulse_writes_superseded_total", pin=pin)
+        return False
+    metrics.inc("pulse_writes_total", pin=pin)
+    if _recording is not None:
+        _recording.record(pin, pulse_width, at=applied_at)
+    _record_state(pin, pulse_width, angle)
+    return True
+
+def _hold_for(pin: int, hold: bool | None) -> bool:
+    """Whether a command keeps its pulse: its own "hold" field, else the pin's setting."""
+    return hold if hold is not None else pin in hold_pins
+
+def _prepare_command(cmd: dict) -> tuple[dict, int | None]:
+    """Validates a command like _validate_command, recording the validation time."""
+    with metrics.timer("validation_ms"):
+        return _validate_command(cmd)
+
+def _validate_command(cmd: dict) -> tuple[dict, int | None]:
+    """
+    Validates a single command dict.
+    Returns the status dict for the command and the pulse width to apply,
+    or None as the pulse width if the command is invalid (status is already filled in).
+    """
+    pin = cmd.get("pin")
+    angle = cmd.get("angle")
+    status = {"pin": pin}
+
+    # Validate pin
+    if pin not in ALLOWED_PINS:
+        status.update(status="error", message=f"Invalid pin {pin}. Allowed pins are {ALLOWED_PINS}.")
+        return status, None
+
+    # Validate hold flag
+    if not isinstance(cmd.get("hold", False), bool):
+        status.update(status="error", message=f"Invalid hold {cmd.get('hold')} for pin {pin}. Hold must be true or false.")
+        return status, None
+
+    # Validate angle type
+    if isinstance(angle, bool) or not isinstance(angle, (int, float)):
+        status.update(status="error", message=f"Invalid angle type for pin {pin}. Angle must be a number.")
+        return status, None
+
+    # Validate angle range
+    if not (MIN_ANGLE <= angle <= MAX_ANGLE):
+        status.update(status="error", message=f"Invalid angle {angle} for pin {pin}. Angle must be between {MIN_ANGLE} and {MAX_ANGLE} degrees.")
+        return status, None
+
+    # Validate duration
+    duration_ms = cmd.get("duration_ms", DEFAULT_DURATION_MS)
+    if not _is_non_negative(duration_ms):
+        status.update(status="error", message=f"Invalid duration_ms {duration_ms!r} for pin {pin}. Must be a non-negative number.")
+        return status, None
+
+    # Cap angle for specific pins
+    original_angle = angle
+    if pin in PINS_WITH_ANGLE_CAP and angle > MAX_ANGLE_FOR_CAPPED_PINS:
+        angle = MAX_ANGLE_FOR_CAPPED_PINS
+        status["message"] = f"Angle {original_angle}° for pin {pin} was capped to {MAX_ANGLE_FOR_CAPPED_PINS}°."
+    status["angle"] = angle
+
+    return status, angle_to_pulsewidth(angle)
+
+def _is_non_negative(value) -> bool:
+    """Whether value is a finite, non-negative number (bools are not numbers here)."""
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and 0 <= value < math.inf
+
+def _timeline_error(cmd: dict, pin: int) -> str | None:
+    """Checks a command's timeline fields (start_ms, group); returns the error message, or None if they are valid."""
+    start_ms = cmd.get("start_ms", 0)
+    group = cmd.get("group", 0)
+    if not _is_non_negative(start_ms):
+        return f"Invalid start_ms {start_ms!r} for pin {pin}. Must be a non-negative number."
+    if isinstance(group, bool) or not isinstance(group, int):
+        return f"Invalid group {group!r} for pin {pin}. Group must be an integer."
+    return None
+
+async def _run_command(pin: int, pulse_width: int, duration_ms: float, status: dict, keep_pulse: bool = False) -> None:
+    """
+    Drives a servo to the given pulse width and holds it for duration_ms, then stops
+    the pulses unless keep_pulse is set (hold mode, or the pin's next command follows
+    immediately). A move to the pulse width already being applied writes nothing.
+    """
+    try:
+        await _write_pulse(pin, pulse_width, status.get("angle"))
+        hold_start = time.perf_counter()
+        await asyncio.sleep(duration_ms / 1000.0)
+        if not keep_pulse:
+            await _write_pulse(pin, 0)  # Stop sending pulses to the servo
+            # Actual hold (pulse applied -> pulse stopped) minus the requested duration
+            metrics.observe("hold_error_ms", (time.perf_counter() - hold_start) * 1000.0 - duration_ms, pin=pin)
+        status["status"] = "ok"
+        if "message" not in status: # If no capping message, confirm original angle
+             status["message"] = f"Servo on pin {pin} moved to {status['angle']}°."
+    except ServoBackendError as e:
+        status.update(status="error", message=f"{backend.name} error for pin {pin}: {str(e)}")
+    except Exception as e:
+        status.update(status="error", message=f"Unexpected error for pin {pin}: {str(e)}")
+
+def _compile_timeline(commands: list[dict], results: list[dict | None]) -> dict[int, dict[int, list[tuple]]]:
+    """
+    Compiles a batch into a per-group, per-pin timeline for the "timeline" execution mode.
+    Returns {group: {pin: [(index, pulse_width, duration_ms, start_ms, hold), ...]}} with
+    each pin chain kept in the original command order. Invalid commands get their
+    error status written into results and are left out of the timeline.
+    """
+    timeline: dict[int, dict[int, list[tuple]]] = {}
+    for idx, cmd in enumerate(commands):
+        status, pulse_width = _prepare_command(cmd)
+        if pulse_width is None:
+            results[idx] = status
+            continue
+
+        error = _timeline_error(cmd, status["pin"])
+        results[idx] = status
+        if error is not None:
+            status.update(status="error", message=error)
+            continue
+
+        duration_ms = cmd.get("duration_ms", DEFAULT_DURATION_MS)
+        timeline.setdefault(cmd.get("group", 0), {}).setdefault(status["pin"], []).append(
+            (idx, pulse_width, duration_ms, cmd.get("start_ms", 0), cmd.get("hold")))
+    return timeline
+
+async def _run_pin_chain(pin: int, chain: list[tuple], results: list[dict], group_start: float) -> None:
+    """
+    Runs one pin's commands in order, honouring each command's start_ms offset from the
+    group start. The pulse is kept between commands when the next one is due right away.
+    """
+    loop = asyncio.get_running_loop()
+    nominal_end = 0.0 # Planned end of the current command, in ms after the group start
+    for k, (idx, pulse_width, duration_ms, start_ms, hold) in enumerate(chain):
+        delay = group_start + start_ms / 1000.0 - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        nominal_end = max(nominal_end, start_ms) + duration_ms
+        follows = k + 1 < len(chain) and chain[k + 1][3] <= nominal_end
+        await _run_command(pin, pulse_width, duration_ms, results[idx], keep_pulse=_hold_for(pin, hold) or follows)
+
+async def _run_sequence(steps: list[tuple[int, int, float, bool | None, dict]]) -> None:
+    """
+    Runs (pin, pulse_width, duration_ms, hold, status) steps one after another. A pin
+    whose next step follows immediately keeps its pulse in between instead of being
+    stopped and driven again, and a step to the pulse width already applied writes
+    nothing, so a run of identical moves costs a single write.
+    """
+    for k, (pin, pulse_width, duration_ms, hold, status) in enumerate(steps):
+        follows = k + 1 < len(steps) and steps[k + 1][0] == pin
+        await _run_command(pin, pulse_width, duration_ms, status, keep_pulse=_hold_for(pin, hold) or follows)
+
+async def _run_compiled(commands: list[dict]) -> list[dict]:
+    """
+    "compiled" execution mode: the batch is turned into hardware-timed servo frames
+    (pigpio DMA waveforms) and played with one trigger, instead of asyncio.sleep plus
+    a separate stop call per command. Commands run in order, one after another; hold
+    times are rounded to whole 20 ms servo frames (at least one frame). Pins whose
+    last command holds get their pulse back once the playback is over.
+    """
+    results = []
+    segments = []
+    scheduled = [] # (status, frames) of the commands that will be played
+    holds = {} # pin -> whether its last command holds
+    for cmd in commands:
+        status, pulse_width = _prepare_command(cmd)
+        results.append(status)
+        if pulse_width is None:
+            continue
+        duration_ms = cmd.get("duration_ms", DEFAULT_DURATION_MS)
+        frames = _duration_to_frames(duration_ms)
+        segments.append((status["pin"], pulse_width, frames))
+        scheduled.append((status, frames))
+        holds[status["pin"]] = _hold_for(status["pin"], cmd.get("hold"))
+
+    if segments:
+        await _play_compiled(segments, scheduled, {pin for pin, hold in holds.items() if hold})
+    return results
+
+def _duration_to_frames(duration_ms: float) -> int:
+    return max(1, int(duration_ms * 1000 / SERVO_FRAME_US + 0.5)) # Nearest frame, halves round up
+
+async def _play_compiled(segments: list[tuple[int, int, int]], scheduled: list[tuple[dict, int]],
+                         hold_at_end: set[int] = frozenset()) -> None:
+    """
+    Plays validated segments as waveforms and fills in the (status, frames) entries of
+    scheduled. Consecutive segments with the same pin and pulse width are merged into
+    one; the pins in hold_at_end are driven at their final pulse width afterwards.
+    """
+    merged = []
+    for pin, pulse_width, frames in segments:
+        if merged and merged[-1][:2] == (pin, pulse_width):
+            merged[-1] = (pin, pulse_width, merged[-1][2] + frames)
+        else:
+            merged.append((pin, pulse_width, frames))
+
+    call_start = time.monotonic()
+    try:
+        start, end = await asyncio.to_thread(backend.play_frames, merged)
+        if _recording is not None:
+            _record_frames(merged, start)
+        # Playback leaves every pin without pulses
+        for (pin, pulse_width, _), (status, _) in zip(segments, scheduled):
+            _record_state(pin, pulse_width, status["angle"], active=False)
+        await asyncio.gather(*(_write_pulse(pin, servo_state[pin]["pulse_width"], servo_state[pin]["angle"], force=True)
+                               for pin in hold_at_end))
+    except ServoBackendError as e:
+        for status, _ in scheduled:
+            status.update(status="error", message=f"{backend.name} waveform error for pin {status['pin']}: {str(e)}")
+        return
+    except Exception as e:
+        for status, _ in scheduled:
+            status.update(status="error", message=f"Unexpected waveform error for pin {status['pin']}: {str(e)}")
+        return
+
+    # The hardware schedule is exact, so each command's times are the measured start
+    # plus its frame offset; the end of the last command is the measured end.
+    offset_ms = (start - call_start) * 1000.0
+    for status, frames in scheduled:
+        status["status"] = "ok"
+        if "message" not in status:
+            status["message"] = f"Servo on pin {status['pin']} moved to {status['angle']}°."
+        status["start_ms"] = round(offset_ms, 3)
+        offset_ms += frames * SERVO_FRAME_US / 1000.0
+        status["end_ms"] = round(offset_ms, 3)
+    scheduled[-1][0]["end_ms"] = round((end - call_start) * 1000.0, 3)
+
+def _record_frames(segments: list[tuple[int, int, int]], start: float) -> None:
+    """Adds played waveform segments to the active recording at their hardware-timed start and stop times."""
+    offset = start
+    for i, (pin, pulse_width, frames) in enumerate(segments):
+        _recording.record(pin, pulse_width, at=offset)
+        offset += frames * SERVO_FRAME_US / 1e6
+        if i + 1 == len(segments) or segments[i + 1][0] != pin: # The next segment drives another pin
+            _recording.record(pin, 0, at=offset)
+
+def _check_start_at(start_at: float | None) -> str | None:
+    """Returns an error message if start_at is not a usable server timestamp, else None."""
+    if start_at is None:
+        return None
+    if not isinstance(start_at, (int, float)):
+        return f"Invalid start_at {start_at}. Must be a Unix timestamp in seconds (server clock)."
+    if start_at - time.time() > MAX_START_AT_DELAY_S:
+        return f"start_at is more than {MAX_START_AT_DELAY_S:.0f}s in the future."
+    return None
+
+async def _wait_for_start(start_at: float | None) -> float | None:
+    """
+    Sleeps until the server's wall-clock time reaches start_at (time.time() seconds).
+    Returns how late the start was in ms, or None without a start_at.
+    """
+    if start_at is None:
+        return None
+    delay = start_at - time.time()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    lag_ms = (time.time() - start_at) * 1000.0
+    metrics.observe("start_at_lag_ms", lag_ms)
+    return lag_ms
+
+async def _execute_batch(commands: list[dict], mode: str, start_at: float | None = None) -> list[dict]:
+    """
+    Runs a validated-mode batch on the servos and counts the per-pin outcomes. With a
+    start_at the batch waits for it once it owns its pins, and every status reports
+    start_lag_ms, the actual start minus start_at.
+    """
+    lag_ms = await _wait_for_start(start_at)
+    results = await _execute_batch_mode(commands, mode)
+    for status in results:
+        metrics.inc("commands_total", pin=status.get("pin"), status=status.get("status"))
+        if lag_ms is not None:
+            status["start_lag_ms"] = round(lag_ms, 3)
+    return results
+
+async def _execute_batch_mode(commands: list[dict], mode: str) -> list[dict]:
+    """Runs a batch in the given mode; see execute_servo_commands for the modes."""
+    if mode == "compiled":
+        return await _run_compiled(commands)
+
+    if mode == "timeline":
+        results = [None] * len(commands)
+        timeline = _compile_timeline(commands, results)
+        loop = asyncio.get_running_loop()
+        for group in sorted(timeline):
+            group_start = loop.time()
+            await asyncio.gather(*(
+                _run_pin_chain(pin, chain, results, group_start)
+                for pin, chain in timeline[group].items()
+            ))
+        return results
+
+    results = []
+    steps = []
+    for cmd in commands:
+        status, pulse_width = _prepare_command(cmd)
+        if pulse_width is not None:
+            steps.append((status["pin"], pulse_width, cmd.get("duration_ms", DEFAULT_DURATION_MS), cmd.get("hold"), status))
+        results.append(status)
+    await _run_sequence(steps)
+
+    return results
+
+def _check_batch(commands: list[dict], mode: str) -> list[dict] | None:
+    """Returns per-command error statuses if the batch cannot run at all, else None."""
+    if not backend.connected:
+        # Backend (pigpio daemon) not connected, return error for all commands
+        return [{"pin": cmd.get("pin"), "status": "error",
+                 "message": f"{backend.name} backend not connected. Cannot control servos."} for cmd in commands]
+    if mode not in EXECUTION_MODES:
+        return [{"pin": cmd.get("pin"), "status": "error",
+                 "message": f"Invalid mode '{mode}'. Allowed modes are {EXECUTION_MODES}."} for cmd in commands]
+    if mode == "compiled" and not backend.supports_waveforms:
+        return [{"pin": cmd.get("pin"), "status": "error",
+                 "message": f"The {backend.name} backend does not support compiled mode."} for cmd in commands]
+    return None
+
+def _command_pins(commands: list[dict]) -> set[int]:
+    return {cmd.get("pin") for cmd in commands if cmd.get("pin") in ALLOWED_PINS}
+
+class _MotionJob:
+    """A unit of servo work owned by the scheduler: the pins it drives and a coroutine factory that runs it."""
+    def __init__(self, kind: str, pins: set[int], runner, mode: str | None = None, size: int = 0):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.pins = pins
+        self.runner = runner
+        self.mode = mode
+        self.size = size
+        self.state = "queued" # queued -> running -> done | failed | cancelled; or rejected
+        self.message = ""
+        self.results = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task: asyncio.Task | None = None
+        self.finished = asyncio.Event()
+
+    def to_dict(self, include_results: bool = False) -> dict:
+        info = {"job_id": self.job_id, "kind": self.kind, "state": self.state, "pins": sorted(self.pins),
+                "mode": self.mode, "size": self.size, "message": self.message, "created_at": self.created_at,
+                "started_at": self.started_at, "finished_at": self.finished_at}
+        if include_results:
+            info["results"] = self.results
+        return info
+
+class _JobScheduler:
+    """
+    Arbitrates access to the servos. Every job claims the pins it drives and starts
+    only when none of them is owned by a running job or claimed by an earlier queued
+    job, so concurrent callers never interleave pulses on a pin. The policy decides
+    what happens to a job whose pins are busy: "fifo" waits its turn, "preempt"
+    cancels the jobs in its way and runs next, "reject" refuses it.
+    """
+    def __init__(self, policy: str):
+        self.policy = policy
+        self.jobs: dict[str, _MotionJob] = {}
+        self._queue: list[_MotionJob] = []
+        self._owners: dict[int, _MotionJob] = {}
+
+    def submit(self, job: _MotionJob, policy: str | None = None) -> _MotionJob:
+        policy = policy or self.policy
+        self.jobs[job.job_id] = job
+        blockers = [other for other in {*self._owners.values(), *self._queue} if other.pins & job.pins]
+        if blockers and policy == "reject":
+            busy = sorted(job.pins & set().union(*(other.pins for other in blockers)))
+            self._finish(job, "rejected", f"Pins {busy} are busy with job(s) {[other.job_id for other in blockers]}.")
+        elif blockers and policy == "preempt":
+            for other in blockers:
+                self.cancel(other, f"Preempted by job {job.job_id}.")
+            self._queue.insert(0, job)
+        else:
+            self._queue.append(job)
+        self._dispatch()
+        self._prune()
+        return job
+
+    def cancel(self, job: _MotionJob, message: str = "Cancelled.") -> bool:
+        """Cancels a queued or running job. Running jobs stop mid-sequence with their pins zeroed."""
+        if job.state == "queued":
+            self._queue.remove(job)
+            self._finish(job, "cancelled", message)
+            return True
+        if job.state == "running" and job.task is not None:
+            job.message = message
+            job.task.cancel()
+            return True
+        return False
+
+    def _dispatch(self) -> None:
+        claimed: set[int] = set() # Pins of earlier queued jobs, which later jobs must not overtake
+        for job in list(self._queue):
+            if not (job.pins & claimed) and not any(pin in self._owners for pin in job.pins):
+                self._queue.remove(job)
+                for pin in job.pins:
+                    self._owners[pin] = job
+                job.state = "running"
+                job.started_at = time.time()
+                metrics.observe("job_wait_ms", (job.started_at - job.created_at) * 1000.0, kind=job.kind)
+                job.task = asyncio.create_task(self._run(job))
+                job.task.add_done_callback(lambda task, job=job: self._task_done(job))
+            claimed |= job.pins
+
+    async def _run(self, job: _MotionJob) -> None:
+        try:
+            job.results = await job.runner()
+            job.state = "done"
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            if job.mode == "compiled":
+                backend.stop_frames()
+            # Stop sending pulses to the servos
+            await asyncio.gather(*(_write_pulse(pin, 0, force=True) for pin in job.pins), return_exceptions=True)
+        except Exception as e:
+            job.state = "failed"
+            job.message = f"Unexpected error: {e}"
+        finally:
+            self._release(job)
+            self._finish(job, job.state, job.message)
+            self._dispatch()
+
+    def _task_done(self, job: _MotionJob) -> None:
+        # A task cancelled before it started never enters _run, so nothing was written
+        # and its pins are released here instead
+        if job.finished.is_set():
+            return
+        self._release(job)
+        self._finish(job, "cancelled", job.message)
+        self._dispatch()
+
+    def _release(self, job: _MotionJob) -> None:
+        for pin in job.pins:
+            if self._owners.get(pin) is job:
+                del self._owners[pin]
+
+    def _finish(self, job: _MotionJob, state: str, message: str) -> None:
+        job.state = state
+        job.message = message
+        job.finished_at = time.time()
+        job.finished.set()
+
+    def _prune(self) -> None:
+        finished = [job for job in self.jobs.values() if job.finished.is_set()]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.job_id]
+
+scheduler = _JobScheduler(os.environ.get("JOB_POLICY", "fifo"))
+
+def _unfinished_results(commands: list[dict], job: _MotionJob) -> list[dict]:
+    """Per-command statuses for a batch job that was rejected, cancelled or failed."""
+    status = "error" if job.state == "failed" else job.state
+    return [{"pin": cmd.get("pin"), "status": status, "message": f"Job {job.job_id} {job.state}: {job.message}"} for cmd in commands]
+
 @mcp.tool()
-async def execute_servo_commands(commands: list[dict]) -> list[dict]:
+async def get_server_time() -> dict:
+    """
+    Returns the server's wall clock ({"time": Unix seconds}), for clients that measure
+    their clock offset to this server before sending a start_at.
+    """
+    return {"time": time.time()}
+
+@mcp.tool()
+async def execute_servo_commands(commands: list[dict], mode: str = "sequential", start_at: float | None = None) -> list[dict]:
     """
     Execute a batch of servo moves. Each command dict should have:
       - pin (int): BCM GPIO pin (17,27,22,23,24,25)
       - angle (float):  Desired angle in degrees (0–180, but 17/27/22 capped at 45)
       - duration_ms (int, optional): How long to hold this position (default 500ms)
-    Returns a list of status dicts for each command.
+      - start_ms (int, optional, timeline mode): Earliest start, in ms after its group starts
+      - group (int, optional, timeline mode): Parallel group; groups run one after another
+        in ascending order (default 0)
+      - hold (bool, optional): Keep the pulse on after duration_ms so the servo stays
+        stiff at its position (default: the pin's set_servo_hold setting, else false)
+    Consecutive commands on the same pin are not separated by a pulse stop, and a move
+    to the pulse width a pin is already holding sends nothing to the driver.
+    mode:
+      - "sequential": run the commands one after another (default)
+      - "timeline": run commands on different pins concurrently; commands on the
+        same pin still run in the order given
+      - "compiled": play the batch in order as hardware-timed pigpio waveforms
+        (hold times rounded to 20 ms frames); each result also reports start_ms and
+        end_ms, the actual times after the call began
+    start_at (optional): server Unix time (see get_server_time) at which to start, so
+      several servers can start one batch together; each status then also reports
+      start_lag_ms. At most 60 s ahead; a time in the past starts right away.
+    The batch runs as a job through the server's scheduler (see submit_motion), so it
+    waits for, preempts or is rejected by other jobs on the same pins per the server policy.
+    Returns a list of status dicts for each command, in the original order.
     """
-    results = []
-    if not pi:
-        # pigpio not initialized, return error for all commands
-        for cmd_idx, cmd in enumerate(commands):
-            pin = cmd.get("pin")
-            results.append({
-                "pin": pin,
-                "status": "error",
-                "message": "pigpio daemon not connected. Cannot control servos."
-            })
-        return results
+    with metrics.timer("tool_call_ms", tool="execute_servo_commands"):
+        errors = _check_batch(commands, mode)
+        if errors is not None:
+            return errors
+        start_error = _check_start_at(start_at)
+        if start_error is not None:
+            return [{"pin": cmd.get("pin"), "status": "error", "message": start_error} for cmd in commands]
 
-    for cmd in commands:
-        pin = cmd.get("pin")
-        angle = cmd.get("angle")
-        duration_ms = cmd.get("duration_ms", 500) # Default duration 500ms
-        status = {"pin": pin}
+        job = scheduler.submit(_MotionJob("commands", _command_pins(commands), lambda: _execute_batch(commands, mode, start_at),
+                                          mode=mode, size=len(commands)))
+        await job.finished.wait()
+        return job.results if job.state == "done" else _unfinished_results(commands, job)
+
+@mcp.tool()
+async def submit_motion(commands: list[dict], mode: str = "sequential", policy: str | None = None,
+                        start_at: float | None = None) -> dict:
+    """
+    Queue a batch of servo moves as a job and return immediately with its job id.
+    commands, mode and start_at are the same as for execute_servo_commands.
+    policy (optional) overrides the server's policy for pins that are busy:
+      - "fifo": wait until the pins are free
+      - "preempt": cancel the jobs using the pins and run next
+      - "reject": fail immediately
+    Returns the job info dict ({"job_id", "state", ...}); poll it with get_job_status.
+    """
+    errors = _check_batch(commands, mode)
+    if errors is not None:
+        return {"job_id": None, "state": "rejected", "message": errors[0]["message"] if errors else "No commands."}
+    if policy is not None and policy not in JOB_POLICIES:
+        return {"job_id": None, "state": "rejected", "message": f"Invalid policy '{policy}'. Allowed policies are {JOB_POLICIES}."}
+    start_error = _check_start_at(start_at)
+    if start_error is not None:
+        return {"job_id": None, "state": "rejected", "message": start_error}
+
+    job = scheduler.submit(_MotionJob("commands", _command_pins(commands), lambda: _execute_batch(commands, mode, start_at),
+                                      mode=mode, size=len(commands)), policy)
+    return job.to_dict()
+
+@mcp.tool()
+async def get_job_status(job_id: str) -> dict:
+    """Returns the info dict of a job, including its per-command results once it is done."""
+    job = scheduler.jobs.get(job_id)
+    if job is None:
+        return {"job_id": job_id, "state": "unknown", "message": f"Unknown or expired job {job_id}."}
+    return job.to_dict(include_results=True)
+
+@mcp.tool()
+async def cancel_job(job_id: str) -> dict:
+    """
+    Cancels a queued job, or stops a running one mid-sequence and zeroes its pins.
+    Returns the job info dict after cancellation.
+    """
+    job = scheduler.jobs.get(job_id)
+    if job is None:
+        return {"job_id": job_id, "state": "unknown", "message": f"Unknown or expired job {job_id}."}
+    was_running = job.state == "running"
+    if scheduler.cancel(job, "Cancelled by request."):
+        if was_running:
+            await job.finished.wait() # Wait until the pins have been zeroed and released
+    return job.to_dict()
+
+@mcp.tool()
+async def list_jobs() -> list[dict]:
+    """Lists queued, running and recently finished jobs (without their results), oldest first."""
+    return [job.to_dict() for job in scheduler.jobs.values()]
 
-        # Validate pin
+@mcp.tool()
+async def get_servo_state() -> dict:
+    """
+    Returns the last commanded position of every servo pin:
+      {"pins": {pin: {"angle", "pulse_width", "active", "hold", "updated_at", "age_s"}}}
+    active is true while the pulse is still applied (the servo holds its position);
+    angle and pulse_width are None for pins not driven since the server started.
+    """
+    now = time.time()
+    pins = {}
+    for pin in sorted(ALLOWED_PINS):
+        state = servo_state.get(pin, {"angle": None, "pulse_width": None, "active": False, "updated_at": None})
+        pins[str(pin)] = {**state, "hold": pin in hold_pins,
+                          "age_s": round(now - state["updated_at"], 3) if state["updated_at"] else None}
+    return {"pins": pins}
+
+@mcp.tool()
+async def set_servo_hold(pins: list[int], hold: bool = True) -> dict:
+    """
+    Turns hold mode on or off for the given pins. In hold mode a pin keeps its pulse
+    after each command instead of going limp, unless the command has "hold": false.
+    Turning hold off stops the pulses of those pins if they are idle.
+    Returns {"hold_pins": [...]}.
+    """
+    invalid = [pin for pin in pins if pin not in ALLOWED_PINS]
+    if invalid:
+        return {"status": "error", "message": f"Invalid pins {invalid}. Allowed pins are {ALLOWED_PINS}."}
+    if hold:
+        hold_pins.update(pins)
+    else:
+        hold_pins.difference_update(pins)
+        busy = {pin for pin in scheduler._owners} # Pins of running jobs stop when their job ends
+        for pin in pins:
+            if pin not in busy:
+                try:
+                    await _write_pulse(pin, 0)
+                except ServoBackendError as e:
+                    return {"status": "error", "message": f"{backend.name} error for pin {pin}: {str(e)}", "hold_pins": sorted(hold_pins)}
+    return {"status": "ok", "hold_pins": sorted(hold_pins)}
+
+def _pin_max_angle(pin: int) -> float:
+    return MAX_ANGLE_FOR_CAPPED_PINS if pin in PINS_WITH_ANGLE_CAP else MAX_ANGLE
+
+def _min_segment_times(delta: np.ndarray, max_velocity: float, max_acceleration: float, profile: str) -> np.ndarray:
+    """Shortest duration of each segment that keeps the profile within the velocity/acceleration limits."""
+    distance = np.abs(delta)
+    if profile == "cubic":
+        # Smoothstep peaks at 1.5*D/T velocity and 6*D/T^2 acceleration
+        return np.maximum(1.5 * distance / max_velocity, np.sqrt(6.0 * distance / max_acceleration))
+    # Trapezoid: triangular if the peak velocity is never reached, otherwise cruise at max_velocity
+    return np.where(distance <= max_velocity ** 2 / max_acceleration,
+                    2.0 * np.sqrt(distance / max_acceleration),
+                    distance / max_velocity + max_velocity / max_acceleration)
+
+def _sample_profile(t: np.ndarray, knot_times: np.ndarray, knot_angles: np.ndarray,
+                    max_acceleration: float, profile: str) -> np.ndarray:
+    """Evaluates one pin's interpolated angle at every sample time in a single vectorized pass."""
+    if len(knot_times) == 1:
+        return np.full_like(t, knot_angles[0])
+    seg = np.clip(np.searchsorted(knot_times, t, side="right") - 1, 0, len(knot_times) - 2)
+    t0 = knot_times[seg]
+    duration = knot_times[seg + 1] - t0
+    delta = knot_angles[seg + 1] - knot_angles[seg]
+    tau = np.clip(t - t0, 0.0, duration) # Holds the first/last angle outside the keyframes
+    if profile == "cubic":
+        s = tau / duration
+        offset = delta * s * s * (3.0 - 2.0 * s)
+    else:
+        # Trapezoid with the limit acceleration; the cruise velocity is the one that
+        # covers the distance in exactly the segment duration.
+        a = max_acceleration
+        distance = np.abs(delta)
+        cruise = (a * duration - np.sqrt(np.maximum(a * a * duration * duration - 4.0 * a * distance, 0.0))) / 2.0
+        t_acc = cruise / a
+        position = np.where(tau < t_acc, 0.5 * a * tau ** 2,
+                   np.where(tau <= duration - t_acc, 0.5 * a * t_acc ** 2 + cruise * (tau - t_acc),
+                            distance - 0.5 * a * (duration - tau) ** 2))
+        offset = np.sign(delta) * position
+    return knot_angles[seg] + offset
+
+def _trajectory_limit(limits: dict, pin: int, default: float) -> float | None:
+    """A pin's velocity or acceleration limit (keyed by pin or its string), or None if it is not a positive finite number."""
+    value = limits.get(str(pin), limits.get(pin, default))
+    if isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if 0 < value < math.inf else None
+
+def _plan_trajectory(keyframes: list[dict], profile: str, control_rate_hz: float,
+                     max_velocity: dict, max_acceleration: dict) -> tuple[list[int], np.ndarray, np.ndarray, dict]:
+    """
+    Validates keyframes and interpolates them into a dense (pins x samples) pulse-width
+    array sampled at control_rate_hz. Segments too short for a pin's limits are
+    stretched (later keyframes of that pin move back). Raises ValueError on invalid input.
+    Returns (pins, sample times in s, pulse widths, per-pin report).
+    """
+    if profile not in TRAJECTORY_PROFILES:
+        raise ValueError(f"Invalid profile '{profile}'. Allowed profiles are {TRAJECTORY_PROFILES}.")
+    if isinstance(control_rate_hz, bool) or not isinstance(control_rate_hz, (int, float)) or not (0 < control_rate_hz <= MAX_CONTROL_RATE_HZ):
+        raise ValueError(f"Invalid control_rate_hz {control_rate_hz}. Must be in (0, {MAX_CONTROL_RATE_HZ}].")
+
+    by_pin: dict[int, list[tuple[float, float]]] = {}
+    for kf in keyframes:
+        pin, angle, time_ms = kf.get("pin"), kf.get("angle"), kf.get("time_ms")
         if pin not in ALLOWED_PINS:
-            status.update(status="error", message=f"Invalid pin {pin}. Allowed pins are {ALLOWED_PINS}.")
-            results.append(status)
-            continue
+            raise ValueError(f"Invalid pin {pin}. Allowed pins are {ALLOWED_PINS}.")
+        if isinstance(angle, bool) or not isinstance(angle, (int, float)) or not (MIN_ANGLE <= angle <= MAX_ANGLE):
+            raise ValueError(f"Invalid angle {angle!r} for pin {pin}. Angle must be between {MIN_ANGLE} and {MAX_ANGLE} degrees.")
+        if isinstance(time_ms, bool) or not isinstance(time_ms, (int, float)) or not (0 <= time_ms <= MAX_TRAJECTORY_MS):
+            raise ValueError(f"Invalid time_ms {time_ms!r} for pin {pin}. Must be a number from 0 to {MAX_TRAJECTORY_MS}.")
+        by_pin.setdefault(pin, []).append((time_ms / 1000.0, float(angle)))
+    if not by_pin:
+        raise ValueError("No keyframes given.")
 
-        # Validate angle type
-        if not isinstance(angle, (int, float)):
-            status.update(status="error", message=f"Invalid angle type for pin {pin}. Angle must be a number.")
-            results.append(status)
-            continue
-            
-        # Validate angle range
-        if not (MIN_ANGLE <= angle <= MAX_ANGLE):
-            status.update(status="error", message=f"Invalid angle {angle} for pin {pin}. Angle must be between {MIN_ANGLE} and {MAX_ANGLE} degrees.")
-            results.append(status)
-            continue
+    plans = {}
+    report = {}
+    for pin, frames in by_pin.items():
+        frames.sort()
+        knot_times = np.array([f[0] for f in frames])
+        knot_angles = np.array([f[1] for f in frames])
+        if np.any(np.diff(knot_times) <= 0):
+            raise ValueError(f"Pin {pin} has more than one keyframe at the same time_ms.")
+        v_limit = _trajectory_limit(max_velocity, pin, DEFAULT_MAX_VELOCITY_DPS)
+        a_limit = _trajectory_limit(max_acceleration, pin, DEFAULT_MAX_ACCELERATION_DPS2)
+        if v_limit is None or a_limit is None:
+            raise ValueError(f"Velocity and acceleration limits for pin {pin} must be positive finite numbers.")
+        durations = np.diff(knot_times)
+        limited = np.maximum(durations, _min_segment_times(np.diff(knot_angles), v_limit, a_limit, profile))
+        knot_times = knot_times[0] + np.concatenate(([0.0], np.cumsum(limited)))
+        plans[pin] = (knot_times, knot_angles, a_limit)
+        report[pin] = {"keyframes": len(frames), "stretched_ms": round(float(np.sum(limited - durations)) * 1000.0, 3)}
+
+    period = 1.0 / control_rate_hz
+    end = max(plan[0][-1] for plan in plans.values())
+    if end * 1000.0 > MAX_TRAJECTORY_MS:
+        raise ValueError(f"Trajectory lasts {end:.1f} s at the given limits; at most {MAX_TRAJECTORY_MS / 1000.0:.0f} s is allowed.")
+    t = np.arange(0.0, end + period / 2, period)
+    pins = sorted(plans)
+    angles = np.vstack([_sample_profile(t, *plans[pin][:2], plans[pin][2], profile) for pin in pins])
+
+    # Apply the per-pin angle caps across the whole array at once
+    caps = np.array([_pin_max_angle(pin) for pin in pins])[:, None]
+    capped = angles > caps
+    angles = np.clip(angles, MIN_ANGLE, caps)
+    for row, pin in enumerate(pins):
+        report[pin]["capped_samples"] = int(np.count_nonzero(capped[row]))
+    pulse_widths = (MIN_PULSE_WIDTH + (angles / MAX_ANGLE) * (MAX_PULSE_WIDTH - MIN_PULSE_WIDTH)).astype(int)
+    return pins, t, pulse_widths, report
+
+async def _stream_samples(pins: list[int], pulse_widths: np.ndarray, control_rate_hz: float) -> dict:
+    """
+    Streams the pulse-width samples to the servos at a fixed control rate, writing only
+    the pins whose pulse width changed since the previous sample. Deadlines are absolute
+    so sleep overshoot does not accumulate. Pulses are stopped at the end on every pin
+    that is not in hold mode.
+    """
+    changed = np.ones(pulse_widths.shape, dtype=bool)
+    changed[:, 1:] = pulse_widths[:, 1:] != pulse_widths[:, :-1]
+    writes: list[list[tuple[int, int]]] = [[] for _ in range(pulse_widths.shape[1])]
+    for sample, row in zip(*np.nonzero(changed.T)):
+        writes[sample].append((pins[row], int(pulse_widths[row, sample])))
+
+    period = 1.0 / control_rate_hz
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    max_lag = 0.0
+    write_count = 0
+    completed = False
+    try:
+        for sample, sample_writes in enumerate(writes):
+            delay = start + sample * period - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            write_count += sum(await asyncio.gather(*(_write_pulse(pin, pulse_width) for pin, pulse_width in sample_writes)))
+        await asyncio.sleep(period) # Hold the final sample for one control period
+        completed = True
+    finally:
+        # Stop sending pulses to the servos
+        await asyncio.gather(*(_write_pulse(pin, 0) for pin in pins if not (completed and pin in hold_pins)))
+    return {"writes": write_count, "max_lag_ms": round(max_lag * 1000.0, 3),
+            "elapsed_ms": round((loop.time() - start) * 1000.0, 3)}
+
+@mcp.tool()
+async def execute_trajectory(keyframes: list[dict], profile: str = "trapezoidal", control_rate_hz: float = 50.0,
+                             max_velocity: dict | None = None, max_acceleration: dict | None = None) -> dict:
+    """
+    Execute a smooth multi-servo trajectory. Keyframes are interpolated on the server
+    into dense pulse-width samples and streamed to the servos at a fixed control rate.
+      - keyframes (list[dict]): {"pin": int, "angle": float, "time_ms": int}; each pin
+        holds its first keyframe's angle until that time and its last one afterwards;
+        time_ms is at most 600000, and so is the whole trajectory after stretching
+      - profile (str): "trapezoidal" (default) or "cubic"
+      - control_rate_hz (float): sample rate of the streamed profile (default 50 Hz)
+      - max_velocity / max_acceleration (dict, optional): per-pin limits in deg/s and
+        deg/s^2, keyed by pin (defaults 180 deg/s, 720 deg/s^2). Segments that would
+        exceed them are stretched.
+    Angle caps for pins 17/27/22 are applied to every sample. The trajectory runs as a
+    job through the server's scheduler, like execute_servo_commands.
+    Returns a status dict with the sample count, duration and a per-pin report.
+    """
+    if not backend.connected:
+        return {"status": "error", "message": f"{backend.name} backend not connected. Cannot control servos."}
+    try:
+        pins, t, pulse_widths, report = _plan_trajectory(keyframes, profile, control_rate_hz,
+                                                        max_velocity or {}, max_acceleration or {})
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
 
-        # Cap angle for specific pins
-        original_angle = angle
-        if pin in PINS_WITH_ANGLE_CAP and angle > MAX_ANGLE_FOR_CAPPED_PINS:
-            angle = MAX_ANGLE_FOR_CAPPED_PINS
-            status["message"] = f"Angle {original_angle}° for pin {pin} was capped to {MAX_ANGLE_FOR_CAPPED_PINS}°."
-        
-        pulse_width = angle_to_pulsewidth(angle)
-        
+    result = {"status": "ok", "profile": profile, "control_rate_hz": control_rate_hz,
+              "samples": int(pulse_widths.shape[1]), "duration_ms": round(float(t[-1]) * 1000.0, 3),
+              "pins": {str(pin): info for pin, info in report.items()}}
+    async def run():
         try:
-            pi.set_servo_pulsewidth(pin, pulse_width)
-            await asyncio.sleep(duration_ms / 1000.0)
-            pi.set_servo_pulsewidth(pin, 0)  # Stop sending pulses to the servo
-            status["status"] = "ok"
-            if "message" not in status: # If no capping message, confirm original angle
-                 status["message"] = f"Servo on pin {pin} moved to {angle}°."
-        except pigpio.error as e:
-            status.update(status="error", message=f"pigpio error for pin {pin}: {str(e)}")
-        except Exception as e:
-            status.update(status="error", message=f"Unexpected error for pin {pin}: {str(e)}")
-        
-        results.append(status)
+            return await _stream_samples(pins, pulse_widths, control_rate_hz)
+        except ServoBackendError as e:
+            return {"status": "error", "message": f"{backend.name} error during trajectory: {str(e)}"}
+
+    job = scheduler.submit(_MotionJob("trajectory", set(pins), run, size=len(keyframes)))
+    await job.finished.wait()
+    if job.state != "done":
+        result.update(status="error", message=f"Job {job.job_id} {job.state}: {job.message}")
+        return result
+    result.update(job.results)
+    if result["status"] == "ok":
+        result["message"] = f"Trajectory on pins {pins} completed."
+    return result
+
+@mcp.tool()
+async def get_metrics(format: str = "json") -> dict:
+    """
+    Returns the server's aggregated timing metrics:
+      - validation_ms: time to validate and convert one command
+      - backend_call_ms{pin}: latency of each servo write, including its wait for the actuation thread
+      - actuation_batch_size / actuation_batch_ms: writes per backend batch and the batch's pigpio time
+      - hold_error_ms{pin}: actual minus requested hold time
+      - job_wait_ms{kind}: time jobs spent queued for busy pins
+      - tool_call_ms{tool}: end-to-end execute_servo_commands and run_macro time
+      - commands_total{pin,status}: executed commands per pin and outcome
+    Histograms report count, mean, p50/p95/p99 and max over recent samples.
+    "backend" reports the connection and the actuation thread's batch and reconnect counters.
+    format "prometheus" returns {"format": "prometheus", "text": ...} with the same
+    text served at GET /metrics.
+    """
+    if format == "prometheus":
+        return {"format": "prometheus", "text": metrics.prometheus()}
+    snapshot = metrics.snapshot()
+    snapshot["backend"] = {"name": backend.name, "connected": backend.connected, "actuation": actuator.snapshot()}
+    return snapshot
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+class _CommandStream:
+    """
+    An open command stream: chunks of commands appended by the client are executed
+    in arrival order by a background task while the client keeps appending. Each
+    chunk runs as a "stream" job through the scheduler, claiming its pins like any
+    other job; a chunk that is cancelled, preempted or rejected cancels the rest of
+    the stream.
+    """
+    def __init__(self, stream_id: str):
+        self.stream_id = stream_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.results: list[dict] = []
+        self.pending = 0 # Appended commands whose chunk has not started yet
+        self.cancelled = False
+        self.message = "Command stream was cancelled."
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self.queue.get(), STREAM_IDLE_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                print(f"Command stream {self.stream_id} idle for {STREAM_IDLE_TIMEOUT_S}s, closing it.")
+                _command_streams.pop(self.stream_id, None)
+                return
+            if chunk is None: # End-of-stream marker from close_command_stream
+                return
+            self.pending -= len(chunk)
+            if self.cancelled:
+                self.results.extend({"pin": cmd.get("pin"), "status": "cancelled", "message": self.message} for cmd in chunk)
+                continue
+            done: list[dict] = [] # Statuses of the chunk's commands that have run, kept if the job is cancelled
+            macros = [_macros[cmd["macro"]] for cmd in chunk if "macro" in cmd and cmd["macro"] in _macros]
+            pins = _command_pins(chunk).union(*(macro.pins for macro in macros))
+            mode = "compiled" if any(macro.mode == "compiled" for macro in macros) else "sequential"
+            job = scheduler.submit(_MotionJob("stream", pins, lambda: self._run_chunk(chunk, done), mode=mode, size=len(chunk)))
+            await job.finished.wait()
+            self.results.extend(done)
+            if job.state != "done":
+                self.cancelled = True
+                self.message = f"Job {job.job_id} {job.state}: {job.message}"
+                self.results.extend({"pin": cmd.get("pin"), "status": "cancelled" if job.state == "cancelled" else "error",
+                                     "message": self.message} for cmd in chunk[len(done):])
+
+    async def _run_chunk(self, chunk: list[dict], done: list[dict]) -> list[dict]:
+        for cmd in chunk:
+            if "macro" in cmd: # {"macro": name, "speed_scale": float, "repeat": int} runs a stored macro in place
+                done.append(await _run_macro_entry(cmd)) # Counted in commands_total by _run_macro
+                continue
+            status, pulse_width = _prepare_command(cmd)
+            if pulse_width is not None:
+                await _run_command(status["pin"], pulse_width, cmd.get("duration_ms", DEFAULT_DURATION_MS), status,
+                                   keep_pulse=_hold_for(status["pin"], cmd.get("hold")))
+            metrics.inc("commands_total", pin=status.get("pin"), status=status.get("status"))
+            done.append(status)
+        return done
+
+_command_streams: dict[str, _CommandStream] = {}
+
+@mcp.tool()
+async def open_command_stream() -> dict:
+    """
+    Opens a command stream for incremental dispatch. Commands appended with
+    append_command_stream start executing as soon as they arrive, in order, using
+    the same command format as execute_servo_commands.
+    Returns {"stream_id": str}.
+    """
+    stream_id = uuid.uuid4().hex
+    _command_streams[stream_id] = _CommandStream(stream_id)
+    return {"stream_id": stream_id}
+
+@mcp.tool()
+async def append_command_stream(stream_id: str, commands: list[dict]) -> dict:
+    """
+    Appends a chunk of commands to an open stream and returns immediately, without
+    waiting for them to execute. The chunk runs as one job through the server's
+    scheduler (see submit_motion), after the stream's earlier chunks.
+    Returns {"stream_id": str, "accepted": int, "pending": int} or an error dict.
+    """
+    stream = _command_streams.get(stream_id)
+    if stream is None:
+        return {"stream_id": stream_id, "status": "error", "message": f"Unknown or expired command stream {stream_id}."}
+    if not backend.connected:
+        return {"stream_id": stream_id, "status": "error", "message": f"{backend.name} backend not connected. Cannot control servos."}
+    if commands:
+        stream.pending += len(commands)
+        stream.queue.put_nowait(list(commands))
+    return {"stream_id": stream_id, "accepted": len(commands), "pending": stream.pending}
+
+@mcp.tool()
+async def close_command_stream(stream_id: str, cancel: bool = False) -> list[dict]:
+    """
+    Closes a stream, waits for the commands already appended to finish (or skips
+    the ones not yet started if cancel is true) and returns the status dicts of
+    every command in the stream, in order.
+    """
+    stream = _command_streams.pop(stream_id, None)
+    if stream is None:
+        return [{"pin": None, "status": "error", "message": f"Unknown or expired command stream {stream_id}."}]
+    stream.cancelled = cancel
+    stream.queue.put_nowait(None)
+    await stream.task
+    return stream.results
 
+class _Macro:
+    """
+    A named command sequence, validated and converted to pulse widths once, when it
+    is defined (or loaded from MACROS_FILE). steps holds one
+    (pin, pulse_width, duration_ms, start_ms, group, angle, hold) tuple per command;
+    for the timeline mode the per-group, per-pin chains are built up front as well.
+    """
+    def __init__(self, name: str, commands: list[dict], mode: str, description: str, steps: list[tuple]):
+        self.name = name
+        self.commands = commands # Source form, kept for persistence and listing
+        self.mode = mode
+        self.description = description
+        self.steps = steps
+        self.pins = {step[0] for step in steps}
+        self.timeline: dict[int, dict[int, list[tuple]]] = {}
+        if mode == "timeline":
+            for idx, (pin, pulse_width, duration_ms, start_ms, group, _, hold) in enumerate(steps):
+                self.timeline.setdefault(group, {}).setdefault(pin, []).append((idx, pulse_width, duration_ms, start_ms, hold))
+
+    @classmethod
+    def compile(cls, name: str, commands: list[dict], mode: str, description: str) -> tuple["_Macro | None", list[dict]]:
+        """Validates every command; returns (macro, statuses), with macro None if any command is invalid."""
+        statuses = []
+        steps = []
+        for cmd in commands:
+            status, pulse_width = _validate_command(cmd)
+            statuses.append(status)
+            if pulse_width is None:
+                continue
+            error = _timeline_error(cmd, status["pin"])
+            if error is not None:
+                status.update(status="error", message=error)
+            else:
+                status["status"] = "ok"
+                steps.append((status["pin"], pulse_width, cmd.get("duration_ms", DEFAULT_DURATION_MS),
+                              cmd.get("start_ms", 0), cmd.get("group", 0), status["angle"], cmd.get("hold")))
+        if not commands or any(status.get("status") != "ok" for status in statuses):
+            return None, statuses
+        return cls(name, commands, mode, description, steps), statuses
+
+    def duration_ms(self, speed_scale: float = 1.0) -> float:
+        """Nominal run time of one repetition."""
+        if self.mode == "timeline":
+            total = 0.0
+            for group in self.timeline.values():
+                group_end = 0.0
+                for chain in group.values():
+                    t = 0.0
+                    for _, _, duration_ms, start_ms, _ in chain:
+                        t = max(t, start_ms) + duration_ms
+                    group_end = max(group_end, t)
+                total += group_end
+            return total / speed_scale
+        if self.mode == "compiled":
+            return sum(_duration_to_frames(step[2] / speed_scale) for step in self.steps) * SERVO_FRAME_US / 1000.0
+        return sum(step[2] for step in self.steps) / speed_scale
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "description": self.description, "mode": self.mode, "steps": len(self.steps),
+                "pins": sorted(self.pins), "duration_ms": round(self.duration_ms(), 1)}
+
+_macros: dict[str, _Macro] = {}
+
+def _save_macros() -> None:
+    data = {name: {"description": macro.description, "mode": macro.mode, "commands": macro.commands}
+            for name, macro in sorted(_macros.items())}
+    tmp_path = MACROS_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, MACROS_FILE) # Atomic, so a crash never leaves a half-written file
+
+def _load_macros() -> None:
+    """Loads MACROS_FILE; entries that no longer validate (e.g. after a pin change) are skipped."""
+    try:
+        with open(MACROS_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        print(f"Could not load macros from {MACROS_FILE}: {e}")
+        return
+    for name, entry in data.items():
+        macro, statuses = _Macro.compile(name, entry.get("commands", []), entry.get("mode", "sequential"), entry.get("description", ""))
+        if macro is None:
+            errors = [status.get("message") for status in statuses if status.get("status") != "ok"]
+            print(f"Skipping macro '{name}' from {MACROS_FILE}: {errors or 'no commands'}")
+            continue
+        _macros[name] = macro
+
+_load_macros()
+
+async def _run_macro(macro: _Macro, speed_scale: float, repeat: int) -> list[dict]:
+    """Plays a compiled macro; hold times (and start offsets) are divided by speed_scale."""
+    results = []
+    for _ in range(repeat):
+        statuses = [{"pin": step[0], "angle": step[5]} for step in macro.steps]
+        if macro.mode == "compiled":
+            frames = [_duration_to_frames(step[2] / speed_scale) for step in macro.steps]
+            last_holds = {step[0]: _hold_for(step[0], step[6]) for step in macro.steps}
+            await _play_compiled([(step[0], step[1], n) for step, n in zip(macro.steps, frames)], list(zip(statuses, frames)),
+                                 {pin for pin, hold in last_holds.items() if hold})
+        elif macro.mode == "timeline":
+            loop = asyncio.get_running_loop()
+            for group in sorted(macro.timeline):
+                group_start = loop.time()
+                await asyncio.gather(*(
+                    _run_pin_chain(pin, [(idx, pw, duration_ms / speed_scale, start_ms / speed_scale, hold)
+                                         for idx, pw, duration_ms, start_ms, hold in chain], statuses, group_start)
+                    for pin, chain in macro.timeline[group].items()
+                ))
+        else:
+            await _run_sequence([(pin, pulse_width, duration_ms / speed_scale, hold, status)
+                                 for status, (pin, pulse_width, duration_ms, _, _, _, hold) in zip(statuses, macro.steps)])
+        results.extend(statuses)
+        if any(status.get("status") != "ok" for status in statuses):
+            break # Do not repeat a sequence that failed
+    for status in results:
+        metrics.inc("commands_total", pin=status.get("pin"), status=status.get("status"))
     return results
 
+def _check_macro_run(name: str, speed_scale: float, repeat: int) -> str | None:
+    """Returns an error message if the macro cannot be run with these arguments, else None."""
+    if name not in _macros:
+        return f"Unknown macro '{name}'. Defined macros: {sorted(_macros)}."
+    if not isinstance(speed_scale, (int, float)) or not (0 < speed_scale <= MAX_SPEED_SCALE):
+        return f"Invalid speed_scale {speed_scale}. Must be greater than 0 and at most {MAX_SPEED_SCALE}."
+    if not isinstance(repeat, int) or not (1 <= repeat <= MAX_MACRO_REPEAT):
+        return f"Invalid repeat {repeat}. Must be an integer from 1 to {MAX_MACRO_REPEAT}."
+    if not backend.connected:
+        return f"{backend.name} backend not connected. Cannot control servos."
+    if _macros[name].mode == "compiled" and not backend.supports_waveforms:
+        return f"The {backend.name} backend does not support compiled mode."
+    return None
+
+def _macro_summary(name: str, results: list[dict], speed_scale: float, repeat: int, elapsed_ms: float) -> dict:
+    errors = [status for status in results if status.get("status") != "ok"]
+    summary = {"macro": name, "status": "error" if errors else "ok", "speed_scale": speed_scale, "repeat": repeat,
+               "commands": len(results), "elapsed_ms": round(elapsed_ms, 1)}
+    if errors:
+        summary["message"] = f"{len(errors)} command(s) of macro '{name}' failed."
+        summary["errors"] = errors[:10]
+    else:
+        summary["message"] = f"Macro '{name}' completed ({repeat}x at speed {speed_scale})."
+    return summary
+
+async def _run_macro_entry(entry: dict) -> dict:
+    """Runs a {"macro", "speed_scale", "repeat"} entry of a command stream."""
+    name = entry.get("macro")
+    speed_scale = entry.get("speed_scale", 1.0)
+    repeat = entry.get("repeat", 1)
+    error = _check_macro_run(name, speed_scale, repeat)
+    if error is not None:
+        return {"pin": None, "macro": name, "status": "error", "message": error}
+    t0 = time.perf_counter()
+    results = await _run_macro(_macros[name], speed_scale, repeat)
+    return {"pin": None, **_macro_summary(name, results, speed_scale, repeat, (time.perf_counter() - t0) * 1000.0)}
+
+@mcp.tool()
+async def define_macro(name: str, commands: list[dict], mode: str = "sequential", description: str = "") -> dict:
+    """
+    Stores a named macro (e.g. "wave", "home", "grip") that can later be played with
+    run_macro. commands use the execute_servo_commands format and mode is one of its
+    execution modes. The commands are validated and converted to pulse widths now,
+    so running the macro needs no per-call validation. Macros are saved to the
+    server's macro file and survive restarts; defining an existing name replaces it.
+    Returns the macro info, or {"status": "error", "results": [...]} with the
+    per-command validation errors.
+    """
+    if not isinstance(name, str) or not MACRO_NAME_PATTERN.match(name):
+        return {"name": name, "status": "error", "message": "Invalid macro name. Use 1-64 letters, digits, '_' or '-'."}
+    if mode not in EXECUTION_MODES:
+        return {"name": name, "status": "error", "message": f"Invalid mode '{mode}'. Allowed modes are {EXECUTION_MODES}."}
+    macro, statuses = _Macro.compile(name, commands, mode, description)
+    if macro is None:
+        return {"name": name, "status": "error", "message": "Macro not saved: some commands are invalid." if commands else "Macro has no commands.",
+                "results": statuses}
+    replaced = name in _macros
+    _macros[name] = macro
+    try:
+        _save_macros()
+    except OSError as e:
+        return {**macro.to_dict(), "status": "error", "message": f"Macro defined but could not be saved to {MACROS_FILE}: {e}"}
+    notes = [status["message"] for status in statuses if "message" in status] # e.g. angle caps
+    return {**macro.to_dict(), "status": "ok", "replaced": replaced, "notes": notes}
+
+@mcp.tool()
+async def list_macros() -> list[dict]:
+    """Lists the stored macros: name, description, mode, step count, pins and nominal duration_ms."""
+    return [macro.to_dict() for _, macro in sorted(_macros.items())]
+
+@mcp.tool()
+async def delete_macro(name: str) -> dict:
+    """Deletes a stored macro."""
+    if _macros.pop(name, None) is None:
+        return {"name": name, "status": "error", "message": f"Unknown macro '{name}'."}
+    try:
+        _save_macros()
+    except OSError as e:
+        return {"name": name, "status": "error", "message": f"Macro deleted but the macro file could not be saved: {e}"}
+    return {"name": name, "status": "ok", "message": f"Macro '{name}' deleted."}
+
+@mcp.tool()
+async def run_macro(name: str, speed_scale: float = 1.0, repeat: int = 1, start_at: float | None = None) -> dict:
+    """
+    Plays a stored macro repeat times in a row (1-100). speed_scale > 1 plays it
+    faster, < 1 slower: every hold time and start offset is divided by it. Runs as a
+    job through the scheduler, like execute_servo_commands; start_at is the same as there.
+    Returns a summary: status, commands run, elapsed_ms, and the failed commands if any.
+    """
+    with metrics.timer("tool_call_ms", tool="run_macro"):
+        error = _check_macro_run(name, speed_scale, repeat) or _check_start_at(start_at)
+        if error is not None:
+            return {"macro": name, "status": "error", "message": error}
+        macro = _macros[name]
+        timing = {}
+
+        async def run():
+            timing["start_lag_ms"] = await _wait_for_start(start_at)
+            timing["started"] = time.perf_counter()
+            return await _run_macro(macro, speed_scale, repeat)
+
+        job = scheduler.submit(_MotionJob("macro", set(macro.pins), run, mode=macro.mode, size=len(macro.steps) * repeat))
+        await job.finished.wait()
+        if job.state != "done":
+            return {"macro": name, "status": "error", "message": f"Job {job.job_id} {job.state}: {job.message}"}
+        summary = _macro_summary(name, job.results, speed_scale, repeat, (time.perf_counter() - timing["started"]) * 1000.0)
+        if timing["start_lag_ms"] is not None:
+            summary["start_lag_ms"] = round(timing["start_lag_ms"], 3)
+        return summary
+
+def _recording_path(name: str) -> str | None:
+    """Path of a recording by name, or None if the name is not valid."""
+    if not isinstance(name, str) or not MACRO_NAME_PATTERN.match(name):
+        return None
+    return os.path.join(RECORDINGS_DIR, name + FILE_EXTENSION)
+
+@mcp.tool()
+async def start_recording(name: str | None = None) -> dict:
+    """
+    Starts recording every pulse-width change sent to the servos (by any tool) into a
+    compact binary file on the server: a 32-byte header and 12-byte records of
+    (microseconds since start, pin, pulse width). name defaults to rec-<date>-<time>;
+    existing recordings are never overwritten. One recording can be active at a time.
+    """
+    global _recording
+    if _recording is not None:
+        return {"status": "error", "message": f"Recording '{_recording.name}' is already active."}
+    name = name or time.strftime("rec-%Y%m%d-%H%M%S")
+    path = _recording_path(name)
+    if path is None:
+        return {"name": name, "status": "error", "message": "Invalid recording name. Use 1-64 letters, digits, '_' or '-'."}
+    try:
+        os.makedirs(RECORDINGS_DIR, exist_ok=True)
+        _recording = Recorder(path)
+    except FileExistsError:
+        return {"name": name, "status": "error", "message": f"Recording '{name}' already exists."}
+    except OSError as e:
+        return {"name": name, "status": "error", "message": f"Could not create {path}: {e}"}
+    return {"name": name, "status": "ok", "message": f"Recording '{name}' started."}
+
+@mcp.tool()
+async def stop_recording() -> dict:
+    """Stops the active recording and returns its info (records, pins, duration_ms, size_bytes)."""
+    global _recording
+    if _recording is None:
+        return {"status": "error", "message": "No recording is active."}
+    recorder, _recording = _recording, None
+    try:
+        info = recorder.close()
+    except (OSError, RecordingError) as e:
+        return {"status": "error", "message": f"Recording could not be completed: {e}"}
+    return {**info, "status": "ok", "message": f"Recording '{info['name']}' stopped with {info['records']} record(s)."}
+
+@mcp.tool()
+async def list_recordings() -> list[dict]:
+    """Lists the recordings on the server: name, size_bytes, records, pins, duration_ms, started_at, active."""
+    active = _recording.path if _recording is not None else None
+    recordings = []
+    if os.path.isdir(RECORDINGS_DIR):
+        for filename in sorted(os.listdir(RECORDINGS_DIR)):
+            if not filename.endswith(FILE_EXTENSION):
+                continue
+            path = os.path.join(RECORDINGS_DIR, filename)
+            if path == active:
+                recordings.append({"name": _recording.name, "records": _recording.count, "active": True})
+                continue
+            try:
+                recordings.append({**read_info(path), "active": False})
+            except (OSError, RecordingError) as e:
+                recordings.append({"name": filename[:-len(FILE_EXTENSION)], "status": "error", "message": str(e)})
+    return recordings
+
+@mcp.tool()
+async def download_recording(name: str, offset: int = 0, length: int = MAX_DOWNLOAD_CHUNK) -> dict:
+    """
+    Returns up to length bytes (at most 1 MiB) of a recording file from offset, base64
+    encoded in "data". Call again with offset + length until "eof" is true.
+    """
+    path = _recording_path(name)
+    if path is None or not os.path.isfile(path):
+        return {"name": name, "status": "error", "message": f"Unknown recording '{name}'."}
+    if _recording is not None and _recording.path == path:
+        return {"name": name, "status": "error", "message": f"Recording '{name}' is still active."}
+    if not isinstance(offset, int) or not isinstance(length, int) or offset < 0 or not (0 < length <= MAX_DOWNLOAD_CHUNK):
+        return {"name": name, "status": "error", "message": f"Invalid offset/length. length must be 1-{MAX_DOWNLOAD_CHUNK} bytes."}
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    return {"name": name, "status": "ok", "offset": offset, "length": len(data), "size_bytes": size,
+            "eof": offset + len(data) >= size, "data": base64.b64encode(data).decode("ascii")}
+
+@mcp.tool()
+async def delete_recording(name: str) -> dict:
+    """Deletes a recording file."""
+    path = _recording_path(name)
+    if path is None or not os.path.isfile(path):
+        return {"name": name, "status": "error", "message": f"Unknown recording '{name}'."}
+    if _recording is not None and _recording.path == path:
+        return {"name": name, "status": "error", "message": f"Recording '{name}' is still active."}
+    os.remove(path)
+    return {"name": name, "status": "ok", "message": f"Recording '{name}' deleted."}
+
+async def _replay_records(path: str, pins: list[int], speed_scale: float) -> dict:
+    """
+    Streams a recording to the servos chunk by chunk from its memory map, at absolute
+    deadlines like _stream_samples. Records with the same timestamp (one recorded
+    batch) are written as one batch again. Pulses are stopped at the end on every pin
+    that is not in hold mode.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    max_lag = 0.0
+    records = writes = 0
+    completed = False
+    try:
+        for chunk in iter_chunks(path):
+            bad = (chunk["pulse_width"] != 0) & ((chunk["pulse_width"] < MIN_PULSE_WIDTH) | (chunk["pulse_width"] > MAX_PULSE_WIDTH))
+            if bad.any():
+                raise RecordingError(f"Record {records + int(np.argmax(bad))} has an invalid pulse width.")
+            rows = zip(chunk["t_us"].tolist(), chunk["pin"].tolist(), chunk["pulse_width"].tolist())
+            for t_us, group in itertools.groupby(rows, key=lambda row: row[0]):
+                group = list(group)
+                delay = start + t_us / 1e6 / speed_scale - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+                writes += sum(await asyncio.gather(*(_write_pulse(pin, pulse_width) for _, pin, pulse_width in group)))
+                records += len(group)
+        completed = True
+    finally:
+        # Stop sending pulses to the servos
+        await asyncio.gather(*(_write_pulse(pin, 0) for pin in pins if not (completed and pin in hold_pins)))
+    return {"records": records, "writes": writes, "max_lag_ms": round(max_lag * 1000.0, 3),
+            "elapsed_ms": round((loop.time() - start) * 1000.0, 3)}
+
+@mcp.tool()
+async def replay_recording(name: str, speed_scale: float = 1.0, start_at: float | None = None) -> dict:
+    """
+    Plays a recording back on the servos with its original timing; speed_scale > 1
+    plays it faster, < 1 slower (0-10]. The file is memory-mapped and streamed in
+    chunks, so long recordings replay without being loaded into memory. Runs as a job
+    through the scheduler on the recorded pins; start_at is as in execute_servo_commands.
+    Returns the record count, the writes actually sent, max_lag_ms and elapsed_ms.
+    """
+    path = _recording_path(name)
+    if path is None or not os.path.isfile(path):
+        return {"name": name, "status": "error", "message": f"Unknown recording '{name}'."}
+    if _recording is not None and _recording.path == path:
+        return {"name": name, "status": "error", "message": f"Recording '{name}' is still active."}
+    if not isinstance(speed_scale, (int, float)) or not (0 < speed_scale <= MAX_SPEED_SCALE):
+        return {"name": name, "status": "error", "message": f"Invalid speed_scale {speed_scale}. Must be greater than 0 and at most {MAX_SPEED_SCALE}."}
+    error = _check_start_at(start_at)
+    if error is None and not backend.connected:
+        error = f"{backend.name} backend not connected. Cannot control servos."
+    if error is not None:
+        return {"name": name, "status": "error", "message": error}
+    try:
+        info = read_info(path)
+    except (OSError, RecordingError) as e:
+        return {"name": name, "status": "error", "message": str(e)}
+    if not set(info["pins"]) <= ALLOWED_PINS:
+        return {"name": name, "status": "error", "message": f"Recording uses pins {info['pins']}; allowed pins are {ALLOWED_PINS}."}
+
+    timing = {}
+    async def run():
+        timing["start_lag_ms"] = await _wait_for_start(start_at)
+        try:
+            return await _replay_records(path, info["pins"], speed_scale)
+        except (ServoBackendError, RecordingError) as e:
+            return {"status": "error", "message": f"Replay failed: {e}"}
+
+    job = scheduler.submit(_MotionJob("replay", set(info["pins"]), run, size=info["records"]))
+    await job.finished.wait()
+    if job.state != "done":
+        return {"name": name, "status": "error", "message": f"Job {job.job_id} {job.state}: {job.message}"}
+    result = {"name": name, "status": "ok", "speed_scale": speed_scale, **job.results}
+    if result["status"] == "ok":
+        result["message"] = f"Recording '{name}' replayed on pins {info['pins']}."
+    if timing["start_lag_ms"] is not None:
+        result["start_lag_ms"] = round(timing["start_lag_ms"], 3)
+    return result
+
 if __name__ == "__main__":
-    print("Starting Servo MCP Server on port 8011...")
-    # Ensure pigpio is available before trying to run the server reliant on it.
-    if pi is None:
-        print("Cannot start server: pigpio is not initialized.")
+    parser = argparse.ArgumentParser(description="Servo MCP Server")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on (default 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=8011, help="Port to listen on (default 8011)")
+    parser.add_argument("--job-policy", choices=sorted(JOB_POLICIES), default=scheduler.policy,
+                        help="What to do with jobs whose pins are busy (default fifo, or JOB_POLICY)")
+    args = parser.parse_args()
+    scheduler.policy = args.job_policy
+
+    print(f"Starting Servo MCP Server on port {args.port}...")
+    # Ensure the backend is available before trying to run the server reliant on it.
+    if not backend.connected:
+        print(f"Cannot start server: {backend.name} backend is not initialized.")
         print("Make sure the pigpio daemon (pigpiod) is running and accessible.")
     else:
-        print(f"Connected to pigpio daemon (version {pi.get_pigpio_version()}).")
-        print(f"Hardware revision: {pi.get_hardware_revision()}")
+        print(f"Connected to {backend.name} backend (version {backend.get_version()}).")
+        print(f"Hardware revision: {backend.get_hardware_revision()}")
         print(f"Controlling servos on BCM pins: {ALLOWED_PINS}")
         print(f"Pins {PINS_WITH_ANGLE_CAP} have their angles capped at {MAX_ANGLE_FOR_CAPPED_PINS} degrees.")
-        mcp.run(transport="streamable-http", host="0.0.0.0", port=8011) 
\ No newline at end of file
+        print(f"Job policy for busy pins: {scheduler.policy}")
+        print(f"Macros loaded from {MACROS_FILE}: {sorted(_macros) or 'none'}")
+        print(f"Recordings are stored in {RECORDINGS_DIR}")
+        print(f"Servo writes run on the actuation thread, batched per event-loop iteration; a lost "
+              f"{backend.name} connection is retried with backoff ({actuator.initial_backoff_s}-{actuator.max_backoff_s}s) "
+              f"and checked every {actuator.health_check_s}s when idle. Batch sizes and reconnects: get_metrics.")
+        mcp.run(transport="streamable-http", host=args.host, port=args.port) 
\ No newline at end of file
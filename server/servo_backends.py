@@ -0,0 +1,523 @@
+import asyncio
+import os
+import queue
+import struct
+import threading
+import time
+
+SERVO_FRAME_US = 20000 # One 50 Hz servo frame
+MAX_WAVE_CHAIN_BYTES = 600 # pigpio limit for a single wave_chain call
+MAX_WAVES_PER_BLOCK = 100 # Distinct waveforms built before a block is played and freed
+
+
+class ServoBackendError(Exception):
+    """Raised by a backend when a servo call fails (e.g. wraps pigpio.error)."""
+
+
+class BackendConnectionError(ServoBackendError):
+    """Raised when the connection to the servo driver (pigpiod) is lost or down."""
+
+
+class ServoBackend:
+    """
+    Interface between the MCP tools and the servo hardware.
+    Backends only need to implement set_servo_pulsewidth; the info methods are
+    used for the startup banner. Backends that can generate hardware-timed pulse
+    trains set supports_waveforms and implement play_frames.
+    """
+    name = "backend"
+    supports_waveforms = False
+
+    @property
+    def connected(self) -> bool:
+        return True
+
+    def set_servo_pulsewidth(self, pin: int, pulse_width: int) -> None:
+        raise NotImplementedError
+
+    def set_servo_pulsewidths(self, writes: list[tuple[int, int]]) -> list[str | None]:
+        """
+        Applies (pin, pulse_width) writes in order and returns an error message or None
+        per write. Raises BackendConnectionError if the connection is lost, in which
+        case none of the remaining writes was applied.
+        """
+        errors = []
+        for pin, pulse_width in writes:
+            try:
+                self.set_servo_pulsewidth(pin, pulse_width)
+                errors.append(None)
+            except BackendConnectionError:
+                raise
+            except ServoBackendError as e:
+                errors.append(str(e))
+        return errors
+
+    def check_connection(self) -> None:
+        """Cheap round trip that raises BackendConnectionError if the driver is gone; no-op by default."""
+
+    def reconnect(self) -> bool:
+        """Re-establishes a lost connection; returns whether the backend is connected now."""
+        return self.connected
+
+    def play_frames(self, segments: list[tuple[int, int, int]]) -> tuple[float, float]:
+        """
+        Plays (pin, pulse_width, frame_count) segments back to back as hardware-timed
+        servo frames of SERVO_FRAME_US each; the pin gets no pulses afterwards.
+        Blocks until playback is done and returns its monotonic (start, end) times.
+        """
+        raise NotImplementedError
+
+    def stop_frames(self) -> None:
+        """Aborts a play_frames call in progress (from another thread); no-op by default."""
+
+    def get_version(self) -> str:
+        return "unknown"
+
+    def get_hardware_revision(self) -> str:
+        return "unknown"
+
+
+class PigpioBackend(ServoBackend):
+    """Drives the servos through the pigpio daemon (pigpiod)."""
+    name = "pigpio"
+    supports_waveforms = True
+
+    def __init__(self):
+        import pigpio
+        self._pigpio = pigpio
+        self.pi = None
+        self._stop_requested = threading.Event()
+        self._connect(show_errors=True)
+        if not self.connected:
+            print("Please ensure pigpiod is running (e.g., sudo systemctl start pigpiod)")
+
+    @property
+    def connected(self) -> bool:
+        return self.pi is not None and bool(self.pi.connected)
+
+    def reconnect(self) -> bool:
+        return self._connect(show_errors=False) # pigpio's help text is printed once, at startup
+
+    def _connect(self, show_errors: bool) -> bool:
+        self._drop()
+        try:
+            pi = self._pigpio.pi(show_errors=show_errors)
+        except Exception as e:
+            print(f"Failed to connect to pigpio daemon: {e}")
+            return False
+        if pi.connected:
+            self.pi = pi
+        return self.connected
+
+    def _drop(self) -> None:
+        """Forgets a dead connection so connected turns False until reconnect()."""
+        pi, self.pi = self.pi, None
+        if pi is not None:
+            try:
+                pi.stop()
+            except Exception:
+                pass
+
+    def _lost(self, e: Exception) -> BackendConnectionError:
+        self._drop()
+        return BackendConnectionError(f"Connection to pigpiod lost: {type(e).__name__} {e}")
+
+    def set_servo_pulsewidth(self, pin: int, pulse_width: int) -> None:
+        if self.pi is None:
+            raise BackendConnectionError("Not connected to pigpiod.")
+        try:
+            self.pi.set_servo_pulsewidth(pin, pulse_width)
+        except self._pigpio.error as e:
+            raise ServoBackendError(str(e)) from e
+        except (OSError, struct.error) as e: # Socket closed by a restarting daemon
+            raise self._lost(e) from e
+
+    def set_servo_pulsewidths(self, writes: list[tuple[int, int]]) -> list[str | None]:
+        """
+        Pipelines the writes on the pigpio socket: all SERVO commands are sent in one
+        send and the replies read back together, so a batch costs one round trip
+        instead of one per write. This uses pigpio's socket protocol directly (16-byte
+        command and reply frames), under the library's own socket lock.
+        """
+        if self.pi is None:
+            raise BackendConnectionError("Not connected to pigpiod.")
+        cmd = getattr(self._pigpio, "_PI_CMD_SERVO", None)
+        sl = getattr(self.pi, "sl", None)
+        if cmd is None or sl is None or len(writes) == 1:
+            return super().set_servo_pulsewidths(writes)
+        expected = 16 * len(writes)
+        try:
+            with sl.l:
+                sl.s.sendall(b"".join(struct.pack("IIII", cmd, pin, pulse_width, 0) for pin, pulse_width in writes))
+                replies = b""
+                while len(replies) < expected:
+                    chunk = sl.s.recv(expected - len(replies))
+                    if not chunk:
+                        raise ConnectionResetError("pigpiod closed the connection")
+                    replies += chunk
+        except OSError as e:
+            raise self._lost(e) from e
+        results = [struct.unpack_from("12si", replies, 16 * i)[1] for i in range(len(writes))]
+        return [self._pigpio.error_text(res) if res < 0 else None for res in results]
+
+    def check_connection(self) -> None:
+        if self.pi is None:
+            raise BackendConnectionError("Not connected to pigpiod.")
+        try:
+            self.pi.get_current_tick()
+        except (OSError, struct.error) as e:
+            raise self._lost(e) from e
+
+    def play_frames(self, segments: list[tuple[int, int, int]]) -> tuple[float, float]:
+        """
+        Plays the segments as DMA waveforms: one single-frame waveform per distinct
+        (pin, pulse width), looped frame_count times in a wave chain. Sequences that
+        exceed pigpio's chain or waveform limits are split into blocks played back to back.
+        """
+        pigpio = self._pigpio
+        self._stop_requested.clear()
+        try:
+            for pin in {pin for pin, _, _ in segments}:
+                self.pi.set_servo_pulsewidth(pin, 0) # Servo PWM and waveforms must not drive the same pin
+                self.pi.set_mode(pin, pigpio.OUTPUT)
+
+            blocks = []
+            block, chain_len, keys = [], 0, set()
+            for pin, pulse_width, frames in segments:
+                entries = (frames + 0xFFFF - 1) // 0xFFFF # The loop count is 16-bit
+                new_keys = keys | {(pin, pulse_width)}
+                if block and (chain_len + 7 * entries > MAX_WAVE_CHAIN_BYTES or len(new_keys) > MAX_WAVES_PER_BLOCK):
+                    blocks.append(block)
+                    block, chain_len, new_keys = [], 0, {(pin, pulse_width)}
+                block.append((pin, pulse_width, frames))
+                chain_len += 7 * entries
+                keys = new_keys
+            if block:
+                blocks.append(block)
+
+            start = None
+            for block in blocks:
+                if self._stop_requested.is_set():
+                    break
+                waves = {}
+                try:
+                    chain = []
+                    for pin, pulse_width, frames in block:
+                        if (pin, pulse_width) not in waves:
+                            self.pi.wave_add_new()
+                            self.pi.wave_add_generic([
+                                pigpio.pulse(1 << pin, 0, pulse_width),
+                                pigpio.pulse(0, 1 << pin, SERVO_FRAME_US - pulse_width),
+                            ])
+                            waves[(pin, pulse_width)] = self.pi.wave_create()
+                        while frames > 0:
+                            count = min(frames, 0xFFFF)
+                            chain += [255, 0, waves[(pin, pulse_width)], 255, 1, count & 0xFF, count >> 8]
+                            frames -= count
+                    if start is None:
+                        start = time.monotonic()
+                    self.pi.wave_chain(chain)
+                    while self.pi.wave_tx_busy():
+                        time.sleep(0.001)
+                finally:
+                    for wave_id in waves.values():
+                        self.pi.wave_delete(wave_id)
+            end = time.monotonic()
+            return (start if start is not None else end), end
+        except pigpio.error as e:
+            raise ServoBackendError(str(e)) from e
+        except (OSError, struct.error) as e:
+            raise self._lost(e) from e
+
+    def stop_frames(self) -> None:
+        self._stop_requested.set()
+        try:
+            self.pi.wave_tx_stop()
+        except (AttributeError, OSError, struct.error, self._pigpio.error): # Also when the connection is gone
+            pass
+
+    def get_version(self) -> str:
+        return str(self.pi.get_pigpio_version())
+
+    def get_hardware_revision(self) -> str:
+        return str(self.pi.get_hardware_revision())
+
+
+class SimulatedBackend(ServoBackend):
+    """
+    In-process stand-in for pigpio, for benchmarks and development without a Pi.
+    Every pulse-width change is recorded as (monotonic timestamp, pin, pulse width);
+    the timestamp is taken after the simulated call latency, i.e. when the change
+    would reach the pin.
+    """
+    name = "simulated"
+    supports_waveforms = True
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.events: list[tuple[float, int, int]] = []
+        self._lock = threading.Lock()
+        self._stop_requested = threading.Event()
+        self._connected = True
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def disconnect(self) -> None:
+        """Simulates a pigpiod restart: calls fail until reconnect()."""
+        self._connected = False
+
+    def reconnect(self) -> bool:
+        self._connected = True
+        return True
+
+    def check_connection(self) -> None:
+        if not self._connected:
+            raise BackendConnectionError("Simulated daemon is down.")
+
+    def set_servo_pulsewidth(self, pin: int, pulse_width: int) -> None:
+        self.set_servo_pulsewidths([(pin, pulse_width)])
+
+    def set_servo_pulsewidths(self, writes: list[tuple[int, int]]) -> list[str | None]:
+        """One simulated round trip per batch, like a pipelined pigpio connection."""
+        self.check_connection()
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0) # Blocking, like a pigpio socket round trip
+        with self._lock:
+            now = time.monotonic()
+            self.events.extend((now, pin, pulse_width) for pin, pulse_width in writes)
+        return [None] * len(writes)
+
+    def play_frames(self, segments: list[tuple[int, int, int]]) -> tuple[float, float]:
+        """Emulates ideal hardware playback: events are stamped at their exact scheduled times."""
+        self._stop_requested.clear()
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0) # Building and sending the chain
+        start = time.monotonic()
+        offset = 0.0
+        with self._lock:
+            for pin, pulse_width, frames in segments:
+                self.events.append((start + offset, pin, pulse_width))
+                offset += frames * SERVO_FRAME_US / 1e6
+                self.events.append((start + offset, pin, 0))
+        self._stop_requested.wait(offset)
+        return start, time.monotonic()
+
+    def stop_frames(self) -> None:
+        self._stop_requested.set()
+
+    def take_events(self) -> list[tuple[float, int, int]]:
+        """Returns and clears the recorded pulse-width changes."""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def get_version(self) -> str:
+        return f"simulated (latency {self.latency_ms} ms)"
+
+
+class _Batch:
+    __slots__ = ("writes", "future")
+
+    def __init__(self, writes: list[tuple[int, int]], future: asyncio.Future):
+        self.writes = writes
+        self.future = future
+
+
+class ActuationWorker:
+    """
+    Runs the backend's servo writes on a dedicated thread so blocking pigpio round
+    trips never stall the event loop. Writes submitted during one event-loop
+    iteration are handed over as one batch; batches that queue up while the thread
+    is busy are merged, later writes to a pin replacing earlier ones, and each
+    merged batch goes to the backend in a single set_servo_pulsewidths call. A stop
+    (0) never replaces a move, so a short move followed by a stop still reaches the
+    servo: both are sent, in order. Replaced writes resolve to None (see write).
+
+    A lost connection fails the writes in flight and puts the worker into reconnect
+    mode: it retries with exponential backoff (writes fail fast meanwhile). When
+    idle, it checks the connection every health_check_s.
+    """
+    def __init__(self, backend: ServoBackend, on_batch=None, health_check_s: float = 2.0,
+                 initial_backoff_s: float = 0.5, max_backoff_s: float = 30.0):
+        self.backend = backend
+        self.on_batch = on_batch # Called on the worker thread with (writes, elapsed_ms) after each batch
+        self.health_check_s = health_check_s
+        self.initial_backoff_s = initial_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.stats = {"batches": 0, "writes": 0, "coalesced": 0, "max_batch": 0,
+                      "connection_losses": 0, "reconnects": 0, "reconnect_failures": 0, "last_error": None}
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._pending: list[_Batch] = [] # Submitted during the current event-loop iteration
+        self._backoff = initial_backoff_s
+        self._next_attempt = None if backend.connected else time.monotonic() # Monotonic time of the next reconnect
+        self._thread = threading.Thread(target=self._run, name="actuation", daemon=True)
+        self._thread.start()
+
+    @property
+    def reconnecting(self) -> bool:
+        return self._next_attempt is not None
+
+    async def write(self, writes: list[tuple[int, int]]) -> float | None:
+        """
+        Applies the writes on the worker thread; returns the monotonic time the batch
+        containing them was applied, or None if every one of them was replaced by a
+        later write to the same pin and never reached the backend. Raises
+        ServoBackendError (BackendConnectionError while the driver is down).
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._pending:
+            loop.call_soon(self._flush)
+        self._pending.append(_Batch(writes, future))
+        return await future
+
+    def _flush(self) -> None:
+        pending, self._pending = self._pending, []
+        self._queue.put(pending)
+
+    def stop(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            timeout = self.health_check_s
+            if self._next_attempt is not None:
+                timeout = max(0.0, min(timeout, self._next_attempt - time.monotonic()))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                if self._next_attempt is not None:
+                    self._try_reconnect()
+                else:
+                    self._check()
+                continue
+            if item is None:
+                return
+            batches = list(item)
+            while True: # Merge whatever else is waiting
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batches.extend(item)
+            self._apply(batches)
+
+    def _apply(self, batches: list[_Batch]) -> None:
+        entries: list[tuple[int, int, int] | None] = [] # (pin, pulse width, batch index); None once replaced
+        latest: dict[int, int] = {} # pin -> index in entries of its last write
+        for index, batch in enumerate(batches):
+            for pin, pulse_width in batch.writes:
+                previous = latest.get(pin)
+                if previous is not None and (pulse_width != 0 or entries[previous][1] == 0):
+                    entries[previous] = None
+                latest[pin] = len(entries)
+                entries.append((pin, pulse_width, index))
+        kept = [entry for entry in entries if entry is not None]
+        writes = [(pin, pulse_width) for pin, pulse_width, _ in kept]
+        total = sum(len(batch.writes) for batch in batches)
+        if self._next_attempt is not None:
+            error = BackendConnectionError(f"Not connected to the {self.backend.name} driver (reconnecting).")
+            for batch in batches:
+                self._resolve(batch.future, error=error)
+            return
+        t0 = time.perf_counter()
+        try:
+            results = self.backend.set_servo_pulsewidths(writes)
+        except BackendConnectionError as e:
+            self._connection_lost(e)
+            for batch in batches:
+                self._resolve(batch.future, error=e)
+            return
+        except Exception as e: # Keep the worker alive whatever the backend raises
+            for batch in batches:
+                self._resolve(batch.future, error=ServoBackendError(f"{type(e).__name__}: {e}"))
+            return
+        applied_at = time.monotonic()
+        self.stats["batches"] += 1
+        self.stats["writes"] += len(writes)
+        self.stats["coalesced"] += total - len(writes)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(writes))
+        if self.on_batch is not None:
+            self.on_batch(writes, (time.perf_counter() - t0) * 1000.0)
+        applied: set[int] = set() # Batches with at least one write sent
+        failed: dict[int, list[str]] = {}
+        for (pin, _, index), error in zip(kept, results):
+            applied.add(index)
+            if error:
+                failed.setdefault(index, []).append(f"pin {pin}: {error}")
+        for index, batch in enumerate(batches):
+            if index in failed:
+                self._resolve(batch.future, error=ServoBackendError("; ".join(failed[index])))
+            else:
+                self._resolve(batch.future, result=applied_at if index in applied else None)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result=None, error: Exception | None = None) -> None:
+        def settle():
+            if future.done(): # The caller was cancelled meanwhile
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        try:
+            future.get_loop().call_soon_threadsafe(settle)
+        except RuntimeError: # Event loop already closed
+            pass
+
+    def _check(self) -> None:
+        try:
+            self.backend.check_connection()
+        except BackendConnectionError as e:
+            self._connection_lost(e)
+        except Exception:
+            pass
+
+    def _connection_lost(self, e: Exception) -> None:
+        self.stats["connection_losses"] += 1
+        self.stats["last_error"] = str(e)
+        self._backoff = self.initial_backoff_s
+        self._next_attempt = time.monotonic()
+        print(f"Servo backend connection lost ({e}); reconnecting.")
+
+    def _try_reconnect(self) -> None:
+        try:
+            connected = self.backend.reconnect()
+        except Exception as e:
+            connected = False
+            self.stats["last_error"] = str(e)
+        if connected:
+            self.stats["reconnects"] += 1
+            self._next_attempt = None
+            print(f"Reconnected to the {self.backend.name} backend.")
+            return
+        self.stats["reconnect_failures"] += 1
+        self._next_attempt = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_backoff_s)
+
+    def snapshot(self) -> dict:
+        """Counters for the health output: batches, writes, merged writes, largest batch and reconnects."""
+        stats = dict(self.stats)
+        stats["mean_batch"] = round(stats["writes"] / stats["batches"], 2) if stats["batches"] else None
+        stats["reconnecting"] = self.reconnecting
+        return stats
+
+
+def create_backend(name: str | None = None) -> ServoBackend:
+    """
+    Creates the servo backend selected by name, or by the SERVO_BACKEND environment
+    variable ("pigpio" by default, or "sim"). The simulated backend's per-call
+    latency is read from SIM_LATENCY_MS.
+    """
+    name = (name or os.environ.get("SERVO_BACKEND", "pigpio")).lower()
+    if name == "pigpio":
+        return PigpioBackend()
+    if name in ("sim", "simulated"):
+        return SimulatedBackend(latency_ms=float(os.environ.get("SIM_LATENCY_MS", "0")))
+    raise ValueError(f"Unknown servo backend '{name}'. Use 'pigpio' or 'sim'.")
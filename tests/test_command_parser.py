@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from command_parser import parse_command
+
+
+@pytest.mark.parametrize("text", [
+    "servo 30",       # Not servo 3 to 0
+    "servo30",
+    "pin 1745",       # Not pin 17 to 45
+    "pin1730",
+    "servo_3 45 then servo 40",
+    "servo 345 for 1s",
+])
+def test_id_and_angle_are_not_split_from_one_number(text):
+    assert parse_command(text) is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("servo_3 to 90", [{"pin": 23, "angle": 90}]),
+    ("servo 3 90", [{"pin": 23, "angle": 90}]),
+    ("servo#3=90", [{"pin": 23, "angle": 90}]),
+    ("servo_3->90", [{"pin": 23, "angle": 90}]),
+    ("pin 17 at 45", [{"pin": 17, "angle": 45}]),
+    ("pin 24 120 degrees for 1s", [{"pin": 24, "angle": 120, "duration_ms": 1000}]),
+])
+def test_explicit_separators(text, expected):
+    assert parse_command(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "servo 3 to 902 times",         # Not 90 twice
+    "pin 24 to 1205 times",         # Not 120 five times
+    "servo_3 to 9012 times",        # Not 901 twice
+    "servo 3 to 45 for 1s2 times",
+    "servo 3 to 45 for 1502 times",
+    "servo 3 to 200",               # Outside 0-180
+])
+def test_angle_duration_and_repeat_are_not_split_from_one_number(text):
+    assert parse_command(text) is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("servo 3 to 90 2 times", [{"pin": 23, "angle": 90}] * 2),
+    ("servo 3 to 90 x2", [{"pin": 23, "angle": 90}] * 2),
+    ("servo 3 to 45 for 1s 2 times", [{"pin": 23, "angle": 45, "duration_ms": 1000}] * 2),
+    ("servo_5 to 180", [{"pin": 25, "angle": 180}]),
+])
+def test_repeat_after_whitespace(text, expected):
+    assert parse_command(text) == expected
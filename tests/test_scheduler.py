@@ -0,0 +1,42 @@
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("SERVO_BACKEND", "sim")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+import server
+
+
+def _tool(name):
+    tool = getattr(server, name)
+    return getattr(tool, "fn", tool)
+
+
+async def _wait_finished(job_id, timeout=5.0):
+    await asyncio.wait_for(server.scheduler.jobs[job_id].finished.wait(), timeout)
+    return await _tool("get_job_status")(job_id)
+
+
+def test_preempt_job_that_has_not_started():
+    async def main():
+        submit = _tool("submit_motion")
+        first, second = await asyncio.gather(
+            submit([{"pin": 23, "angle": 90, "duration_ms": 50}]),
+            submit([{"pin": 23, "angle": 45, "duration_ms": 50}], policy="preempt"))
+        first = await _wait_finished(first["job_id"])
+        second = await _wait_finished(second["job_id"])
+        assert first["state"] == "cancelled"
+        assert second["state"] == "done"
+        assert 23 not in server.scheduler._owners
+    asyncio.run(main())
+
+
+def test_cancel_job_that_has_not_started():
+    async def main():
+        job = await _tool("submit_motion")([{"pin": 24, "angle": 90, "duration_ms": 50}])
+        cancelled = await asyncio.wait_for(_tool("cancel_job")(job["job_id"]), 5.0)
+        assert cancelled["state"] == "cancelled"
+        follow = await _tool("submit_motion")([{"pin": 24, "angle": 10, "duration_ms": 10}])
+        assert (await _wait_finished(follow["job_id"]))["state"] == "done"
+    asyncio.run(main())
@@ -0,0 +1,25 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("SERVO_BACKEND", "sim")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+import server
+
+execute_trajectory = getattr(server.execute_trajectory, "fn", server.execute_trajectory)
+
+
+@pytest.mark.parametrize("keyframes, limits", [
+    ([{"pin": 23, "angle": 90, "time_ms": 1e9}], {}),
+    ([{"pin": 23, "angle": True, "time_ms": 0}], {}),
+    ([{"pin": 23, "angle": 90, "time_ms": float("inf")}], {}),
+    ([{"pin": 23, "angle": 0, "time_ms": 0}, {"pin": 23, "angle": 90, "time_ms": 100}], {"23": None}),
+    ([{"pin": 23, "angle": 0, "time_ms": 0}, {"pin": 23, "angle": 90, "time_ms": 100}], {"23": float("nan")}),
+    ([{"pin": 23, "angle": 0, "time_ms": 0}, {"pin": 23, "angle": 90, "time_ms": 100}], {"23": 1e-6}), # Stretched too long
+])
+def test_trajectory_rejects_unbounded_input(keyframes, limits):
+    result = asyncio.run(execute_trajectory(keyframes, max_velocity=limits))
+    assert result["status"] == "error"
@@ -0,0 +1,32 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("SERVO_BACKEND", "sim")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+import server
+
+execute_servo_commands = getattr(server.execute_servo_commands, "fn", server.execute_servo_commands)
+
+
+COMMAND_FIELDS = [("duration_ms", -100), ("duration_ms", "500"), ("duration_ms", None), ("duration_ms", True),
+                  ("duration_ms", float("nan")), ("angle", True)]
+TIMELINE_FIELDS = [("start_ms", True), ("start_ms", float("inf")), ("group", False)]
+
+
+@pytest.mark.parametrize("mode, field, value", [("sequential", *case) for case in COMMAND_FIELDS] +
+                                               [("timeline", *case) for case in COMMAND_FIELDS + TIMELINE_FIELDS])
+def test_invalid_fields_are_rejected(mode, field, value):
+    command = {"pin": 23, "angle": 90, "duration_ms": 10, field: value}
+    results = asyncio.run(execute_servo_commands([command], mode=mode))
+    assert results[0]["status"] == "error"
+
+
+@pytest.mark.parametrize("field, value", TIMELINE_FIELDS)
+def test_macro_rejects_invalid_timeline_fields(field, value):
+    macro, statuses = server._Macro.compile("m", [{"pin": 23, "angle": 90, field: value}], "timeline", "")
+    assert macro is None
+    assert statuses[0]["status"] == "error"